@@ -0,0 +1,119 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Type, TypeVar
+
+from microsoft_agents.hosting.core import Storage, StoreItem
+
+from tools.concurrency import run_blocking
+
+# Bot state shared between worker processes.
+#
+# With several workers behind /api/messages any worker can receive any
+# conversation's next message, so turn state and agent threads can't live in
+# process memory. SqliteStorage is a drop-in for MemoryStorage backed by a
+# SQLite database in WAL mode, which lets readers and a writer in different
+# processes work concurrently. conversation_lock serializes the turns of one
+# conversation across processes with an advisory file lock, so two workers
+# never run the same conversation's thread at the same time.
+
+StoreItemT = TypeVar("StoreItemT", bound=StoreItem)
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+BOT_STATE_PATH = os.getenv("BOT_STATE_PATH", str(DATA_DIR / "bot_state.sqlite"))
+BOT_LOCK_DIR = os.getenv("BOT_LOCK_DIR", str(DATA_DIR / "conversation_locks"))
+
+
+class SqliteStorage(Storage):
+    """ Turn state storage in a SQLite database shared by all worker processes."""
+
+    def __init__(self, path: str = BOT_STATE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across the blocking pool's threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bot_state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    async def read(self, keys: List[str], *, target_cls: Type[StoreItemT] = None, **kwargs) -> Dict[str, StoreItemT]:
+        if not keys:
+            raise ValueError("Storage.read(): Keys are required when reading.")
+        rows = await run_blocking(self._read, keys)
+        return {key: target_cls.from_json_to_store_item(json.loads(value)) for key, value in rows}
+
+    async def write(self, changes: Dict[str, StoreItem]) -> None:
+        if not changes:
+            raise ValueError("Storage.write(): Changes are required when writing.")
+        items = [(key, json.dumps(item.store_item_to_json()), time.time()) for key, item in changes.items()]
+        await run_blocking(self._write, items)
+
+    async def delete(self, keys: List[str]) -> None:
+        if not keys:
+            raise ValueError("Storage.delete(): Keys are required when deleting.")
+        await run_blocking(self._delete, keys)
+
+    def _read(self, keys: List[str]):
+        placeholders = ",".join("?" for _ in keys)
+        return self._connection().execute(f"SELECT key, value FROM bot_state WHERE key IN ({placeholders})", keys).fetchall()
+
+    def _write(self, items) -> None:
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT INTO bot_state (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                items,
+            )
+
+    def _delete(self, keys: List[str]) -> None:
+        with self._connection() as connection:
+            connection.executemany("DELETE FROM bot_state WHERE key = ?", [(key,) for key in keys])
+
+
+@contextlib.asynccontextmanager
+async def conversation_lock(key: str, lock_dir: str = BOT_LOCK_DIR, poll_interval: float = 0.05) -> AsyncIterator[None]:
+    """ Hold an exclusive, cross-process lock on one conversation.
+
+    The lock is polled with a non-blocking flock so waiting doesn't tie up a
+    thread, and the OS releases it if the worker holding it dies.
+    """
+    import fcntl
+
+    Path(lock_dir).mkdir(parents=True, exist_ok=True)
+    path = Path(lock_dir) / f"{hashlib.sha256(key.encode()).hexdigest()}.lock"
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        delay = poll_interval
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+@contextlib.asynccontextmanager
+async def no_lock(key: str) -> AsyncIterator[None]:
+    yield
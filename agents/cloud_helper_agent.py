@@ -1,44 +1,83 @@
 import os 
 import sys
+import threading
 from pathlib import Path
 
 # Add project root to sys.path so 'mcp' module can be imported
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from agent_framework import ChatAgent
-from agent_framework.azure import AzureOpenAIAssistantsClient
-from azure.identity import DefaultAzureCredential
 
 from dotenv import load_dotenv
 
-from tools.get_cloud_resources import list_resource_groups, get_resources_in_resource_group
-from tools.get_virtual_machine_context import get_virtual_machine_profile, get_virtual_machine_logs
-from mcp_servers.ms_learn_mcp import get_mslearn_mcp_tool
-
-credential = DefaultAzureCredential()
+from tools.get_cloud_resources import list_resource_groups, list_resource_groups_across_subscriptions, get_resources_in_resource_group, find_resources, summarize_resources
+from tools.get_virtual_machine_context import get_virtual_machine_profile, get_virtual_machine_profiles, get_virtual_machines_status, get_virtual_machine_logs
+from tools.get_virtual_machine_metrics import get_virtual_machine_metric_aggregates, find_virtual_machine_threshold_breaches
+from tools.credentials import openai_token_provider
 
 load_dotenv()
 
-# Get the MCP tools
-mslearn_tool = get_mslearn_mcp_tool()
-
-cloud_helper_agent = ChatAgent(
-    name="Cloud Helper Agent", 
-    description="An agent which helps employees understand their cloud infrastructure and resources", 
-    instructions= "You're an agent which helps employees from the Multi Client Azure Team (MCAT-team) help understand their cloud environment. When listing resource groups, only show the names in a simple list format unless the user specifically asks for additional details like location or ID. Format resource group names as a simple bulleted list. You can also get VM performance metrics including IOPS data and search Microsoft Learn documentation to help answer questions about Azure services and best practices. If you don't have the capabilities to perform certain requested actions, tell the user that you don't have the capabilities and to contact Dylan to add them.",
-    temperature=0.2,
-    tool_choice="auto",
-    tools=[list_resource_groups, 
-           get_resources_in_resource_group,
-           get_virtual_machine_profile,
-           get_virtual_machine_logs,
-           mslearn_tool,
-           ],
+# The agent is built on first use rather than at import: the chat client pulls
+# in the OpenAI SDK, which is most of a cold start. Entry points can import
+# this module cheaply and build the agent in the background while the server
+# is already accepting requests. `from agents.cloud_helper_agent import
+# cloud_helper_agent` keeps working and builds it on the spot.
+
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def get_cloud_helper_agent() -> ChatAgent:
+    """ Return the Cloud Helper agent, building it on first use."""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = _create_cloud_helper_agent()
+    return _agent
+
+
+def _create_cloud_helper_agent() -> ChatAgent:
+    from agent_framework.azure import AzureOpenAIAssistantsClient
+    from mcp_servers.ms_learn_mcp import get_mslearn_tools
+
+    # Without an API key, authenticate per request from the shared token cache
+    # instead of fetching a single token at import time
+    api_key = os.environ.get("AZURE_OPENAI_API_KEY")
+
+    # Get the Microsoft Learn tools (cached proxy or the remote MCP server)
+    mslearn_tools = get_mslearn_tools()
+
+    return ChatAgent(
+        name="Cloud Helper Agent", 
+        description="An agent which helps employees understand their cloud infrastructure and resources", 
+        instructions= "You're an agent which helps employees from the Multi Client Azure Team (MCAT-team) help understand their cloud environment. When listing resource groups, only show the names in a simple list format unless the user specifically asks for additional details like location or ID. Format resource group names as a simple bulleted list. You can also get VM performance metrics including IOPS data and search Microsoft Learn documentation to help answer questions about Azure services and best practices. If you don't have the capabilities to perform certain requested actions, tell the user that you don't have the capabilities and to contact Dylan to add them.",
+        temperature=0.2,
+        tool_choice="auto",
+        tools=[list_resource_groups, 
+               list_resource_groups_across_subscriptions,
+               get_resources_in_resource_group,
+               find_resources,
+               summarize_resources,
+               get_virtual_machine_profile,
+               get_virtual_machine_profiles,
+               get_virtual_machines_status,
+               get_virtual_machine_logs,
+               get_virtual_machine_metric_aggregates,
+               find_virtual_machine_threshold_breaches,
+               *mslearn_tools,
+               ],
  
-    chat_client=AzureOpenAIAssistantsClient(
-       credential=credential, 
-       api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
-       deployment_name=os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
-       endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
+        chat_client=AzureOpenAIAssistantsClient(
+           api_key=api_key,
+           ad_token_provider=None if api_key else openai_token_provider(),
+           deployment_name=os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
+           endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
+            )
         )
-    )
+
+
+def __getattr__(name: str):
+    if name == "cloud_helper_agent":
+        return get_cloud_helper_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
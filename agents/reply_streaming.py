@@ -0,0 +1,180 @@
+import os
+import time
+from typing import AsyncIterable, Optional, Set
+
+from agent_framework import AgentRunResponseUpdate, FunctionCallContent
+from microsoft_agents.activity import Activity, ActivityTypes
+from microsoft_agents.hosting.core import TurnContext
+
+# Streams an agent run to a Teams conversation while it is still running.
+#
+# A typing indicator goes out as soon as the turn starts, every tool call the
+# agent makes is announced with a short progress notice, and the answer text
+# is sent as it is generated instead of after the whole run.
+#
+# Modes, picked with TEAMS_STREAMING_MODE:
+#   native  - Teams streaming messages (TurnContext.streaming_response): the
+#             reply is updated in place and progress shows as informative text.
+#             Falls back to chunked on channels/SDK versions without it.
+#   chunked - the answer is sent as a few separate messages, cut at paragraph
+#             boundaries once enough text or time has built up.
+#   off     - no streaming, the full reply is sent after the run.
+
+TEAMS_STREAMING_MODE = os.getenv("TEAMS_STREAMING_MODE", "native").lower()
+STREAM_CHUNK_CHARS = int(os.getenv("TEAMS_STREAM_CHUNK_CHARS", "400"))
+STREAM_FLUSH_SECONDS = float(os.getenv("TEAMS_STREAM_FLUSH_SECONDS", "2.0"))
+
+# Friendly progress notices for the agent's tools, keyed by the ai_function name
+# the model calls them by (not the Python name), anything else gets a generic one
+TOOL_PROGRESS = {
+    "list_resource_groups": "Listing your resource groups...",
+    "list_resource_groups_across_subscriptions": "Listing resource groups across your subscriptions...",
+    "get_resources_in_resource_group": "Looking up the resources in the resource group...",
+    "find_resources": "Searching your inventory...",
+    "summarize_resources": "Counting your resources...",
+    "get_virtual_machine_information": "Fetching the virtual machine's profile...",
+    "get_virtual_machine_profiles": "Fetching the virtual machine profiles...",
+    "get_virtual_machines_status": "Checking which virtual machines are running...",
+    "get_virtual_machine_logs": "Reading the virtual machine's metrics...",
+    "get_virtual_machine_metric_aggregates": "Aggregating metrics across the fleet...",
+    "find_virtual_machine_threshold_breaches": "Checking the fleet for threshold breaches...",
+    "microsoft_docs_search": "Searching Microsoft Learn...",
+    "microsoft_docs_fetch": "Reading the Microsoft Learn article...",
+    "microsoft_code_sample_search": "Searching Microsoft Learn code samples...",
+}
+
+
+def tool_progress_text(tool_name: str) -> str:
+    return TOOL_PROGRESS.get(tool_name, f"Running {tool_name.replace('_', ' ')}...")
+
+
+def _split_point(text: str, min_chars: int) -> int:
+    """ Index to cut buffered text at: the last paragraph or line break, else the last sentence end."""
+    for separator in ("\n\n", "\n", ". "):
+        index = text.rfind(separator)
+        if index >= min_chars // 2:
+            return index + len(separator)
+    return 0
+
+
+class TeamsReplyStreamer:
+    """ Sends one agent run's updates to a Teams conversation as they arrive."""
+
+    def __init__(
+        self,
+        context: TurnContext,
+        mode: str = TEAMS_STREAMING_MODE,
+        chunk_chars: int = STREAM_CHUNK_CHARS,
+        flush_seconds: float = STREAM_FLUSH_SECONDS,
+    ):
+        if mode not in ("native", "chunked", "off"):
+            raise ValueError(f"Unknown streaming mode '{mode}'")
+        self.context = context
+        self.chunk_chars = chunk_chars
+        self.flush_seconds = flush_seconds
+        self.streaming_response = None
+        if mode == "native":
+            streaming_response = getattr(context, "streaming_response", None)
+            if streaming_response is not None and getattr(streaming_response, "is_streaming_channel", False):
+                self.streaming_response = streaming_response
+            else:
+                mode = "chunked"
+        self.mode = mode
+        self.text = ""
+        self.sent_messages = 0
+        self._buffer = ""
+        self._buffer_started: Optional[float] = None
+        self._announced_calls: Set[str] = set()
+        self._started = time.monotonic()
+        # Seconds from the start of the turn until the first answer text arrived
+        self.first_text_seconds: Optional[float] = None
+
+    async def start(self) -> None:
+        """ Let the user know right away that the agent is working."""
+        self._started = time.monotonic()
+        if self.streaming_response is not None:
+            self.streaming_response.queue_informative_update("Working on it...")
+        else:
+            await self._send_typing()
+
+    async def stream(self, updates: AsyncIterable[AgentRunResponseUpdate]) -> str:
+        """ Relay the updates of one run and return the complete reply text."""
+        await self.start()
+        try:
+            async for update in updates:
+                await self.on_update(update)
+        finally:
+            await self.finish()
+        return self.text
+
+    async def on_update(self, update: AgentRunResponseUpdate) -> None:
+        for content in update.contents or []:
+            if isinstance(content, FunctionCallContent) and content.name:
+                await self._announce_tool(content)
+
+        text = update.text
+        if not text:
+            return
+        if self.first_text_seconds is None:
+            self.first_text_seconds = time.monotonic() - self._started
+        self.text += text
+        if self.mode == "off":
+            return
+        if self.streaming_response is not None:
+            self.streaming_response.queue_text_chunk(text)
+            return
+
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+        self._buffer += text
+        waited = time.monotonic() - self._buffer_started
+        if len(self._buffer) >= self.chunk_chars or waited >= self.flush_seconds:
+            await self._flush(final=False)
+
+    async def finish(self) -> None:
+        """ Send what is still buffered (or the whole reply when not streaming)."""
+        if self.streaming_response is not None:
+            await self.streaming_response.end_stream()
+            return
+        if self.mode == "off":
+            if self.text:
+                await self.context.send_activity(self.text)
+                self.sent_messages += 1
+            return
+        await self._flush(final=True)
+
+    async def _announce_tool(self, call: FunctionCallContent) -> None:
+        # Streamed function calls arrive in several parts, only announce each call once
+        call_id = call.call_id or call.name
+        if call_id in self._announced_calls:
+            return
+        self._announced_calls.add(call_id)
+        if self.mode == "off":
+            return
+        notice = tool_progress_text(call.name)
+        if self.streaming_response is not None:
+            self.streaming_response.queue_informative_update(notice)
+            return
+        # Keep the answer in order: text generated before the tool call goes out first
+        await self._flush(final=True)
+        await self.context.send_activity(f"_{notice}_")
+        await self._send_typing()
+
+    async def _flush(self, final: bool) -> None:
+        if not self._buffer.strip():
+            return
+        cut = len(self._buffer) if final else _split_point(self._buffer, self.chunk_chars)
+        if cut == 0:
+            # No clean place to cut yet, wait for more text unless the buffer got large
+            if len(self._buffer) < self.chunk_chars * 2:
+                return
+            cut = len(self._buffer)
+        chunk, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        self._buffer_started = time.monotonic() if self._buffer else None
+        await self.context.send_activity(chunk.strip())
+        self.sent_messages += 1
+        if not final:
+            await self._send_typing()
+
+    async def _send_typing(self) -> None:
+        await self.context.send_activity(Activity(type=ActivityTypes.typing))
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agent_framework import AgentThread
+
+from tools.concurrency import run_blocking
+
+# Bounded store for per-conversation agent threads.
+#
+# Threads live in memory in least-recently-used order. A thread is evicted
+# when it has been idle longer than the TTL, or when the store holds too many
+# threads or too many bytes of serialized state. Evicted threads are
+# serialized and spilled to a backend (SQLite or one JSON file per
+# conversation) and rehydrated on the conversation's next message, so a
+# long-running bot keeps a flat memory profile without forgetting anyone.
+#
+# In shared mode (several worker processes) the backend is the source of
+# truth: every turn loads the thread from it and writes it back, because
+# another worker may have advanced the conversation since.
+
+THREAD_STORE_MAX_THREADS = int(os.getenv("THREAD_STORE_MAX_THREADS", "500"))
+THREAD_STORE_IDLE_TTL_SECONDS = int(os.getenv("THREAD_STORE_IDLE_TTL_SECONDS", str(60 * 60)))
+THREAD_STORE_MEMORY_BUDGET_MB = float(os.getenv("THREAD_STORE_MEMORY_BUDGET_MB", "64"))
+THREAD_STORE_BACKEND = os.getenv("THREAD_STORE_BACKEND", "sqlite")
+THREAD_STORE_PATH = os.getenv("THREAD_STORE_PATH")
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+
+
+class SqliteThreadBackend:
+    """ Serialized threads in a SQLite table, one row per conversation."""
+
+    def __init__(self, path: str = str(DATA_DIR / "agent_threads.sqlite")):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across the blocking pool's threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS agent_threads (key TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def load(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT state FROM agent_threads WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, key: str, state: str) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO agent_threads (key, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (key, state, time.time()),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM agent_threads WHERE key = ?", (key,))
+
+
+class FileThreadBackend:
+    """ Serialized threads as one JSON file per conversation."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def load(self, key: str) -> Optional[str]:
+        try:
+            return self._path(key).read_text()
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, state: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(state)
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+
+class _Entry:
+    def __init__(self, thread: AgentThread):
+        self.thread = thread
+        self.state: Optional[str] = None
+        self.size = 0
+        self.last_used = time.monotonic()
+
+
+class ThreadStore:
+    def __init__(
+        self,
+        agent,
+        backend=None,
+        max_threads: int = THREAD_STORE_MAX_THREADS,
+        idle_ttl_seconds: float = THREAD_STORE_IDLE_TTL_SECONDS,
+        memory_budget_bytes: int = int(THREAD_STORE_MEMORY_BUDGET_MB * 1024 * 1024),
+        shared: bool = False,
+    ):
+        if shared and backend is None:
+            raise ValueError("A shared thread store needs a backend")
+        self.agent = agent
+        self.backend = backend
+        self.shared = shared
+        self.max_threads = max_threads
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.stats = {"hits": 0, "rehydrated": 0, "created": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    async def get(self, key: str) -> AgentThread:
+        """ Return the conversation's thread from memory, the backend, or a new one."""
+        await self.evict_idle()
+
+        entry = None if self.shared else self._entries.get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+            return entry.thread
+
+        thread = None
+        if self.backend is not None:
+            state = await run_blocking(self.backend.load, key)
+            if state is not None:
+                thread = await self.agent.deserialize_thread(json.loads(state))
+                self.stats["rehydrated"] += 1
+        if thread is None:
+            thread = self.agent.get_new_thread()
+            self.stats["created"] += 1
+
+        if not self.shared:
+            self._entries[key] = _Entry(thread)
+        return thread
+
+    async def put(self, key: str, thread: AgentThread) -> None:
+        """ Record a thread after a turn, re-measure it and enforce the limits."""
+        if self.shared:
+            await run_blocking(self.backend.save, key, json.dumps(await thread.serialize()))
+            return
+
+        entry = self._entries.get(key)
+        if entry is None or entry.thread is not thread:
+            entry = self._entries[key] = _Entry(thread)
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(key)
+
+        state = json.dumps(await thread.serialize())
+        self._bytes += len(state) - entry.size
+        entry.state = state
+        entry.size = len(state)
+
+        await self._enforce_limits(keep=key)
+
+    async def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        if self.backend is not None:
+            await run_blocking(self.backend.delete, key)
+
+    async def evict_idle(self) -> None:
+        """ Spill every thread that has been idle longer than the TTL."""
+        deadline = time.monotonic() - self.idle_ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_used > deadline:
+                break
+            await self._evict(key)
+
+    async def close(self) -> None:
+        """ Spill all threads, e.g. on shutdown."""
+        while self._entries:
+            await self._evict(next(iter(self._entries)))
+
+    async def _enforce_limits(self, keep: str) -> None:
+        while len(self._entries) > 1 and (len(self._entries) > self.max_threads or self._bytes > self.memory_budget_bytes):
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            await self._evict(key)
+
+    async def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self.stats["evicted"] += 1
+        if self.backend is None:
+            return
+        state = entry.state if entry.state is not None else json.dumps(await entry.thread.serialize())
+        try:
+            await run_blocking(self.backend.save, key, state)
+        except Exception as e:
+            print(f"couldn't spill thread {key}: {e}")
+
+
+def create_backend(kind: str = THREAD_STORE_BACKEND, path: Optional[str] = THREAD_STORE_PATH):
+    """ Build the spill backend named by THREAD_STORE_BACKEND (sqlite, file or memory)."""
+    if kind == "sqlite":
+        return SqliteThreadBackend(path or str(DATA_DIR / "agent_threads.sqlite"))
+    if kind == "file":
+        return FileThreadBackend(path or str(DATA_DIR / "agent_threads"))
+    if kind == "memory":
+        return None
+    raise ValueError(f"Unknown thread store backend '{kind}'")
+
+
+def create_thread_store(agent, shared: bool = False) -> ThreadStore:
+    if shared and THREAD_STORE_BACKEND == "memory":
+        raise ValueError("THREAD_STORE_BACKEND=memory can't be shared between workers")
+    return ThreadStore(agent, backend=create_backend(), shared=shared)
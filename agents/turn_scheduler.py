@@ -0,0 +1,153 @@
+import asyncio
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+# Per-conversation turn scheduling for the agent.
+#
+# Turns of one conversation run strictly one after another, so concurrent
+# messages can't interleave on the same AgentThread. Messages that arrive
+# while a turn is in flight can be coalesced into a single follow-up turn
+# instead of one LLM run each. Across conversations a FairLimiter caps the
+# number of concurrent runs and hands free slots to waiting conversations
+# round-robin, so one bursty user can't take the whole model quota.
+
+MAX_CONCURRENT_RUNS = int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", "8"))
+COALESCE_MESSAGES = os.getenv("AGENT_COALESCE_MESSAGES", "true").lower() in ("1", "true", "yes")
+MAX_COALESCED_MESSAGES = int(os.getenv("AGENT_MAX_COALESCED_MESSAGES", "5"))
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class FairLimiter:
+    """ Caps concurrent holders; waiting keys are served round-robin."""
+
+    def __init__(self, limit: int = MAX_CONCURRENT_RUNS):
+        self.limit = limit
+        self._active = 0
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, key: Hashable) -> None:
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self.release()
+            else:
+                queue = self._waiters.get(key)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiters[key]
+            raise
+
+    def release(self) -> None:
+        self._active -= 1
+        while self._active < self.limit and self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                # Send the key to the back so every other waiting key goes first
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                self._active += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class _Conversation:
+    def __init__(self):
+        self.pending: List[Tuple[Any, asyncio.Future]] = []
+        self.worker: Optional[asyncio.Task] = None
+
+
+class TurnScheduler(Generic[T, R]):
+    """ Serializes turns per conversation, optionally coalescing queued messages."""
+
+    def __init__(
+        self,
+        run_turn: Callable[[Hashable, List[T]], Awaitable[R]],
+        limiter: Optional[FairLimiter] = None,
+        coalesce: bool = COALESCE_MESSAGES,
+        max_coalesced: int = MAX_COALESCED_MESSAGES,
+    ):
+        self.run_turn = run_turn
+        self.limiter = limiter or FairLimiter()
+        self.coalesce = coalesce
+        self.max_coalesced = max_coalesced
+        self._conversations: Dict[Hashable, _Conversation] = {}
+        self.stats = {"messages": 0, "turns": 0, "coalesced": 0}
+
+    async def submit(self, key: Hashable, message: T) -> Optional[R]:
+        """ Queue a message and wait for the turn that handles it.
+
+        Returns the turn's result to the first message of the turn, and None
+        to messages that were coalesced into it (their reply is already sent).
+        If the turn fails, every message of the turn gets its exception.
+        """
+        self.stats["messages"] += 1
+        future = asyncio.get_running_loop().create_future()
+        conversation = self._conversations.setdefault(key, _Conversation())
+        conversation.pending.append((message, future))
+        if conversation.worker is None:
+            conversation.worker = asyncio.create_task(self._drain(key, conversation))
+        return await future
+
+    async def _drain(self, key: Hashable, conversation: _Conversation) -> None:
+        try:
+            while conversation.pending:
+                size = self.max_coalesced if self.coalesce else 1
+                batch = conversation.pending[:size]
+                del conversation.pending[:size]
+                # Callers that gave up (request cancelled) don't need a turn
+                batch = [(message, future) for message, future in batch if not future.done()]
+                if not batch:
+                    continue
+
+                self.stats["turns"] += 1
+                self.stats["coalesced"] += len(batch) - 1
+                (_, leader), followers = batch[0], batch[1:]
+                try:
+                    async with self.limiter.slot(key):
+                        result = await self.run_turn(key, [message for message, _ in batch])
+                except Exception as e:
+                    # A failed turn answered none of its messages, every caller gets the error
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    if not leader.done():
+                        leader.set_result(result)
+                    for _, future in followers:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            conversation.worker = None
+            if not conversation.pending:
+                self._conversations.pop(key, None)
@@ -0,0 +1,434 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Annotated, Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from agent_framework import ai_function
+from pydantic import Field
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.concurrency import run_blocking
+
+# Caching proxy in front of the Microsoft Learn MCP server.
+#
+# The agent calls the Learn tools (docs search, docs fetch, code sample
+# search) through this module instead of a fresh MCPStreamableHTTPTool:
+#
+#   - one MCP session to learn.microsoft.com is opened on first use and kept
+#     open, so a lookup doesn't pay for a new connection and MCP handshake;
+#   - results are stored in SQLite keyed by tool and normalized arguments
+#     ("How do I resize a VM?" and "how to resize vm" share an entry), expire
+#     after a per-tool TTL and are evicted least-recently-used;
+#   - concurrent identical lookups share one upstream call;
+#   - a curated topic list (learn_topics.txt) can be prewarmed so the common
+#     questions are answered from the cache from the first conversation on.
+#
+# Failed or error results are never cached. Prewarm or inspect the cache with
+#   python mcp_servers/learn_proxy.py prewarm|stats|clear
+
+MSLEARN_MCP_URL = os.getenv("MSLEARN_MCP_URL", "https://learn.microsoft.com/api/mcp")
+MSLEARN_CACHE_ENABLED = os.getenv("MSLEARN_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+MSLEARN_CACHE_PATH = os.getenv(
+    "MSLEARN_CACHE_PATH", str(Path(__file__).resolve().parents[1] / "data" / "mslearn_cache.sqlite")
+)
+MSLEARN_CACHE_MAX_ENTRIES = int(os.getenv("MSLEARN_CACHE_MAX_ENTRIES", "5000"))
+MSLEARN_CALL_TIMEOUT_SECONDS = float(os.getenv("MSLEARN_CALL_TIMEOUT_SECONDS", "30"))
+
+# Docs pages change slowly, search rankings a little faster
+TOOL_TTL_SECONDS = {
+    "microsoft_docs_search": float(os.getenv("MSLEARN_SEARCH_TTL_SECONDS", str(24 * 60 * 60))),
+    "microsoft_code_sample_search": float(os.getenv("MSLEARN_SEARCH_TTL_SECONDS", str(24 * 60 * 60))),
+    "microsoft_docs_fetch": float(os.getenv("MSLEARN_FETCH_TTL_SECONDS", str(7 * 24 * 60 * 60))),
+}
+
+TOPICS_PATH = Path(__file__).resolve().parent / "learn_topics.txt"
+
+HEADERS = {"User-Agent": "Cloud-Helper-Agent/1.0"}
+
+# Words that don't change what a docs search returns
+_STOPWORDS = frozenset(
+    "a an and are can do does for how i in is it me my of on or please show should tell the to what when where which "
+    "with you your".split()
+)
+_WORD = re.compile(r"[a-z0-9][a-z0-9+#./-]*")
+
+
+def normalize_query(query: str) -> str:
+    """ Lowercase, drop punctuation and filler words, so rephrasings of a question share a cache entry."""
+    words = [word.rstrip("./-") for word in _WORD.findall(query.lower())]
+    kept = [word for word in words if word and word not in _STOPWORDS]
+    return " ".join(kept or words)
+
+
+# Query parameters that only track where a link came from. The others (view,
+# tabs, pivots, ...) select what the page shows and stay in the cache key.
+_TRACKING_PARAMETERS = frozenset(("wt.mc_id", "ocid"))
+
+
+def normalize_url(url: str) -> str:
+    """ Learn URLs differ in case, locale, fragment and tracking parameters for the same page."""
+    parts = urlsplit(url.strip())
+    path = re.sub(r"^/[a-z]{2}-[a-z]{2}(?=/)", "", parts.path.lower()).rstrip("/")
+    parameters = sorted(
+        (name.lower(), value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in _TRACKING_PARAMETERS and not name.lower().startswith("utm_")
+    )
+    return urlunsplit((parts.scheme.lower() or "https", parts.netloc.lower(), path, urlencode(parameters), ""))
+
+
+def cache_key(tool: str, arguments: Dict[str, Any]) -> str:
+    normalized = {}
+    for name, value in sorted(arguments.items()):
+        if value is None:
+            continue
+        if name == "url":
+            normalized[name] = normalize_url(value)
+        elif name in ("query", "question"):
+            normalized[name] = normalize_query(value)
+        else:
+            normalized[name] = str(value).strip().lower()
+    return f"{tool}:{json.dumps(normalized, sort_keys=True)}"
+
+
+class LearnResponseCache:
+    """ SQLite store for Learn results, all methods are blocking (call through run_blocking)."""
+
+    def __init__(self, path: str = MSLEARN_CACHE_PATH, max_entries: int = MSLEARN_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across the blocking pool's threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    arguments TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS responses_by_last_used ON responses (last_used);
+                """
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute("SELECT result, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        with connection:
+            connection.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        return row[0]
+
+    def fresh(self, key: str) -> bool:
+        row = self._connection().execute("SELECT expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def put(self, key: str, tool: str, arguments: Dict[str, Any], result: str, ttl_seconds: float) -> None:
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, tool, arguments, result, created_at, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, tool, json.dumps(arguments), result, now, now + ttl_seconds, now),
+            )
+            connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            # Least recently used entries go first once the cache is full
+            connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        row = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(LENGTH(result)), 0) FROM responses"
+        ).fetchone()
+        return {"entries": row[0], "hits": row[1], "bytes": row[2], "path": self.path}
+
+    def clear(self) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM responses")
+
+
+class LearnMcpProxy:
+    def __init__(
+        self,
+        url: str = MSLEARN_MCP_URL,
+        cache: Optional[LearnResponseCache] = None,
+        enabled: bool = MSLEARN_CACHE_ENABLED,
+        timeout_seconds: float = MSLEARN_CALL_TIMEOUT_SECONDS,
+    ):
+        self.url = url
+        self.cache = cache or LearnResponseCache()
+        self.enabled = enabled
+        self.timeout_seconds = timeout_seconds
+        self._session = None
+        self._session_task: Optional[asyncio.Task] = None
+        self._session_ready: Optional[asyncio.Future] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "upstream_calls": 0, "sessions": 0, "errors": 0}
+
+    # ---- upstream session
+
+    async def _run_session(self, ready: asyncio.Future, closing: asyncio.Event) -> None:
+        # The MCP client's task groups must be entered and left in the same task,
+        # so one long-lived task owns the session and tool calls only use it
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamablehttp_client
+
+        try:
+            async with streamablehttp_client(self.url, headers=HEADERS, timeout=self.timeout_seconds) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.stats["sessions"] += 1
+                    self._session = session
+                    ready.set_result(session)
+                    await closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"Microsoft Learn MCP session ended: {e}")
+        finally:
+            self._session = None
+
+    async def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A session belongs to the loop it was opened on
+            self._session_task = self._session_ready = None
+            self._loop = loop
+        if self._session_task is None or self._session_task.done():
+            self._closing = asyncio.Event()
+            self._session_ready = loop.create_future()
+            self._session_task = loop.create_task(self._run_session(self._session_ready, self._closing))
+        return await asyncio.shield(self._session_ready)
+
+    async def _reset_session(self) -> None:
+        task = self._session_task
+        if self._closing is not None:
+            self._closing.set()
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+        # Another call may have opened the next session meanwhile
+        if self._session_task is task:
+            self._session_task = self._session_ready = None
+
+    def _session_lost(self, session, error: Exception) -> bool:
+        """ Whether a failed call means the session itself is gone, rather than just this call failing."""
+        import anyio
+        import httpx
+        from mcp.shared.exceptions import McpError
+        from mcp.types import CONNECTION_CLOSED
+
+        if self._session is not session:
+            return True
+        if isinstance(error, McpError):
+            return error.error.code == CONNECTION_CLOSED
+        return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, httpx.TransportError))
+
+    async def _call_upstream(self, tool: str, arguments: Dict[str, Any]) -> str:
+        for attempt in range(2):
+            session = await self._get_session()
+            session_task = self._session_task
+            try:
+                self.stats["upstream_calls"] += 1
+                result = await session.call_tool(tool, arguments, read_timeout_seconds=timedelta(seconds=self.timeout_seconds))
+                break
+            except Exception as e:
+                # Timeouts and tool errors leave the shared session (and the
+                # other lookups on it) alone. If the server dropped an idle
+                # session, reconnect once, unless another call already did.
+                if attempt == 1 or not self._session_lost(session, e):
+                    raise
+                if self._session_task is session_task:
+                    await self._reset_session()
+        text = "\n".join(getattr(content, "text", "") for content in result.content)
+        if result.isError:
+            raise RuntimeError(text or f"{tool} failed")
+        return text
+
+    # ---- cached calls
+
+    async def call_tool(self, tool: str, arguments: Dict[str, Any], refresh: bool = False) -> str:
+        """ Return a Learn tool's text result, from the cache when there is a fresh entry."""
+        arguments = {name: value for name, value in arguments.items() if value is not None}
+        if not self.enabled:
+            return await self._call_upstream(tool, arguments)
+
+        key = cache_key(tool, arguments)
+        if not refresh:
+            cached = await run_blocking(self.cache.get, key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+
+        loop = asyncio.get_running_loop()
+        future = self._in_flight.get(key)
+        if future is not None and future.get_loop() is loop:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The lookup we were waiting for was cancelled, not us: make our own
+                return await self.call_tool(tool, arguments, refresh=refresh)
+
+        self.stats["misses"] += 1
+        future = loop.create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._call_upstream(tool, arguments)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            # Nobody else may be waiting, don't log "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            await run_blocking(self.cache.put, key, tool, arguments, result, TOOL_TTL_SECONDS.get(tool, 24 * 60 * 60))
+            future.set_result(result)
+            return result
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    async def prewarm(self, topics: Iterable[str], concurrency: int = 4) -> Dict[str, int]:
+        """ Search every topic that has no fresh cache entry yet."""
+        semaphore = asyncio.Semaphore(concurrency)
+        counts = {"cached": 0, "fetched": 0, "failed": 0}
+
+        async def warm(topic: str) -> None:
+            if await run_blocking(self.cache.fresh, cache_key("microsoft_docs_search", {"query": topic})):
+                counts["cached"] += 1
+                return
+            async with semaphore:
+                try:
+                    await self.call_tool("microsoft_docs_search", {"query": topic})
+                    counts["fetched"] += 1
+                except Exception as e:
+                    counts["failed"] += 1
+                    print(f"couldn't prewarm '{topic}': {e}")
+
+        await asyncio.gather(*(warm(topic) for topic in dict.fromkeys(topics)))
+        return counts
+
+    async def close(self) -> None:
+        await self._reset_session()
+
+
+def load_topics(path: Path = TOPICS_PATH) -> List[str]:
+    """ The curated prewarm topics, one per line, # starts a comment."""
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+learn_proxy = LearnMcpProxy()
+
+
+def _error(tool: str, e: Exception) -> str:
+    return json.dumps({"error": f"Microsoft Learn {tool} failed: {e}"})
+
+
+@ai_function(
+    name="microsoft_docs_search",
+    description="Search official Microsoft/Azure documentation on Microsoft Learn. Returns up to 10 relevant content chunks with title, URL and excerpt. Use it for questions about Azure services, limits, configuration and best practices.",
+    approval_mode="never_require"
+)
+async def microsoft_docs_search(
+    query: Annotated[str, Field(description="A query or topic about Microsoft/Azure products, services, platforms or limits")],
+) -> str:
+    """ Search Microsoft Learn, answered from the local cache when possible."""
+    try:
+        return await learn_proxy.call_tool("microsoft_docs_search", {"query": query})
+    except Exception as e:
+        return _error("docs search", e)
+
+
+@ai_function(
+    name="microsoft_docs_fetch",
+    description="Fetch a Microsoft Learn page and return it as markdown. Use it after microsoft_docs_search when the excerpts aren't enough and the full page is needed.",
+    approval_mode="never_require"
+)
+async def microsoft_docs_fetch(
+    url: Annotated[str, Field(description="URL of the Microsoft documentation page to read")],
+) -> str:
+    """ Fetch a Microsoft Learn page, answered from the local cache when possible."""
+    try:
+        return await learn_proxy.call_tool("microsoft_docs_fetch", {"url": url})
+    except Exception as e:
+        return _error("docs fetch", e)
+
+
+@ai_function(
+    name="microsoft_code_sample_search",
+    description="Search official Microsoft Learn code samples, for example Azure CLI, PowerShell, Bicep or SDK snippets.",
+    approval_mode="never_require"
+)
+async def microsoft_code_sample_search(
+    query: Annotated[str, Field(description="What the code sample should do, e.g. 'resize a virtual machine'")],
+    language: Annotated[Optional[str], Field(description="Optional programming language or tool, e.g. python, azurecli, powershell, bicep")] = None,
+) -> str:
+    """ Search Microsoft Learn code samples, answered from the local cache when possible."""
+    try:
+        return await learn_proxy.call_tool("microsoft_code_sample_search", {"query": query, "language": language})
+    except Exception as e:
+        return _error("code sample search", e)
+
+
+MSLEARN_TOOLS = [microsoft_docs_search, microsoft_docs_fetch, microsoft_code_sample_search]
+
+
+async def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the Microsoft Learn response cache")
+    parser.add_argument("command", choices=["prewarm", "stats", "clear"])
+    parser.add_argument("--topics", default=str(TOPICS_PATH), help="file with one prewarm topic per line")
+    parser.add_argument("--url", default=MSLEARN_MCP_URL, help="Learn MCP endpoint")
+    args = parser.parse_args(argv)
+
+    proxy = LearnMcpProxy(url=args.url)
+    try:
+        if args.command == "prewarm":
+            started = time.perf_counter()
+            counts = await proxy.prewarm(load_topics(Path(args.topics)))
+            print(f"prewarmed in {time.perf_counter() - started:.1f}s: {counts}")
+        elif args.command == "clear":
+            await run_blocking(proxy.cache.clear)
+        print(await run_blocking(proxy.cache.stats))
+    finally:
+        await proxy.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
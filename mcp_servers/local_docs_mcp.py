@@ -0,0 +1,485 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Annotated, Any, Dict, Iterator, List, Optional, Tuple
+
+from agent_framework import ai_function
+from pydantic import Field
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from mcp_servers.learn_proxy import normalize_query, normalize_url
+from tools.concurrency import run_blocking
+
+# Offline Azure documentation search with the Microsoft Learn tool surface.
+#
+# A local checkout of the docs markdown (e.g. MicrosoftDocs/azure-docs
+# articles/) is split into heading-sized chunks and indexed in SQLite FTS5,
+# which ranks with BM25 (title and heading matches weigh more than body
+# text). Queries look for chunks with all the terms first and fall back to
+# any term, terms most chunks contain are left out, so FTS5 only has to score
+# a small candidate set. Fenced code blocks go into a separate index for code
+# sample search.
+# Searches are answered in a few milliseconds without network access, so the
+# index file can be built once and copied into an air-gapped environment.
+#
+# Rebuilding is incremental: files whose size, mtime and content hash didn't
+# change are skipped, changed files are re-chunked and deleted files dropped.
+#
+#   python mcp_servers/local_docs_mcp.py build ~/azure-docs/articles
+#   python mcp_servers/local_docs_mcp.py search "premium ssd iops limits"
+#   python mcp_servers/local_docs_mcp.py serve [--port 8767]   # MCP server, stdio without --port
+#
+# The agent uses it with MSLEARN_MCP_BACKEND=local (see ms_learn_mcp.py), the
+# tools have the same names and result shapes as the remote Learn server.
+
+MSLEARN_LOCAL_INDEX_PATH = os.getenv(
+    "MSLEARN_LOCAL_INDEX_PATH", str(Path(__file__).resolve().parents[1] / "data" / "docs_index.sqlite")
+)
+# Base URL the docs' relative paths are published under
+MSLEARN_LOCAL_BASE_URL = os.getenv("MSLEARN_LOCAL_BASE_URL", "https://learn.microsoft.com/azure")
+DOCS_CHUNK_CHARS = int(os.getenv("DOCS_CHUNK_CHARS", "1500"))
+DOCS_SEARCH_RESULTS = 10
+# Keep a single long page from filling all the results
+DOCS_MAX_CHUNKS_PER_PAGE = 2
+# Terms found in more than this share of the chunks ("azure", "resource") are
+# dropped from a query that has rarer terms, they barely change the ranking but
+# make FTS5 score most of the index
+DOCS_COMMON_TERM_SHARE = float(os.getenv("DOCS_COMMON_TERM_SHARE", "0.3"))
+
+_FRONT_MATTER = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+_FENCE = re.compile(r"^```[ \t]*([\w+#.-]*)[^\n]*\n(.*?)^```[ \t]*$", re.DOTALL | re.MULTILINE)
+_HEADING = re.compile(r"^(#{1,3})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_INCLUDE = re.compile(r"\[!INCLUDE\s*\[[^\]]*\]\([^)]*\)\]", re.IGNORECASE)
+_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)|:::image[^\n]*:::(?:[^\n]*\n)?", re.IGNORECASE)
+_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+_ALERT = re.compile(r"^>\s*\[!(NOTE|TIP|IMPORTANT|CAUTION|WARNING)\]\s*$", re.IGNORECASE | re.MULTILINE)
+_LANGUAGE_ALIASES = {"azurecli-interactive": "azurecli", "azure-cli": "azurecli", "azurepowershell": "powershell",
+                     "azurepowershell-interactive": "powershell", "ps": "powershell", "py": "python", "sh": "bash"}
+
+
+def _clean(markdown: str) -> str:
+    text = _COMMENT.sub("", markdown)
+    text = _INCLUDE.sub("", text)
+    text = _IMAGE.sub("", text)
+    text = _LINK.sub(r"\1", text)
+    text = _ALERT.sub(lambda match: match.group(1).capitalize() + ":", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def _front_matter(markdown: str) -> Tuple[Dict[str, str], str]:
+    match = _FRONT_MATTER.match(markdown)
+    if not match:
+        return {}, markdown
+    fields = {}
+    for line in match.group(1).splitlines():
+        name, _, value = line.partition(":")
+        if value.strip():
+            fields[name.strip().lower()] = value.strip().strip("'\"")
+    return fields, markdown[match.end():]
+
+
+def _split_size(text: str, limit: int) -> Iterator[str]:
+    """ Split at paragraph boundaries into pieces of at most limit characters."""
+    piece = ""
+    for paragraph in text.split("\n\n"):
+        if piece and len(piece) + len(paragraph) + 2 > limit:
+            yield piece
+            piece = ""
+        piece = f"{piece}\n\n{paragraph}" if piece else paragraph
+        while len(piece) > limit:
+            yield piece[:limit]
+            piece = piece[limit:]
+    if piece.strip():
+        yield piece
+
+
+def parse_markdown(markdown: str, chunk_chars: int = DOCS_CHUNK_CHARS) -> Dict[str, Any]:
+    """ Split a docs page into title, cleaned body, heading chunks and code samples."""
+    fields, body = _front_matter(markdown)
+    samples = []
+
+    def keep_code(match: "re.Match") -> str:
+        language = match.group(1).lower()
+        samples.append({"language": _LANGUAGE_ALIASES.get(language, language), "code": match.group(2).rstrip(), "at": match.start()})
+        # Short commands stay in the prose, they are often the answer
+        return match.group(0) if len(match.group(2)) <= 200 else ""
+
+    prose = _clean(_FENCE.sub(keep_code, body))
+    headings = list(_HEADING.finditer(prose))
+    title = fields.get("title") or (headings[0].group(2) if headings else "")
+
+    chunks = []
+    sections = [(0, title, prose[: headings[0].start()] if headings else prose)]
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(prose)
+        sections.append((heading.start(), heading.group(2), prose[heading.end():end]))
+    for _, heading, text in sections:
+        for piece in _split_size(text.strip(), chunk_chars):
+            chunks.append({"heading": heading, "text": piece})
+
+    # A code sample is described by the heading it appears under
+    code_headings = [(match.start(), match.group(2)) for match in _HEADING.finditer(body)]
+    for sample in samples:
+        at = sample.pop("at")
+        sample["description"] = next((text for start, text in reversed(code_headings) if start < at), title)
+    return {"title": title, "description": fields.get("description", ""), "body": prose, "chunks": chunks, "samples": samples}
+
+
+def url_for(relative_path: str, base_url: str = MSLEARN_LOCAL_BASE_URL) -> str:
+    path = relative_path.replace(os.sep, "/")
+    path = re.sub(r"(/index)?\.md$", "", path)
+    return f"{base_url.rstrip('/')}/{path}"
+
+
+def page_key(url: str) -> str:
+    """ The page a URL points at. The local copy has every tab and view of a page in one file."""
+    return normalize_url(url).split("?", 1)[0]
+
+
+def _query_terms(query: str) -> List[str]:
+    return list(dict.fromkeys(re.findall(r"[a-z0-9]+", normalize_query(query))))
+
+
+def _fts_query(terms: List[str], operator: str = "OR") -> Optional[str]:
+    if not terms:
+        return None
+    return f" {operator} ".join(f'"{term}"' for term in terms)
+
+
+class DocsIndex:
+    """ SQLite FTS5 index of the docs, all methods are blocking (call through run_blocking)."""
+
+    def __init__(self, path: str = MSLEARN_LOCAL_INDEX_PATH, base_url: str = MSLEARN_LOCAL_BASE_URL):
+        self.path = path
+        self.base_url = base_url
+        self._local = threading.local()
+        # term -> number of chunks containing it, cleared whenever this process rebuilds
+        self._document_frequency: Dict[str, int] = {}
+        self._chunk_count: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across the blocking pool's threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    url TEXT NOT NULL,
+                    url_key TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha1 TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS documents_by_url ON documents (url_key);
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                    title, heading, text, document_id UNINDEXED, tokenize='porter unicode61'
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS code_samples USING fts5(
+                    description, code, language UNINDEXED, document_id UNINDEXED, tokenize='porter unicode61'
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                """
+            )
+            self._local.connection = connection
+        return connection
+
+    # ---- building
+
+    def build(self, source_dir: str) -> Dict[str, int]:
+        """ Bring the index in line with the markdown files under source_dir, re-chunking only changed files."""
+        root = Path(source_dir).expanduser().resolve()
+        connection = self._connection()
+        known = {row["path"]: row for row in connection.execute("SELECT id, path, size, mtime, sha1 FROM documents")}
+        counts = {"unchanged": 0, "added": 0, "updated": 0, "deleted": 0, "chunks": 0}
+        seen = set()
+
+        with connection:
+            for file in sorted(root.rglob("*.md")):
+                relative = file.relative_to(root).as_posix()
+                seen.add(relative)
+                stat = file.stat()
+                existing = known.get(relative)
+                if existing is not None and existing["size"] == stat.st_size and existing["mtime"] == stat.st_mtime:
+                    counts["unchanged"] += 1
+                    continue
+                content = file.read_bytes()
+                sha1 = hashlib.sha1(content).hexdigest()
+                if existing is not None and existing["sha1"] == sha1:
+                    # Touched but not changed
+                    connection.execute("UPDATE documents SET mtime = ? WHERE id = ?", (stat.st_mtime, existing["id"]))
+                    counts["unchanged"] += 1
+                    continue
+                if existing is not None:
+                    self._delete_document(connection, existing["id"])
+                counts["updated" if existing is not None else "added"] += 1
+                counts["chunks"] += self._insert_document(connection, relative, content.decode("utf-8", "replace"), stat, sha1)
+
+            for relative, existing in known.items():
+                if relative not in seen:
+                    self._delete_document(connection, existing["id"])
+                    counts["deleted"] += 1
+
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source_dir', ?)", (str(root),))
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)", (str(time.time()),))
+        if counts["added"] or counts["updated"] or counts["deleted"]:
+            connection.execute("INSERT INTO chunks(chunks) VALUES ('optimize')")
+            self._document_frequency.clear()
+            self._chunk_count = None
+        return counts
+
+    def _insert_document(self, connection: sqlite3.Connection, relative: str, markdown: str, stat: os.stat_result, sha1: str) -> int:
+        page = parse_markdown(markdown)
+        url = url_for(relative, self.base_url)
+        cursor = connection.execute(
+            "INSERT INTO documents (path, url, url_key, title, body, size, mtime, sha1) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (relative, url, page_key(url), page["title"] or relative, page["body"], stat.st_size, stat.st_mtime, sha1),
+        )
+        document_id = cursor.lastrowid
+        connection.executemany(
+            "INSERT INTO chunks (title, heading, text, document_id) VALUES (?, ?, ?, ?)",
+            [(page["title"], chunk["heading"], chunk["text"], document_id) for chunk in page["chunks"]],
+        )
+        connection.executemany(
+            "INSERT INTO code_samples (description, code, language, document_id) VALUES (?, ?, ?, ?)",
+            [(sample["description"], sample["code"], sample["language"], document_id) for sample in page["samples"]],
+        )
+        return len(page["chunks"])
+
+    @staticmethod
+    def _delete_document(connection: sqlite3.Connection, document_id: int) -> None:
+        connection.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+        connection.execute("DELETE FROM code_samples WHERE document_id = ?", (document_id,))
+        connection.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    # ---- queries
+
+    def _selective_terms(self, terms: List[str]) -> List[str]:
+        """ Drop the terms most chunks contain, as long as a rarer term is left to search for."""
+        if len(terms) < 2:
+            return terms
+        connection = self._connection()
+        if self._chunk_count is None:
+            self._chunk_count = connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        for term in terms:
+            if term not in self._document_frequency:
+                self._document_frequency[term] = connection.execute(
+                    "SELECT COUNT(*) FROM chunks WHERE chunks MATCH ?", (f'"{term}"',)
+                ).fetchone()[0]
+        limit = DOCS_COMMON_TERM_SHARE * self._chunk_count
+        selective = [term for term in terms if self._document_frequency[term] <= limit]
+        if not selective:
+            # Only common terms: keep them all, the AND query narrows them down
+            return terms
+        return selective
+
+    def _ranked_chunks(self, fts_query: str, limit: int) -> List[sqlite3.Row]:
+        return self._connection().execute(
+            "SELECT chunks.rowid, chunks.heading, chunks.text, documents.title, documents.url "
+            "FROM chunks JOIN documents ON documents.id = chunks.document_id "
+            "WHERE chunks MATCH ? ORDER BY bm25(chunks, 4.0, 2.0, 1.0) LIMIT ?",
+            (fts_query, limit),
+        ).fetchall()
+
+    def search(self, query: str, limit: int = DOCS_SEARCH_RESULTS) -> List[Dict[str, str]]:
+        """ The best matching chunks as Learn's docs search returns them (title, content, contentUrl)."""
+        terms = self._selective_terms(_query_terms(query))
+        if not terms:
+            return []
+        # Chunks with all the terms first, FTS5 only scores the (small) intersection.
+        # Only when that's not enough, any term may match and BM25 ranks chunks that
+        # match more and rarer terms first.
+        rows = self._ranked_chunks(_fts_query(terms, "AND"), limit * 4)
+        if len(terms) > 1 and len(rows) < limit:
+            seen = {row["rowid"] for row in rows}
+            rows += [row for row in self._ranked_chunks(_fts_query(terms, "OR"), limit * 4) if row["rowid"] not in seen]
+
+        results, per_page = [], {}
+        for row in rows:
+            if per_page.get(row["url"], 0) >= DOCS_MAX_CHUNKS_PER_PAGE:
+                continue
+            per_page[row["url"]] = per_page.get(row["url"], 0) + 1
+            title = row["title"] if row["heading"] in ("", row["title"]) else f"{row['title']} - {row['heading']}"
+            results.append({"title": title, "content": row["text"], "contentUrl": row["url"]})
+            if len(results) == limit:
+                break
+        return results
+
+    def fetch(self, url: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT title, body FROM documents WHERE url_key = ?", (page_key(url),)
+        ).fetchone()
+        if row is None:
+            return None
+        return row["body"] if row["body"].lstrip().startswith("# ") else f"# {row['title']}\n\n{row['body']}"
+
+    def code_samples(self, query: str, language: Optional[str] = None, limit: int = DOCS_SEARCH_RESULTS) -> List[Dict[str, str]]:
+        fts_query = _fts_query(_query_terms(query))
+        if fts_query is None:
+            return []
+        sql = (
+            "SELECT code_samples.description, code_samples.code, code_samples.language, documents.url "
+            "FROM code_samples JOIN documents ON documents.id = code_samples.document_id WHERE code_samples MATCH ?"
+        )
+        parameters: List[Any] = [fts_query]
+        if language:
+            sql += " AND code_samples.language = ?"
+            parameters.append(_LANGUAGE_ALIASES.get(language.lower(), language.lower()))
+        sql += " ORDER BY bm25(code_samples, 2.0, 1.0) LIMIT ?"
+        parameters.append(limit)
+        return [
+            {"description": row["description"], "language": row["language"], "code": row["code"], "link": row["url"]}
+            for row in self._connection().execute(sql, parameters)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        connection = self._connection()
+        meta = {row["key"]: row["value"] for row in connection.execute("SELECT key, value FROM meta")}
+        return {
+            "documents": connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "chunks": connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0],
+            "code_samples": connection.execute("SELECT COUNT(*) FROM code_samples").fetchone()[0],
+            "source_dir": meta.get("source_dir"),
+            "built_at": float(meta["built_at"]) if "built_at" in meta else None,
+            "path": self.path,
+        }
+
+
+docs_index = DocsIndex()
+
+
+def _error(tool: str, e: Exception) -> str:
+    return json.dumps({"error": f"Local docs {tool} failed: {e}"})
+
+
+@ai_function(
+    name="microsoft_docs_search",
+    description="Search official Microsoft/Azure documentation on Microsoft Learn. Returns up to 10 relevant content chunks with title, URL and excerpt. Use it for questions about Azure services, limits, configuration and best practices.",
+    approval_mode="never_require"
+)
+async def microsoft_docs_search(
+    query: Annotated[str, Field(description="A query or topic about Microsoft/Azure products, services, platforms or limits")],
+) -> str:
+    """ Search the local docs index."""
+    try:
+        return json.dumps(await run_blocking(docs_index.search, query))
+    except Exception as e:
+        return _error("docs search", e)
+
+
+@ai_function(
+    name="microsoft_docs_fetch",
+    description="Fetch a Microsoft Learn page and return it as markdown. Use it after microsoft_docs_search when the excerpts aren't enough and the full page is needed.",
+    approval_mode="never_require"
+)
+async def microsoft_docs_fetch(
+    url: Annotated[str, Field(description="URL of the Microsoft documentation page to read")],
+) -> str:
+    """ Return a page from the local docs index."""
+    try:
+        page = await run_blocking(docs_index.fetch, url)
+        return page if page is not None else _error("docs fetch", LookupError(f"{url} is not in the local index"))
+    except Exception as e:
+        return _error("docs fetch", e)
+
+
+@ai_function(
+    name="microsoft_code_sample_search",
+    description="Search official Microsoft Learn code samples, for example Azure CLI, PowerShell, Bicep or SDK snippets.",
+    approval_mode="never_require"
+)
+async def microsoft_code_sample_search(
+    query: Annotated[str, Field(description="What the code sample should do, e.g. 'resize a virtual machine'")],
+    language: Annotated[Optional[str], Field(description="Optional programming language or tool, e.g. python, azurecli, powershell, bicep")] = None,
+) -> str:
+    """ Search the code samples in the local docs index."""
+    try:
+        return json.dumps(await run_blocking(docs_index.code_samples, query, language))
+    except Exception as e:
+        return _error("code sample search", e)
+
+
+LOCAL_DOCS_TOOLS = [microsoft_docs_search, microsoft_docs_fetch, microsoft_code_sample_search]
+
+
+def create_mcp_server(index: Optional[DocsIndex] = None):
+    """ An MCP server exposing the index with the Microsoft Learn tool names."""
+    from mcp.server.fastmcp import FastMCP
+
+    index = index or docs_index
+    server = FastMCP("Local Azure Docs")
+
+    @server.tool(name="microsoft_docs_search", description=microsoft_docs_search.description)
+    async def docs_search(query: str) -> str:
+        return json.dumps(await run_blocking(index.search, query))
+
+    @server.tool(name="microsoft_docs_fetch", description=microsoft_docs_fetch.description)
+    async def docs_fetch(url: str) -> str:
+        page = await run_blocking(index.fetch, url)
+        if page is None:
+            raise ValueError(f"{url} is not in the local index")
+        return page
+
+    @server.tool(name="microsoft_code_sample_search", description=microsoft_code_sample_search.description)
+    async def code_sample_search(query: str, language: Optional[str] = None) -> str:
+        return json.dumps(await run_blocking(index.code_samples, query, language))
+
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build, query or serve the local Azure docs index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index (or re-index) a directory of docs markdown")
+    build.add_argument("source_dir")
+    search = commands.add_parser("search", help="run a docs search against the index")
+    search.add_argument("query")
+    serve = commands.add_parser("serve", help="serve the index as an MCP server")
+    serve.add_argument("--port", type=int, help="serve streamable HTTP on this port instead of stdio")
+    commands.add_parser("stats")
+    parser.add_argument("--index", default=MSLEARN_LOCAL_INDEX_PATH, help="index file")
+    args = parser.parse_args(argv)
+
+    index = DocsIndex(args.index)
+    if args.command == "build":
+        started = time.perf_counter()
+        counts = index.build(args.source_dir)
+        print(f"indexed in {time.perf_counter() - started:.1f}s: {counts}")
+        print(index.stats())
+    elif args.command == "search":
+        started = time.perf_counter()
+        results = index.search(args.query)
+        elapsed = (time.perf_counter() - started) * 1000
+        for result in results:
+            print(f"{result['title']}\n  {result['contentUrl']}")
+        print(f"{len(results)} results in {elapsed:.1f}ms")
+    elif args.command == "serve":
+        server = create_mcp_server(index)
+        if args.port:
+            server.settings.port = args.port
+            server.run(transport="streamable-http")
+        else:
+            server.run(transport="stdio")
+    else:
+        print(index.stats())
+
+
+if __name__ == "__main__":
+    main()
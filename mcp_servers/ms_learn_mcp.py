@@ -1,7 +1,15 @@
 import asyncio
-from agent_framework import ChatAgent, MCPStreamableHTTPTool
-from agent_framework.azure import AzureAIAgentClient
-from azure.identity.aio import AzureCliCredential
+import os
+
+from agent_framework import MCPStreamableHTTPTool
+
+# The agent client and credential are only needed by the examples below, the
+# agents import this module just for get_mslearn_mcp_tool
+
+# "cached" goes through the caching proxy in learn_proxy.py, "local" searches
+# the offline docs index in local_docs_mcp.py, "remote" hands the agent the
+# plain MCP tool for learn.microsoft.com. All three offer the same tools.
+MSLEARN_MCP_BACKEND = os.getenv("MSLEARN_MCP_BACKEND", "cached").lower()
 
 async def create_mslearn_mcp_tool():
     """Create and return an HTTP-based MCP tool for Microsoft Learn."""
@@ -18,6 +26,10 @@ async def create_mslearn_mcp_tool():
 
 async def test_mslearn_agent():
     """Example function to test the Microsoft Learn MCP integration."""
+    from agent_framework import ChatAgent
+    from agent_framework.azure import AzureAIAgentClient
+    from azure.identity.aio import AzureCliCredential
+
     async with (
         AzureCliCredential() as credential,
         create_mslearn_mcp_tool() as mcp_server,
@@ -35,6 +47,20 @@ async def test_mslearn_agent():
         print(result.messages[-1].content if result.messages else "No response")
         return result
 
+def get_mslearn_tools(backend: str = MSLEARN_MCP_BACKEND) -> list:
+    """Return the Microsoft Learn tools for an agent from the configured backend."""
+    if backend == "cached":
+        from mcp_servers.learn_proxy import MSLEARN_TOOLS
+
+        return list(MSLEARN_TOOLS)
+    if backend == "local":
+        from mcp_servers.local_docs_mcp import LOCAL_DOCS_TOOLS
+
+        return list(LOCAL_DOCS_TOOLS)
+    if backend == "remote":
+        return [get_mslearn_mcp_tool()]
+    raise ValueError(f"Unknown MSLEARN_MCP_BACKEND '{backend}'")
+
 def get_mslearn_mcp_tool():
     """Synchronous function to get the MCP tool for use in other agents."""
     return MCPStreamableHTTPTool(
@@ -48,6 +74,10 @@ def get_mslearn_mcp_tool():
 
 async def http_mcp_example():
     """Original example using an HTTP-based MCP server."""
+    from agent_framework import ChatAgent
+    from agent_framework.azure import AzureAIAgentClient
+    from azure.identity.aio import AzureCliCredential
+
     async with (
         AzureCliCredential() as credential,
         MCPStreamableHTTPTool(
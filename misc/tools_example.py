@@ -1,6 +1,7 @@
 import os
+import sys
+from pathlib import Path
 from typing import Annotated, List, Dict, Any
-from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
 from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.compute import ComputeManagementClient
 from azure.mgmt.storage import StorageManagementClient
@@ -9,6 +10,11 @@ from azure.core.exceptions import AzureError
 from agent_framework.azure import AzureOpenAIChatClient
 from dotenv import load_dotenv
 
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.credentials import get_sync_credential
+
 load_dotenv()
 
 class AzureResourceService:
@@ -18,8 +24,9 @@ class AzureResourceService:
         self.subscription_id = subscription_id
         self.resource_group_name = resource_group_name
         
-        # Use Managed Identity in production, DefaultAzureCredential for development
-        self.credential = DefaultAzureCredential()
+        # Shared DefaultAzureCredential behind the token cache, only created
+        # once a client actually needs a token
+        self.credential = get_sync_credential()
         
         # Initialize Azure management clients
         self.resource_client = ResourceManagementClient(
@@ -96,17 +103,13 @@ async def get_virtual_machines_status(
     try:
         rg_name = resource_group or azure_service.resource_group_name
         
-        vms = azure_service.compute_client.virtual_machines.list(rg_name)
+        # The listing embeds each VM's instance view, no extra call per VM
+        vms = azure_service.compute_client.virtual_machines.list(rg_name, expand="instanceView")
         
         vm_list = []
         for vm in vms:
-            # Get instance view for power state
-            instance_view = azure_service.compute_client.virtual_machines.instance_view(
-                rg_name, vm.name
-            )
-            
             power_state = "Unknown"
-            for status in instance_view.statuses:
+            for status in (vm.instance_view.statuses if vm.instance_view else []):
                 if status.code.startswith('PowerState/'):
                     power_state = status.display_status
                     break
@@ -0,0 +1,102 @@
+import asyncio
+import multiprocessing
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+# Ensure the project root is on sys.path when this test is run from the
+# `testing` directory. This makes the top-level `agents` package importable.
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from agent_framework import AgentThread, ChatMessage
+from microsoft_agents.hosting.core import StoreItem
+
+from agents.bot_state import SqliteStorage, conversation_lock
+from agents.thread_store import SqliteThreadBackend, ThreadStore
+
+# Stand-in for several Teams workers sharing one state directory. Every worker
+# plays the same users concurrently; each turn reads the user's turn counter
+# and agent thread, waits as if the LLM were running, then writes both back.
+# Without the shared store and the per-conversation lock turns would be lost.
+
+WORKERS = 4
+USERS = 8
+TURNS_PER_WORKER = 10
+
+
+class TurnCounter(StoreItem):
+    def __init__(self, turns: int = 0):
+        self.turns = turns
+
+    def store_item_to_json(self):
+        return {"turns": self.turns}
+
+    @staticmethod
+    def from_json_to_store_item(json_data):
+        return TurnCounter(json_data["turns"])
+
+
+class StandInAgent:
+    def get_new_thread(self):
+        return AgentThread()
+
+    async def deserialize_thread(self, serialized_thread):
+        return await AgentThread.deserialize(serialized_thread)
+
+
+async def play_user(worker: int, user: str, storage: SqliteStorage, threads: ThreadStore, lock_dir: str):
+    for turn in range(TURNS_PER_WORKER):
+        async with conversation_lock(user, lock_dir=lock_dir):
+            counter = (await storage.read([user], target_cls=TurnCounter)).get(user, TurnCounter())
+            thread = await threads.get(user)
+
+            await asyncio.sleep(random.uniform(0, 0.01))
+            await thread.on_new_messages(ChatMessage(role="user", text=f"worker {worker} turn {turn}"))
+            counter.turns += 1
+
+            await threads.put(user, thread)
+            await storage.write({user: counter})
+
+
+def run_worker(worker: int, state_dir: str):
+    async def main():
+        storage = SqliteStorage(str(Path(state_dir) / "bot_state.sqlite"))
+        threads = ThreadStore(StandInAgent(), SqliteThreadBackend(str(Path(state_dir) / "threads.sqlite")), shared=True)
+        lock_dir = str(Path(state_dir) / "locks")
+        await asyncio.gather(*(play_user(worker, f"user-{u}", storage, threads, lock_dir) for u in range(USERS)))
+
+    asyncio.run(main())
+
+
+async def verify(state_dir: str) -> bool:
+    storage = SqliteStorage(str(Path(state_dir) / "bot_state.sqlite"))
+    threads = ThreadStore(StandInAgent(), SqliteThreadBackend(str(Path(state_dir) / "threads.sqlite")), shared=True)
+    expected = WORKERS * TURNS_PER_WORKER
+    ok = True
+    for u in range(USERS):
+        user = f"user-{u}"
+        counter = (await storage.read([user], target_cls=TurnCounter))[user]
+        messages = await (await threads.get(user)).message_store.list_messages()
+        status = "ok" if counter.turns == expected and len(messages) == expected else "LOST UPDATES"
+        ok = ok and status == "ok"
+        print(f"{user}: {counter.turns} turns, {len(messages)} thread messages, expected {expected} -> {status}")
+    return ok
+
+
+def main():
+    with tempfile.TemporaryDirectory() as state_dir:
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=run_worker, args=(worker, state_dir)) for worker in range(WORKERS)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        if not asyncio.run(verify(state_dir)):
+            sys.exit(1)
+        print(f"{WORKERS} workers x {USERS} users x {TURNS_PER_WORKER} turns: no lost updates")
+
+
+if __name__ == '__main__':
+    main()
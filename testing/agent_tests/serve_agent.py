@@ -6,19 +6,24 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 
 
-from agent_framework.devui import serve
-from agents.cloud_helper_agent import cloud_helper_agent
-from agent_framework.observability import setup_observability
+from agents.cloud_helper_agent import get_cloud_helper_agent
 
 
 
 
 def main():
+    # DevUI and observability are only imported once the server actually starts
+    from agent_framework.devui import serve
+    from agent_framework.observability import setup_observability
 
     setup_observability()
 
+    # DevUI runs its own event loop, follow the metrics export on a thread of its own
+    from tools.vm_metrics_ingest import start_follow_thread
 
-    serve(entities=[cloud_helper_agent], port=8090, auto_open=True)
+    start_follow_thread()
+
+    serve(entities=[get_cloud_helper_agent()], port=8090, auto_open=True)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Startup benchmark for the agent entry points.
+#
+# Imports serve_agent.py and teams_agent.py in fresh interpreters with
+# `python -X importtime` and reports how long the import takes, which
+# top-level packages it spends the time in, and which heavy packages got
+# imported at startup although they should only load on first use. Results
+# are stored in data/startup_benchmark.json and each run is compared with the
+# previous one, so import regressions show up as a delta.
+#
+#   python testing/agent_tests/startup_benchmark.py --runs 5
+#   python testing/agent_tests/startup_benchmark.py --ready    # also build the agent
+#   python testing/agent_tests/startup_benchmark.py --budget-ms 1500
+
+ROOT = Path(__file__).resolve().parents[2]
+ENTRY_POINTS = {
+    "serve_agent": Path(__file__).resolve().parent / "serve_agent.py",
+    "teams_agent": Path(__file__).resolve().parent / "teams_agent.py",
+}
+RESULTS_PATH = ROOT / "data" / "startup_benchmark.json"
+
+# Packages no entry point should need before the first request
+DEFERRED_PACKAGES = ("openai", "semantic_kernel", "numpy", "azure.mgmt", "azure.identity", "azure.core", "msal")
+
+_IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {directory!r})
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+if {ready}:
+    from agents.cloud_helper_agent import get_cloud_helper_agent
+    get_cloud_helper_agent()
+print("BENCHMARK", imported - started, time.perf_counter() - imported)
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """ Rows of `-X importtime` output: module, self and cumulative microseconds, nesting depth."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+        })
+    return rows
+
+
+def run_once(name: str, ready: bool) -> Dict[str, Any]:
+    path = ENTRY_POINTS[name]
+    script = _IMPORT_SCRIPT.format(directory=str(path.parent), module=path.stem, ready=ready)
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", script], capture_output=True, text=True, cwd=ROOT, env=env)
+    wall = time.perf_counter() - started
+
+    rows = parse_importtime(process.stderr)
+    result: Dict[str, Any] = {"wall_seconds": wall, "modules": len(rows)}
+    marker = [line for line in process.stdout.splitlines() if line.startswith("BENCHMARK")]
+    if process.returncode != 0 or not marker:
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}"
+        result["error"] = error
+        return result
+
+    _, import_seconds, ready_seconds = marker[0].split()
+    result["import_seconds"] = float(import_seconds)
+    if ready:
+        result["ready_seconds"] = float(ready_seconds)
+
+    per_package: Dict[str, int] = defaultdict(int)
+    for row in rows:
+        per_package[row["module"].split(".")[0]] += row["self_us"]
+    result["packages_ms"] = {package: round(us / 1000, 1) for package, us in sorted(per_package.items(), key=lambda item: -item[1])}
+
+    loaded = {row["module"] for row in rows}
+    result["deferred_loaded"] = sorted(
+        package for package in DEFERRED_PACKAGES if any(module == package or module.startswith(package + ".") for module in loaded)
+    )
+    return result
+
+
+def benchmark(name: str, runs: int, ready: bool) -> Dict[str, Any]:
+    results = [run_once(name, ready) for _ in range(runs)]
+    failed = [result for result in results if "error" in result]
+    if failed:
+        return {"error": failed[0]["error"]}
+    summary = {
+        "import_ms": round(statistics.median(result["import_seconds"] for result in results) * 1000, 1),
+        "wall_ms": round(statistics.median(result["wall_seconds"] for result in results) * 1000, 1),
+        "modules": results[-1]["modules"],
+        "top_packages_ms": dict(list(results[-1]["packages_ms"].items())[:10]),
+        "deferred_loaded": results[-1]["deferred_loaded"],
+    }
+    if ready:
+        summary["ready_ms"] = round(statistics.median(result["ready_seconds"] for result in results) * 1000, 1)
+    return summary
+
+
+def _load_previous() -> Dict[str, Any]:
+    try:
+        with open(RESULTS_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(results: Dict[str, Any]) -> None:
+    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the import cost of the agent entry points")
+    parser.add_argument("entry_points", nargs="*", help=f"any of {', '.join(ENTRY_POINTS)} (default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per entry point, the median is reported")
+    parser.add_argument("--ready", action="store_true", help="also build the agent after importing")
+    parser.add_argument("--budget-ms", type=float, help="exit non-zero if an entry point imports slower than this")
+    parser.add_argument("--no-save", action="store_true", help="don't store the results as the new baseline")
+    args = parser.parse_args(argv)
+    unknown = set(args.entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(sorted(unknown))}")
+
+    previous = _load_previous()
+    results = {}
+    exit_code = 0
+    for name in args.entry_points or list(ENTRY_POINTS):
+        summary = results[name] = benchmark(name, args.runs, args.ready)
+        if "error" in summary:
+            print(f"{name}: import failed: {summary['error']}")
+            exit_code = 1
+            continue
+
+        line = f"{name}: import {summary['import_ms']}ms ({summary['modules']} modules), interpreter total {summary['wall_ms']}ms"
+        baseline = previous.get(name, {}).get("import_ms")
+        if baseline:
+            line += f", {summary['import_ms'] - baseline:+.1f}ms vs previous run"
+        if args.ready:
+            line += f", agent ready after another {summary['ready_ms']}ms"
+        print(line)
+        print("  slowest packages: " + ", ".join(f"{package} {ms}ms" for package, ms in summary["top_packages_ms"].items()))
+        if summary["deferred_loaded"]:
+            print(f"  loaded at startup, should load on first use: {', '.join(summary['deferred_loaded'])}")
+        if args.budget_ms is not None and summary["import_ms"] > args.budget_ms:
+            print(f"  over the {args.budget_ms}ms budget")
+            exit_code = 1
+
+    if not args.no_save:
+        _save(dict(previous, **{name: summary for name, summary in results.items() if "error" not in summary}))
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
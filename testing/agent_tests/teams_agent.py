@@ -1,6 +1,9 @@
 # start_server.py
+import asyncio
+import multiprocessing
 import sys
 from pathlib import Path
+from typing import List, Optional
 
 # Add project root to sys.path so 'agents' module can be imported
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
@@ -13,12 +16,60 @@ from microsoft_agents.hosting.aiohttp import (
    CloudAdapter,
 )
 from aiohttp.web import Request, Response, Application, run_app
-from semantic_kernel.contents import ChatHistory
+
+from mcp_servers.learn_proxy import learn_proxy
+from tools.azure_clients import close_clients
+from tools.concurrency import run_blocking
+from tools.get_cloud_resources import inventory_snapshot
+from tools.vm_metrics_ingest import follow_metrics_export
+from tools.vm_metrics_store import VM_METRICS_FOLLOW_PATH
+
+
+async def _start_agent_warmup(app: Application) -> None:
+   # Build the agent (and import the OpenAI SDK) off the loop while the server already accepts requests
+   app["agent_warmup"] = asyncio.create_task(load_agent())
+
+
+async def _start_inventory_refresh(app: Application) -> None:
+   # Keep the local inventory snapshot fresh so resource questions don't wait on ARM
+   if inventory_snapshot.enabled:
+      app["inventory_refresh"] = asyncio.create_task(
+         inventory_snapshot.run_background([environ.get("AZURE_SUBSCRIPTION_ID")])
+      )
+
+
+async def _start_metrics_follow(app: Application) -> None:
+   # Feed the exporter's new samples into the store the metric tools read in this process
+   if VM_METRICS_FOLLOW_PATH:
+      app["metrics_follow"] = asyncio.create_task(follow_metrics_export(VM_METRICS_FOLLOW_PATH))
+
+
+async def _close_azure_clients(app: Application) -> None:
+   for task_name in ("inventory_refresh", "metrics_follow"):
+      task = app.get(task_name)
+      if task is not None:
+         task.cancel()
+   if _thread_store is not None:
+      await _thread_store.close()
+   await close_clients()
+   await learn_proxy.close()
+
+# Number of worker processes serving /api/messages. With more than one worker
+# turn state and agent threads are shared through SQLite (see agents/bot_state.py)
+WORKERS = int(environ.get("TEAMS_WORKERS", "1"))
+SHARED_STATE = WORKERS > 1 or environ.get("TEAMS_STATE_BACKEND") == "sqlite"
 
 # 1 Createg the AIOHTTP Server 
 def start_server(
-   agent_application: AgentApplication, auth_configuration: AgentAuthConfiguration
+   agent_application: AgentApplication,
+   auth_configuration: AgentAuthConfiguration,
+   workers: int = 1,
+   reuse_port: bool = False,
 ):
+   if workers > 1:
+      _start_workers(workers)
+      return
+
    async def entry_point(req: Request) -> Response:
       agent: AgentApplication = req.app["agent_app"]
       adapter: CloudAdapter = req.app["adapter"]
@@ -34,11 +85,36 @@ def start_server(
    APP["agent_configuration"] = auth_configuration
    APP["agent_app"] = agent_application
    APP["adapter"] = agent_application.adapter
+   APP.on_startup.append(_start_agent_warmup)
+   APP.on_startup.append(_start_inventory_refresh)
+   APP.on_startup.append(_start_metrics_follow)
+   APP.on_cleanup.append(_close_azure_clients)
 
    try:
-      run_app(APP, host="localhost", port=environ.get("PORT", 3978))
+      run_app(APP, host="localhost", port=environ.get("PORT", 3978), reuse_port=reuse_port or None)
    except Exception as error:
       raise error
+
+
+def _worker_main():
+   start_server(AGENT_APP, None, reuse_port=True)
+
+
+def _start_workers(workers: int):
+   """ Run N server processes on the same port, the kernel spreads connections over them (SO_REUSEPORT)."""
+   context = multiprocessing.get_context("spawn")
+   processes = [context.Process(target=_worker_main, name=f"teams-worker-{i}") for i in range(workers)]
+   for process in processes:
+      process.start()
+   print(f"Started {workers} workers on port {environ.get('PORT', 3978)}")
+   try:
+      for process in processes:
+         process.join()
+   except KeyboardInterrupt:
+      for process in processes:
+         process.terminate()
+      for process in processes:
+         process.join()
    
 # Memory and context imports for chat 
 from microsoft_agents.hosting.core import (
@@ -47,14 +123,34 @@ from microsoft_agents.hosting.core import (
    MemoryStorage,
 )
 
-from agents.cloud_helper_agent import cloud_helper_agent
-from agent_framework import AgentThread, ChatMessage
+from agents.bot_state import SqliteStorage, conversation_lock, no_lock
+from agents.cloud_helper_agent import get_cloud_helper_agent
+from agents.reply_streaming import TeamsReplyStreamer
+from agents.thread_store import ThreadStore, create_thread_store
+from agents.turn_scheduler import TurnScheduler
+from agent_framework import AgentThread, ChatMessage, ChatAgent
+
+# Store agent threads per conversation, idle and overflow threads are spilled to disk.
+# Created together with the agent, see load_agent
+_thread_store: Optional[ThreadStore] = None
+_agent_loading: Optional[asyncio.Future] = None
 
-# Store agent threads per conversation
-conversation_threads = {}
+
+async def load_agent() -> ChatAgent:
+   """ Build the agent on a worker thread on first use, later calls return it right away."""
+   global _agent_loading, _thread_store
+   if _agent_loading is None or (_agent_loading.done() and _agent_loading.exception() is not None):
+      _agent_loading = asyncio.ensure_future(run_blocking(get_cloud_helper_agent))
+   agent = await asyncio.shield(_agent_loading)
+   if _thread_store is None:
+      _thread_store = create_thread_store(agent, shared=SHARED_STATE)
+   return agent
+
+# Only one worker at a time may run a conversation's turn
+turn_lock = conversation_lock if SHARED_STATE else no_lock
 
 AGENT_APP = AgentApplication[TurnState](
-    storage=MemoryStorage(), adapter=CloudAdapter()
+    storage=SqliteStorage() if SHARED_STATE else MemoryStorage(), adapter=CloudAdapter()
 )
 
 async def _help(context: TurnContext, state: TurnState):
@@ -68,20 +164,35 @@ AGENT_APP.conversation_update("membersAdded")(_help)
 AGENT_APP.message("/help")(_help)
 
 
+async def run_turn(user_id: str, contexts: List[TurnContext]) -> str:
+    """ Run one agent turn for a conversation, messages sent during the previous turn are combined.
+
+    The reply is streamed into the conversation of the turn's first message while the agent runs.
+    """
+    agent = await load_agent()
+    streamer = TeamsReplyStreamer(contexts[0])
+    user_message = "\n".join(context.activity.text for context in contexts)
+    async with turn_lock(user_id):
+        agent_thread = await _thread_store.get(user_id)
+
+        reply = await streamer.stream(agent.run_stream(user_message, store=True, thread=agent_thread))
+        await _thread_store.put(user_id, agent_thread)
+    return reply
+
+
+# Serializes turns per conversation and caps concurrent LLM runs across users
+turn_scheduler = TurnScheduler(run_turn)
+
+
 @AGENT_APP.activity("message")
 async def on_message(context: TurnContext, state: TurnState):
     
     try:
         user_id = context.activity.from_property.id
-        user_message = context.activity.text
-
-        agent = cloud_helper_agent
-        if user_id not in conversation_threads:
-            conversation_threads[user_id] = agent.get_new_thread()
-        agent_thread = conversation_threads[user_id]
 
-        result = await agent.run(user_message, store=True, thread=agent_thread)
-        await context.send_activity(result.messages[-1].text)
+        # The reply is sent by the turn itself, messages coalesced into
+        # another message's turn are answered there
+        await turn_scheduler.submit(user_id, context)
     
     except Exception as e:
         error_message = f"Sorry, I encountered an error: {str(e)}"
@@ -90,6 +201,6 @@ async def on_message(context: TurnContext, state: TurnState):
 
 if __name__ == "__main__":
     try:
-        start_server(AGENT_APP, None)
+        start_server(AGENT_APP, None, workers=WORKERS)
     except Exception as error:
         raise error
\ No newline at end of file
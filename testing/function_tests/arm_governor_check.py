@@ -0,0 +1,86 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from azure.mgmt.resource.resources.aio import ResourceManagementClient
+
+from fake_arm_server import FakeArmServer, FakeCredential, generate_inventory
+from tools.arm_governor import ArmCircuitOpenError, ArmGovernor, JitteredRetryPolicy, governed_client_kwargs
+
+# Runs bursts of ARM calls against the fake ARM server with and without the
+# governor: 60 concurrent listings against a 20 reads / 2s quota, then a
+# subscription that only answers 503 until it recovers.
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+CALLS = 60
+
+
+def client(url: str, governor: ArmGovernor = None) -> ResourceManagementClient:
+    kwargs = {"authentication_policy": SansIOHTTPPolicy()}
+    if governor is not None:
+        kwargs.update(governed_client_kwargs(governor))
+        kwargs["retry_policy"] = JitteredRetryPolicy(retry_total=5, retry_backoff_factor=0.1)
+    return ResourceManagementClient(credential=FakeCredential(), subscription_id=SUBSCRIPTION, base_url=url, **kwargs)
+
+
+async def burst(resource_client: ResourceManagementClient) -> int:
+    async def list_groups():
+        return [group async for group in resource_client.resource_groups.list()]
+
+    results = await asyncio.gather(*(list_groups() for _ in range(CALLS)), return_exceptions=True)
+    return sum(1 for result in results if isinstance(result, Exception))
+
+
+async def main():
+    server = FakeArmServer(generate_inventory(subscriptions=1, resource_groups=20, resources_per_group=1), reads_per_window=20, window_seconds=2.0)
+    url = await server.start()
+    try:
+        for name, governor in (("ungoverned", None), ("governed", ArmGovernor(capacity=20, refill_per_second=10))):
+            server.requests.clear()
+            server._windows.clear()
+            async with client(url, governor) as resource_client:
+                started = time.perf_counter()
+                failed = await burst(resource_client)
+            print(
+                f"{name}: {CALLS} listings in {time.perf_counter() - started:.1f}s, {failed} failed, "
+                f"{server.requests.get('throttled', 0)} answered 429"
+                + (f", governor {governor.stats}" if governor else "")
+            )
+            await asyncio.sleep(2.0)
+
+        # Circuit breaker: every request fails until the service recovers
+        server.reads_per_window = None
+        server.error_rate = 1.0
+        server.requests.clear()
+        governor = ArmGovernor(circuit_options={"min_requests": 5, "cooldown_seconds": 1.0})
+        async with client(url, governor) as resource_client:
+            outcomes = []
+            started = time.perf_counter()
+            for _ in range(10):
+                try:
+                    [group async for group in resource_client.resource_groups.list()]
+                    outcomes.append("ok")
+                except ArmCircuitOpenError:
+                    outcomes.append("circuit open")
+                except Exception as e:
+                    outcomes.append(type(e).__name__)
+            print(f"failing service: {outcomes} in {time.perf_counter() - started:.1f}s, {server.requests.get('server_errors', 0)} requests reached it")
+            assert outcomes.count("circuit open") >= 8
+
+            server.error_rate = 0.0
+            await asyncio.sleep(1.1)
+            groups = [group async for group in resource_client.resource_groups.list()]
+            assert len(groups) == 20 and governor.circuit(SUBSCRIPTION).state == "closed"
+            print("recovered after the cooldown, circuit closed")
+        print("ok")
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+import asyncio
+import base64
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from azure.core.credentials import AccessToken
+
+from tools.credentials import CachedAsyncCredential, TokenCache
+
+# Runs the token-caching credential against a fake credential that takes a
+# second per token, like the Azure CLI link of DefaultAzureCredential does:
+# concurrent first calls, warm calls, a "restart" that reads the cache file,
+# a restart as another identity that must not get the old tokens, and a
+# background refresh before a short-lived token expires.
+
+SCOPE = "https://management.azure.com/.default"
+TENANT = "11111111-1111-1111-1111-111111111111"
+
+
+def fake_jwt(serial: int, app_id: str) -> str:
+    """ A token shaped like an Entra access token, the cache reads its tid/appid claims."""
+    def part(value) -> str:
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+    claims = {"tid": TENANT, "oid": f"oid-{app_id}", "appid": app_id, "serial": serial}
+    return f"{part({'alg': 'none'})}.{part(claims)}.signature"
+
+
+class SlowCredential:
+    def __init__(self, lifetime_seconds: float = 3600, delay_seconds: float = 1.0, app_id: str = "app-one"):
+        self.lifetime_seconds = lifetime_seconds
+        self.app_id = app_id
+        self.delay_seconds = delay_seconds
+        self.calls = 0
+
+    async def get_token(self, *scopes, **kwargs) -> AccessToken:
+        self.calls += 1
+        await asyncio.sleep(self.delay_seconds)
+        return AccessToken(fake_jwt(self.calls, self.app_id), int(time.time() + self.lifetime_seconds))
+
+    async def close(self) -> None:
+        pass
+
+
+def claims(token: AccessToken) -> dict:
+    payload = token.token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+
+def serial(token: AccessToken) -> int:
+    return claims(token)["serial"]
+
+
+async def main():
+    # The identity the environment is configured for, e.g. a service principal
+    os.environ["AZURE_TENANT_ID"], os.environ["AZURE_CLIENT_ID"] = TENANT, "app-one"
+    os.environ.pop("AZURE_USERNAME", None)
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "token_cache.json")
+
+        created = []
+        slow = SlowCredential()
+        credential = CachedAsyncCredential(factory=lambda: created.append(1) or slow, cache=TokenCache(path))
+        assert not created, "credential created before it was needed"
+
+        started = time.perf_counter()
+        tokens = await asyncio.gather(*(credential.get_token(SCOPE) for _ in range(20)))
+        cold = time.perf_counter() - started
+        assert {serial(token) for token in tokens} == {1} and slow.calls == 1
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            await credential.get_token(SCOPE)
+        warm = (time.perf_counter() - started) / 1000
+        print(f"cold: 20 concurrent calls in {cold:.2f}s with {slow.calls} token request, warm: {warm * 1e6:.1f}us per call")
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        await credential.close()
+
+        # A restarted process reads the token from disk instead of authenticating
+        restarted = SlowCredential()
+        credential = CachedAsyncCredential(factory=lambda: restarted, cache=TokenCache(path))
+        started = time.perf_counter()
+        token = await credential.get_token(SCOPE)
+        print(f"after restart: token {serial(token)} in {(time.perf_counter() - started) * 1000:.2f}ms, {restarted.calls} token requests")
+        assert serial(token) == 1 and restarted.calls == 0
+        await credential.close()
+
+        # Restarted as another service principal: the file's tokens aren't served
+        os.environ["AZURE_CLIENT_ID"] = "app-two"
+        other = SlowCredential(delay_seconds=0.01, app_id="app-two")
+        cache = TokenCache(path)
+        credential = CachedAsyncCredential(factory=lambda: other, cache=cache)
+        token = await credential.get_token(SCOPE)
+        assert other.calls == 1 and cache.stats["loaded_from_disk"] == 0 and claims(token)["appid"] == "app-two"
+        await credential.close()
+        print("restart as another identity: old tokens not used")
+
+        # Nothing to tell the identity by (no env, no az login profile): fail closed
+        os.environ.pop("AZURE_CLIENT_ID")
+        os.environ["AZURE_CONFIG_DIR"] = directory
+        cache = TokenCache(path)
+        assert cache.get(cache.key([SCOPE], None)) is None and cache.stats["loaded_from_disk"] == 0
+        os.environ["AZURE_CLIENT_ID"] = "app-one"
+
+        # Short-lived tokens are replaced before they expire while in use
+        short = SlowCredential(lifetime_seconds=33, delay_seconds=0.05)
+        credential = CachedAsyncCredential(factory=lambda: short, cache=TokenCache(None, refresh_margin_seconds=32))
+        first = await credential.get_token(SCOPE)
+        waits = []
+        for _ in range(20):
+            await asyncio.sleep(0.1)
+            started = time.perf_counter()
+            await credential.get_token(SCOPE)
+            waits.append(time.perf_counter() - started)
+        latest = await credential.get_token(SCOPE)
+        print(f"refreshed in the background: token {serial(first)} -> {serial(latest)}, slowest call {max(waits) * 1000:.2f}ms")
+        assert latest.token != first.token and max(waits) < short.delay_seconds
+        await credential.close()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,515 @@
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from azure.core.credentials import AccessToken
+
+# Local stand-in for the Azure management endpoints the tools talk to, so they
+# can be exercised without a tenant. Serves a generated inventory of
+# subscriptions, resource groups and resources.
+#
+#   POST /providers/Microsoft.ResourceGraph/resources
+#       Resource Graph queries over the Resources and resourcechanges tables.
+#       Understands the KQL the tools generate: where (=~, ==, !~, contains,
+#       in~, > datetime()), project (with tostring() aliases), summarize
+#       count() by, order by, take.
+#   GET /subscriptions
+#   GET /subscriptions/{id}/resourcegroups
+#   GET /subscriptions/{id}/resourceGroups/{name}/resources
+#       ARM listings, paged with nextLink.
+#   GET /subscriptions/{id}/resourceGroups/{name}/providers/Microsoft.Compute/virtualMachines
+#   GET /subscriptions/{id}/providers/Microsoft.Compute/virtualMachines
+#   GET .../virtualMachines/{name}/instanceView
+#       The VM resources of the inventory with a size and a power state. The
+#       listings embed the instance view for $expand=instanceView and
+#       statusOnly=true, unless expand_instance_view is False (like an API
+#       version without the expansion).
+#
+# ARM reads can be throttled like the real thing: with reads_per_window set
+# every subscription (or the whole tenant, quota_scope="tenant") has that many
+# reads per window_seconds, responses carry x-ms-ratelimit-remaining-*-reads
+# and an exhausted quota answers 429 with Retry-After. latency_seconds slows
+# every ARM response down, failing_subscriptions answer 403 and error_rate
+# answers that share of requests with 503.
+#
+# create_resource / update_resource / delete_resource change the inventory
+# and record the change in resourcechanges, like ARM would.
+#
+# Point a client at it with base_url=http://127.0.0.1:<port> and a
+# FakeCredential (plain http needs enforce_https=False on the requests), or
+# point the shared client registry at it with AZURE_ARM_ENDPOINT plus
+# AZURE_ARM_TEST_NO_AUTH=true.
+
+RESOURCE_TYPES = [
+    "Microsoft.Compute/virtualMachines",
+    "Microsoft.Compute/disks",
+    "Microsoft.Network/networkInterfaces",
+    "Microsoft.Network/virtualNetworks",
+    "Microsoft.Storage/storageAccounts",
+    "Microsoft.Web/sites",
+]
+LOCATIONS = ["westeurope", "northeurope", "eastus", "swedencentral"]
+VM_SIZES = ["Standard_D2s_v5", "Standard_D4s_v5", "Standard_E8s_v5", "Standard_B2ms"]
+POWER_STATES = [("running", "VM running"), ("running", "VM running"), ("deallocated", "VM deallocated"), ("stopped", "VM stopped")]
+
+
+class FakeCredential:
+    """ Async credential handing out a dummy token, the fake server doesn't check it."""
+
+    async def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return AccessToken("fake-token", int(time.time()) + 3600)
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+def generate_inventory(subscriptions: int = 2, resource_groups: int = 300, resources_per_group: int = 5, seed: int = 7) -> List[Dict[str, Any]]:
+    """ Resources shaped like Resource Graph's Resources table, resource groups spread over the subscriptions."""
+    rng = random.Random(seed)
+    subscription_ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(subscriptions)]
+    resources = []
+    for g in range(resource_groups):
+        subscription_id = subscription_ids[g % subscriptions]
+        resource_group = f"rg-{g:03d}"
+        location = rng.choice(LOCATIONS)
+        for r in range(resources_per_group):
+            resource_type = rng.choice(RESOURCE_TYPES)
+            name = f"{resource_type.split('/')[-1][:-1].lower()}-{g:03d}-{r}"
+            resources.append({
+                "id": f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}/providers/{resource_type}/{name}",
+                "name": name,
+                "type": resource_type.lower(),
+                "location": location,
+                "kind": "",
+                "resourceGroup": resource_group,
+                "subscriptionId": subscription_id,
+                "tags": {"env": rng.choice(["dev", "test", "prod"])},
+            })
+    return resources
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+# ---- KQL subset -------------------------------------------------------------
+
+_STAGE = re.compile(r"(?:[^|']|'(?:\\.|[^'\\])*')+")
+_WHERE = re.compile(r"^where\s+([\w.]+)\s+(=~|==|!~|contains)\s+'((?:\\.|[^'\\])*)'$")
+_WHERE_IN = re.compile(r"^where\s+([\w.]+)\s+in~\s+\((.*)\)$")
+_WHERE_AFTER = re.compile(r"^where\s+([\w.]+)\s+>\s+datetime\(([^)]+)\)$")
+_QUOTED = re.compile(r"'((?:\\.|[^'\\])*)'")
+_PROJECT_ITEM = re.compile(r"^(?:(\w+)\s*=\s*\w+\(([\w.]+)\)|([\w.]+))$")
+_SUMMARIZE = re.compile(r"^summarize\s+(\w+)\s*=\s*count\(\)\s+by\s+(\w+)$")
+_ORDER = re.compile(r"^(?:order|sort)\s+by\s+(\w+)(?:\s+(asc|desc))?$")
+_TAKE = re.compile(r"^(?:take|limit)\s+(\d+)$")
+
+
+def _literal(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def _get(row: Dict[str, Any], path: str) -> Any:
+    value: Any = row
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _split_projection(text: str) -> List[str]:
+    """ Split a projection on commas outside of parentheses."""
+    items, depth, current = [], 0, ""
+    for char in text:
+        if char == "," and depth == 0:
+            items.append(current.strip())
+            current = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    if current.strip():
+        items.append(current.strip())
+    return items
+
+
+def run_query(query: str, tables: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    stages = [stage.strip() for stage in _STAGE.findall(query) if stage.strip()]
+    if not stages or stages[0] not in tables:
+        raise ValueError(f"Only the {', '.join(tables)} tables are supported")
+
+    rows = tables[stages[0]]
+    for stage in stages[1:]:
+        if match := _WHERE.match(stage):
+            column, op, value = match.group(1), match.group(2), _literal(match.group(3))
+            if op == "=~":
+                rows = [row for row in rows if str(_get(row, column) or "").lower() == value.lower()]
+            elif op == "!~":
+                rows = [row for row in rows if str(_get(row, column) or "").lower() != value.lower()]
+            elif op == "==":
+                rows = [row for row in rows if _get(row, column) == value]
+            else:
+                rows = [row for row in rows if value.lower() in str(_get(row, column) or "").lower()]
+        elif match := _WHERE_IN.match(stage):
+            values = {_literal(value).lower() for value in _QUOTED.findall(match.group(2))}
+            rows = [row for row in rows if str(_get(row, match.group(1)) or "").lower() in values]
+        elif match := _WHERE_AFTER.match(stage):
+            after = _parse_time(match.group(2))
+            rows = [row for row in rows if _get(row, match.group(1)) and _parse_time(_get(row, match.group(1))) > after]
+        elif stage.startswith("project "):
+            projected = []
+            for item in _split_projection(stage[len("project "):]):
+                match = _PROJECT_ITEM.match(item)
+                if not match:
+                    raise ValueError(f"Unsupported projection: {item}")
+                alias, path, column = match.groups()
+                projected.append((alias or column, path or column))
+            rows = [{name: _get(row, path) for name, path in projected} for row in rows]
+        elif match := _SUMMARIZE.match(stage):
+            alias, column = match.groups()
+            counts: Dict[Any, int] = {}
+            for row in rows:
+                counts[row.get(column)] = counts.get(row.get(column), 0) + 1
+            rows = [{column: value, alias: count} for value, count in counts.items()]
+        elif match := _ORDER.match(stage):
+            column, direction = match.group(1), match.group(2) or "desc"
+            rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction == "desc")
+        elif match := _TAKE.match(stage):
+            rows = rows[: int(match.group(1))]
+        else:
+            raise ValueError(f"Unsupported query stage: {stage}")
+    return rows
+
+
+# ---- server -----------------------------------------------------------------
+
+class FakeArmServer:
+    def __init__(
+        self,
+        resources: Optional[List[Dict[str, Any]]] = None,
+        max_page_size: int = 1000,
+        reads_per_window: Optional[int] = None,
+        window_seconds: float = 5.0,
+        quota_scope: str = "subscription",
+        latency_seconds: float = 0.0,
+        failing_subscriptions: Optional[List[str]] = None,
+        error_rate: float = 0.0,
+        expand_instance_view: bool = True,
+    ):
+        self.resources: Dict[str, Dict[str, Any]] = {
+            r["id"].lower(): r for r in (resources if resources is not None else generate_inventory())
+        }
+        self.resource_groups: Dict[str, Dict[str, Any]] = {}
+        for resource in self.resources.values():
+            self._ensure_group(resource["subscriptionId"], resource["resourceGroup"], resource["location"])
+        self.changes: List[Dict[str, Any]] = []
+        self.max_page_size = max_page_size
+        self.reads_per_window = reads_per_window
+        self.window_seconds = window_seconds
+        self.quota_scope = quota_scope
+        self.latency_seconds = latency_seconds
+        self.failing_subscriptions = {s.lower() for s in failing_subscriptions or []}
+        self.error_rate = error_rate
+        self.expand_instance_view = expand_instance_view
+        self._windows: Dict[str, List[float]] = {}
+        self.requests: Dict[str, int] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.app = web.Application(middlewares=[self._arm_middleware])
+        self.app.router.add_post("/providers/Microsoft.ResourceGraph/resources", self.resource_graph)
+        self.app.router.add_get("/subscriptions", self.list_subscriptions)
+        self.app.router.add_get("/subscriptions/{subscription_id}/resourcegroups", self.list_resource_groups)
+        self.app.router.add_get(
+            "/subscriptions/{subscription_id}/resourceGroups/{resource_group}/resources", self.list_resources
+        )
+        compute = "/providers/Microsoft.Compute/virtualMachines"
+        self.app.router.add_get("/subscriptions/{subscription_id}/resourceGroups/{resource_group}" + compute, self.list_virtual_machines)
+        self.app.router.add_get("/subscriptions/{subscription_id}" + compute, self.list_virtual_machines)
+        self.app.router.add_get(
+            "/subscriptions/{subscription_id}/resourceGroups/{resource_group}" + compute + "/{name}/instanceView",
+            self.virtual_machine_instance_view,
+        )
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def _count(self, name: str) -> None:
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    @property
+    def subscription_ids(self) -> List[str]:
+        return sorted({group["subscriptionId"] for group in self.resource_groups.values()})
+
+    @web.middleware
+    async def _arm_middleware(self, request: web.Request, handler):
+        """ Latency, read quotas and failures for the ARM routes under /subscriptions/{id}."""
+        parts = request.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "subscriptions":
+            return await handler(request)
+
+        subscription_id = parts[1].lower()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.latency_seconds:
+                await asyncio.sleep(self.latency_seconds)
+            if subscription_id in self.failing_subscriptions:
+                self._count("forbidden")
+                return web.json_response(
+                    {"error": {"code": "AuthorizationFailed", "message": f"No read access to subscription '{subscription_id}'."}},
+                    status=403,
+                )
+
+            if self.error_rate and random.random() < self.error_rate:
+                self._count("server_errors")
+                return web.json_response(
+                    {"error": {"code": "ServiceUnavailable", "message": "The service is temporarily unavailable."}}, status=503
+                )
+
+            headers = {}
+            if self.reads_per_window is not None:
+                now = time.monotonic()
+                quota_key = "tenant" if self.quota_scope == "tenant" else subscription_id
+                header = f"x-ms-ratelimit-remaining-{self.quota_scope}-reads"
+                window = [t for t in self._windows.get(quota_key, []) if now - t < self.window_seconds]
+                self._windows[quota_key] = window
+                if len(window) >= self.reads_per_window:
+                    self._count("throttled")
+                    retry_after = max(1, int(self.window_seconds - (now - window[0]) + 0.999))
+                    return web.json_response(
+                        {"error": {"code": "TooManyRequests", "message": "Number of read requests exceeded the limit."}},
+                        status=429,
+                        headers={"Retry-After": str(retry_after), header: "0"},
+                    )
+                window.append(now)
+                headers[header] = str(self.reads_per_window - len(window))
+
+            response = await handler(request)
+            response.headers.update(headers)
+            return response
+        finally:
+            self.in_flight -= 1
+
+    def _ensure_group(self, subscription_id: str, resource_group: str, location: str) -> None:
+        key = f"{subscription_id}/{resource_group}".lower()
+        if key not in self.resource_groups:
+            self.resource_groups[key] = {
+                "id": f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}",
+                "name": resource_group,
+                "location": location,
+                "tags": {},
+                "subscriptionId": subscription_id,
+            }
+
+    # ---- inventory changes, recorded in resourcechanges
+
+    def _record_change(self, resource_id: str, change_type: str) -> None:
+        resource = self.resources.get(resource_id.lower())
+        subscription_id = resource["subscriptionId"] if resource else resource_id.split("/")[2]
+        self.changes.append({
+            "subscriptionId": subscription_id,
+            "properties": {
+                "targetResourceId": resource_id,
+                "changeType": change_type,
+                "changeAttributes": {"timestamp": _now_iso()},
+            },
+        })
+
+    def create_resource(self, subscription_id: str, resource_group: str, resource_type: str, name: str, location: str = "westeurope", tags=None) -> Dict[str, Any]:
+        self._ensure_group(subscription_id, resource_group, location)
+        resource = {
+            "id": f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}/providers/{resource_type}/{name}",
+            "name": name,
+            "type": resource_type.lower(),
+            "location": location,
+            "kind": "",
+            "resourceGroup": resource_group,
+            "subscriptionId": subscription_id,
+            "tags": tags or {},
+        }
+        self.resources[resource["id"].lower()] = resource
+        self._record_change(resource["id"], "Create")
+        return resource
+
+    def update_resource(self, resource_id: str, **fields) -> Dict[str, Any]:
+        resource = self.resources[resource_id.lower()]
+        resource.update(fields)
+        self._record_change(resource["id"], "Update")
+        return resource
+
+    def delete_resource(self, resource_id: str) -> None:
+        resource = self.resources[resource_id.lower()]
+        self._record_change(resource["id"], "Delete")
+        del self.resources[resource_id.lower()]
+
+    def delete_resource_group(self, subscription_id: str, resource_group: str) -> None:
+        """ Delete a group with its resources, without change records (like a purge the feed missed)."""
+        self.resource_groups.pop(f"{subscription_id}/{resource_group}".lower(), None)
+        for key, resource in list(self.resources.items()):
+            if resource["subscriptionId"].lower() == subscription_id.lower() and resource["resourceGroup"].lower() == resource_group.lower():
+                del self.resources[key]
+
+    # ---- Resource Graph
+
+    async def resource_graph(self, request: web.Request) -> web.Response:
+        self._count("resource_graph")
+        body = await request.json()
+        options = body.get("options") or {}
+        tables = {"Resources": list(self.resources.values()), "resourcechanges": self.changes}
+        if body.get("subscriptions"):
+            subscriptions = {s.lower() for s in body["subscriptions"]}
+            tables = {name: [row for row in rows if row["subscriptionId"].lower() in subscriptions] for name, rows in tables.items()}
+        try:
+            rows = run_query(body["query"], tables)
+        except ValueError as e:
+            return web.json_response({"error": {"code": "BadRequest", "message": str(e)}}, status=400)
+
+        offset = int(base64.b64decode(options["$skipToken"]).decode()) if options.get("$skipToken") else 0
+        top = min(int(options.get("$top") or self.max_page_size), self.max_page_size)
+        page = rows[offset: offset + top]
+        response = {"totalRecords": len(rows), "count": len(page), "resultTruncated": "false", "data": page}
+        if offset + top < len(rows):
+            response["$skipToken"] = base64.b64encode(str(offset + top).encode()).decode()
+        return web.json_response(response)
+
+    # ---- ARM listings
+
+    def _page(self, request: web.Request, items: List[Dict[str, Any]], page_size: int = 100) -> web.Response:
+        offset = int(request.query.get("$skiptoken", "0"))
+        response: Dict[str, Any] = {"value": items[offset: offset + page_size]}
+        if offset + page_size < len(items):
+            query = dict(request.query)
+            query["$skiptoken"] = str(offset + page_size)
+            response["nextLink"] = str(request.url.with_query(query))
+        return web.json_response(response)
+
+    async def list_subscriptions(self, request: web.Request) -> web.Response:
+        self._count("list_subscriptions")
+        subscriptions = [
+            {"id": f"/subscriptions/{s}", "subscriptionId": s, "displayName": f"Client {i}", "state": "Enabled"}
+            for i, s in enumerate(self.subscription_ids)
+        ]
+        return self._page(request, subscriptions)
+
+    async def list_resource_groups(self, request: web.Request) -> web.Response:
+        self._count("list_resource_groups")
+        subscription_id = request.match_info["subscription_id"].lower()
+        groups = [
+            {key: value for key, value in group.items() if key != "subscriptionId"}
+            for group in self.resource_groups.values()
+            if group["subscriptionId"].lower() == subscription_id
+        ]
+        return self._page(request, sorted(groups, key=lambda group: group["name"]))
+
+    async def list_resources(self, request: web.Request) -> web.Response:
+        self._count("list_resources")
+        subscription_id = request.match_info["subscription_id"].lower()
+        resource_group = request.match_info["resource_group"].lower()
+        if f"{subscription_id}/{resource_group}" not in self.resource_groups:
+            return web.json_response(
+                {"error": {"code": "ResourceGroupNotFound", "message": f"Resource group '{resource_group}' could not be found."}},
+                status=404,
+            )
+        resources = [
+            {key: resource[key] for key in ("id", "name", "type", "location", "kind", "tags")}
+            for resource in self.resources.values()
+            if resource["subscriptionId"].lower() == subscription_id and resource["resourceGroup"].lower() == resource_group
+        ]
+        return self._page(request, sorted(resources, key=lambda resource: resource["id"]))
+
+    # ---- virtual machines
+
+    @staticmethod
+    def instance_view(resource: Dict[str, Any]) -> Dict[str, Any]:
+        code, display_status = resource.get("powerState") or POWER_STATES[sum(map(ord, resource["name"])) % len(POWER_STATES)]
+        return {
+            "statuses": [
+                {"code": "ProvisioningState/succeeded", "level": "Info", "displayStatus": "Provisioning succeeded"},
+                {"code": f"PowerState/{code}", "level": "Info", "displayStatus": display_status},
+            ]
+        }
+
+    def _virtual_machine(self, resource: Dict[str, Any], with_instance_view: bool) -> Dict[str, Any]:
+        properties: Dict[str, Any] = {
+            "hardwareProfile": {"vmSize": VM_SIZES[sum(map(ord, resource["name"])) % len(VM_SIZES)]},
+            "storageProfile": {"osDisk": {"osType": "Linux" if resource["name"][-1] in "02468" else "Windows", "createOption": "FromImage"}},
+            "provisioningState": "Succeeded",
+        }
+        if with_instance_view:
+            properties["instanceView"] = self.instance_view(resource)
+        return {"id": resource["id"], "name": resource["name"], "type": "Microsoft.Compute/virtualMachines",
+                "location": resource["location"], "tags": resource["tags"], "properties": properties}
+
+    async def list_virtual_machines(self, request: web.Request) -> web.Response:
+        self._count("list_virtual_machines")
+        subscription_id = request.match_info["subscription_id"].lower()
+        resource_group = request.match_info.get("resource_group", "").lower()
+        with_instance_view = self.expand_instance_view and (
+            request.query.get("$expand", "").lower() == "instanceview" or request.query.get("statusOnly") == "true"
+        )
+        machines = [
+            self._virtual_machine(resource, with_instance_view)
+            for resource in self.resources.values()
+            if resource["type"] == "microsoft.compute/virtualmachines"
+            and resource["subscriptionId"].lower() == subscription_id
+            and (not resource_group or resource["resourceGroup"].lower() == resource_group)
+        ]
+        return self._page(request, sorted(machines, key=lambda machine: machine["id"]))
+
+    async def virtual_machine_instance_view(self, request: web.Request) -> web.Response:
+        self._count("instance_view")
+        resource_id = (
+            f"/subscriptions/{request.match_info['subscription_id']}/resourceGroups/{request.match_info['resource_group']}"
+            f"/providers/microsoft.compute/virtualmachines/{request.match_info['name']}"
+        ).lower()
+        resource = self.resources.get(resource_id)
+        if resource is None:
+            return web.json_response(
+                {"error": {"code": "ResourceNotFound", "message": f"Virtual machine '{request.match_info['name']}' was not found."}},
+                status=404,
+            )
+        return web.json_response(self.instance_view(resource))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Azure management endpoint on localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--subscriptions", type=int, default=2)
+    parser.add_argument("--resource-groups", type=int, default=300)
+    parser.add_argument("--resources-per-group", type=int, default=5)
+    args = parser.parse_args()
+
+    server = FakeArmServer(generate_inventory(args.subscriptions, args.resource_groups, args.resources_per_group))
+    print(json.dumps({"resources": len(server.resources), "resource_groups": len(server.resource_groups)}))
+    web.run_app(server.app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == '__main__':
+    main()
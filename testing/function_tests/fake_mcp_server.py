@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import json
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Local stand-in for the Microsoft Learn MCP server (streamable HTTP at /mcp),
+# so the Learn tools and the caching proxy can be exercised offline.
+#
+# Serves the same three tools as learn.microsoft.com/api/mcp over a small
+# built-in corpus: microsoft_docs_search, microsoft_docs_fetch and
+# microsoft_code_sample_search. latency_seconds slows every tool call down,
+# queries containing one of failing_terms answer with an error result.
+# calls counts tool calls per tool, sessions collects the MCP session ids
+# that made requests, so tests can check caching and session reuse.
+
+SAMPLE_DOCS = [
+    {
+        "title": "Change the size of a virtual machine",
+        "url": "https://learn.microsoft.com/en-us/azure/virtual-machines/sizes/resize-vm",
+        "content": "You can resize a VM from the portal, Azure CLI or PowerShell. If the VM is running, resizing it restarts it. "
+                   "Use az vm resize --size to change the size, az vm list-vm-resize-options lists the sizes available on the current hardware cluster.",
+    },
+    {
+        "title": "Azure premium storage: design for high performance",
+        "url": "https://learn.microsoft.com/en-us/azure/virtual-machines/premium-storage-performance",
+        "content": "Premium SSD disks offer IOPS and throughput limits per disk size, P30 provides 5000 IOPS and 200 MB/s. "
+                   "The VM size also caps uncached disk IOPS and throughput, the lower of the disk and VM limits applies.",
+    },
+    {
+        "title": "Virtual machine and disk performance",
+        "url": "https://learn.microsoft.com/en-us/azure/virtual-machines/disks-performance",
+        "content": "When an application requests more IOPS than the VM allows, the VM is IO capped. "
+                   "Monitor the VM Uncached IOPS Consumed Percentage and Data Disk IOPS Consumed Percentage metrics to detect capping.",
+    },
+    {
+        "title": "Troubleshoot high CPU issues for Azure Windows virtual machines",
+        "url": "https://learn.microsoft.com/en-us/troubleshoot/azure/virtual-machines/windows/troubleshoot-high-cpu-issues-azure-windows-vm",
+        "content": "High CPU usage can be caused by the workload, antivirus scans or a VM size that is too small. "
+                   "Use Performance Diagnostics and the Percentage CPU metric to find the process using the CPU.",
+    },
+    {
+        "title": "Throttling Resource Manager requests",
+        "url": "https://learn.microsoft.com/en-us/azure/azure-resource-manager/management/request-limits-and-throttling",
+        "content": "Resource Manager uses a token bucket per subscription and tenant, read requests refill at 25 per second up to 250. "
+                   "Throttled requests receive HTTP 429 with a Retry-After header.",
+    },
+    {
+        "title": "Azure disk bursting",
+        "url": "https://learn.microsoft.com/en-us/azure/virtual-machines/disk-bursting",
+        "content": "Credit-based bursting lets premium SSDs of P20 and smaller burst up to 3500 IOPS for up to 30 minutes. "
+                   "On-demand bursting is available for disks larger than 512 GiB.",
+    },
+]
+
+SAMPLE_CODE = [
+    {"language": "azurecli", "description": "Resize a virtual machine", "code": "az vm resize --resource-group myRG --name myVM --size Standard_DS3_v2"},
+    {"language": "powershell", "description": "Resize a virtual machine", "code": "$vm = Get-AzVM -ResourceGroupName myRG -VMName myVM\n$vm.HardwareProfile.VmSize = 'Standard_DS3_v2'\nUpdate-AzVM -VM $vm -ResourceGroupName myRG"},
+    {"language": "python", "description": "List virtual machines", "code": "for vm in compute_client.virtual_machines.list_all():\n    print(vm.name)"},
+]
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _score(query: str, text: str) -> int:
+    words = set(_WORD.findall(text.lower()))
+    return sum(1 for word in _WORD.findall(query.lower()) if word in words)
+
+
+class _SessionTracker:
+    def __init__(self, app: ASGIApp, sessions: set):
+        self.app = app
+        self.sessions = sessions
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = dict(scope.get("headers") or [])
+            session_id = headers.get(b"mcp-session-id")
+            if session_id:
+                self.sessions.add(session_id.decode())
+        await self.app(scope, receive, send)
+
+
+class FakeLearnMcpServer:
+    def __init__(self, docs: Optional[List[Dict[str, str]]] = None, latency_seconds: float = 0.0, failing_terms=()):
+        self.docs = docs if docs is not None else SAMPLE_DOCS
+        self.latency_seconds = latency_seconds
+        self.failing_terms = list(failing_terms)
+        self.calls: Counter = Counter()
+        self.sessions: set = set()
+        self.url: Optional[str] = None
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.mcp = FastMCP("Fake Microsoft Learn")
+        self.mcp.add_tool(self.microsoft_docs_search, name="microsoft_docs_search", description="Search Microsoft Learn.")
+        self.mcp.add_tool(self.microsoft_docs_fetch, name="microsoft_docs_fetch", description="Fetch a Microsoft Learn page.")
+        self.mcp.add_tool(self.microsoft_code_sample_search, name="microsoft_code_sample_search", description="Search code samples.")
+
+    async def _tool_call(self, tool: str, text: str) -> None:
+        self.calls[tool] += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        if any(term in text.lower() for term in self.failing_terms):
+            raise ValueError(f"upstream failure for '{text}'")
+
+    async def microsoft_docs_search(self, query: str) -> str:
+        await self._tool_call("microsoft_docs_search", query)
+        ranked = sorted(self.docs, key=lambda doc: -_score(query, doc["title"] + " " + doc["content"]))
+        results = [
+            {"title": doc["title"], "content": doc["content"], "contentUrl": doc["url"]}
+            for doc in ranked[:10]
+            if _score(query, doc["title"] + " " + doc["content"]) > 0
+        ]
+        return json.dumps(results)
+
+    async def microsoft_docs_fetch(self, url: str) -> str:
+        await self._tool_call("microsoft_docs_fetch", url)
+        wanted = url.lower().split("#")[0].replace("/en-us/", "/").rstrip("/")
+        for doc in self.docs:
+            if doc["url"].lower().replace("/en-us/", "/") == wanted:
+                return f"# {doc['title']}\n\n{doc['content']}"
+        raise ValueError(f"page not found: {url}")
+
+    async def microsoft_code_sample_search(self, query: str, language: Optional[str] = None) -> str:
+        await self._tool_call("microsoft_code_sample_search", query)
+        samples = [
+            sample for sample in SAMPLE_CODE
+            if (language is None or sample["language"] == language.lower()) and _score(query, sample["description"]) > 0
+        ]
+        return json.dumps(samples)
+
+    def app(self) -> ASGIApp:
+        return _SessionTracker(self.mcp.streamable_http_app(), self.sessions)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        config = uvicorn.Config(self.app(), host=host, port=port, log_level="warning", lifespan="on")
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/mcp"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            await self._task
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Microsoft Learn MCP server on localhost")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every tool call")
+    args = parser.parse_args()
+
+    server = FakeLearnMcpServer(latency_seconds=args.latency)
+    print(f"MSLEARN_MCP_URL=http://127.0.0.1:{args.port}/mcp")
+    uvicorn.run(server.app(), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from fake_arm_server import FakeArmServer, generate_inventory
+
+# Lists the resource groups of 40 subscriptions on the fake ARM server, once
+# one subscription at a time and once with the throttling-aware fan-out, with
+# two subscriptions the credential can't read.
+
+SUBSCRIPTIONS = 40
+
+
+async def main():
+    server = FakeArmServer(
+        generate_inventory(subscriptions=SUBSCRIPTIONS, resource_groups=SUBSCRIPTIONS * 4, resources_per_group=1),
+        latency_seconds=0.1,
+        failing_subscriptions=[f"00000000-0000-0000-0000-{i:012d}" for i in (3, 17)],
+    )
+    url = await server.start()
+    # The client registry reads the endpoint on import
+    os.environ["AZURE_ARM_ENDPOINT"] = url
+    # The fake server doesn't check tokens, so the clients send none
+    os.environ["AZURE_ARM_TEST_NO_AUTH"] = "true"
+
+    from tools import get_cloud_resources
+    from tools.azure_clients import close_clients
+    from tools.tool_cache import tool_cache
+
+    tool_cache.enabled = False
+    # Compare against the live per-subscription listing, not the snapshot
+    get_cloud_resources.inventory_snapshot.enabled = False
+    try:
+        subscription_ids = await get_cloud_resources.fetch_subscription_ids()
+        assert len(subscription_ids) == SUBSCRIPTIONS
+
+        started = time.perf_counter()
+        serial_groups = 0
+        for subscription_id in subscription_ids:
+            result = await get_cloud_resources.list_resource_groups(subscription_id=subscription_id)
+            serial_groups += len(result.get("rows", []))
+        serial = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = await get_cloud_resources.list_resource_groups_across_subscriptions()
+        parallel = time.perf_counter() - started
+        assert len(result["rows"]) == serial_groups == (SUBSCRIPTIONS - 2) * 4, len(result["rows"])
+        assert sorted(error["subscription_id"][-2:] for error in result["errors"]) == ["03", "17"]
+        print(f"serial: {serial:.2f}s, fan-out: {parallel:.2f}s, peak in flight {server.peak_in_flight}")
+
+        duplicates = await get_cloud_resources.list_resource_groups_across_subscriptions(
+            subscription_ids=[f"00000000-0000-0000-0000-{i:012d}" for i in (0, 0, 1, 2)] + ["00000000-0000-0000-0000-000000000000".upper()]
+        )
+        assert duplicates["subscriptions"] == 3 and len(duplicates["rows"]) == 12
+
+        # Now with a tenant-wide read quota that the fan-out has to back off from
+        server.reads_per_window, server.window_seconds, server.quota_scope = 10, 1.0, "tenant"
+        server.failing_subscriptions.clear()
+        server.requests.clear()
+        limiter = get_cloud_resources.AdaptiveLimiter(low_remaining_reads=3)
+        started = time.perf_counter()
+        groups = 0
+        async for _, resource_groups, error in get_cloud_resources.iter_resource_groups(subscription_ids, limiter):
+            assert error is None, error
+            groups += len(resource_groups)
+        assert groups == SUBSCRIPTIONS * 4
+        print(f"throttled tenant: {time.perf_counter() - started:.2f}s, requests {dict(server.requests)}, limiter {limiter.stats}, final limit {limiter.limit}")
+        print("ok")
+    finally:
+        await close_clients()
+        await server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
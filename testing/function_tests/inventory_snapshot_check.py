@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from fake_arm_server import FakeArmServer, generate_inventory
+
+# Fills the inventory snapshot from the fake ARM server through the regular
+# listing code (in the background, the first read is answered live), changes
+# the fake inventory and checks that a delta refresh brings the snapshot back
+# in line with far fewer requests than a full sync. A due full re-list is
+# left to the background while reads keep answering from the snapshot.
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+
+
+def expected_resources(server: FakeArmServer):
+    return sorted(r["id"].lower() for r in server.resources.values() if r["subscriptionId"] == SUBSCRIPTION)
+
+
+async def main():
+    server = FakeArmServer(generate_inventory(subscriptions=2, resource_groups=300, resources_per_group=5))
+    url = await server.start()
+    # The client registry reads the endpoint on import
+    os.environ["AZURE_ARM_ENDPOINT"] = url
+    # The fake server doesn't check tokens, so the clients send none
+    os.environ["AZURE_ARM_TEST_NO_AUTH"] = "true"
+
+    from tools import get_cloud_resources
+    from tools.azure_clients import close_clients
+    from tools.inventory_snapshot import InventoryDatabase
+    from tools.tool_cache import tool_cache
+
+    tool_cache.enabled = False
+    snapshot = get_cloud_resources.inventory_snapshot
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot.database = InventoryDatabase(str(Path(directory) / "inventory.sqlite"))
+        try:
+            # Before the first sync the tool answers from ARM and warms the snapshot in the background
+            started = time.perf_counter()
+            groups = await get_cloud_resources.list_resource_groups(subscription_id=SUBSCRIPTION)
+            print(f"first read (live): {time.perf_counter() - started:.2f}s, requests {dict(server.requests)}")
+            assert len(groups["rows"]) == 150 and server.requests.get("list_resources", 0) < 150
+            missing = await get_cloud_resources.get_resources_in_resource_group(resource_group="rg-missing", subscription_id=SUBSCRIPTION)
+            assert "error" in missing, missing
+
+            started = time.perf_counter()
+            await snapshot.ensure_fresh(SUBSCRIPTION)
+            print(f"background full sync done after {time.perf_counter() - started:.2f}s more, requests {dict(server.requests)}")
+            assert snapshot.stats["full_syncs"] == 1
+
+            stored = sorted(r["id"].lower() for r in await snapshot.resources(SUBSCRIPTION))
+            assert stored == expected_resources(server), "full sync differs from ARM"
+
+            server.requests.clear()
+            started = time.perf_counter()
+            for _ in range(100):
+                await get_cloud_resources.get_resources_in_resource_group(resource_group="RG-010", subscription_id=SUBSCRIPTION)
+            print(f"100 fresh reads: {(time.perf_counter() - started) * 10:.2f}ms each, requests {dict(server.requests)}")
+            assert not server.requests
+
+            # Change the inventory behind the snapshot's back
+            vm = next(r for r in server.resources.values() if r["subscriptionId"] == SUBSCRIPTION)
+            server.update_resource(vm["id"], tags={"env": "prod", "owner": "mcat"})
+            server.delete_resource(next(r["id"] for r in server.resources.values() if r["subscriptionId"] == SUBSCRIPTION and r["id"] != vm["id"]))
+            server.create_resource(SUBSCRIPTION, "rg-010", "Microsoft.Compute/virtualMachines", "vm-new")
+            server.create_resource(SUBSCRIPTION, "rg-new", "Microsoft.Storage/storageAccounts", "stnew")
+            server.delete_resource_group(SUBSCRIPTION, "rg-020")
+
+            result = await snapshot.refresh(SUBSCRIPTION)
+            print(f"delta refresh: {result}, requests {dict(server.requests)}")
+            assert result["mode"] == "delta"
+
+            stored = sorted(r["id"].lower() for r in await snapshot.resources(SUBSCRIPTION))
+            assert stored == expected_resources(server), "delta refresh differs from ARM"
+            tagged = await snapshot.resources(SUBSCRIPTION, tag="owner", tag_value="mcat")
+            assert [r["id"] for r in tagged] == [vm["id"]]
+            names = [group["name"] for group in await snapshot.resource_groups(SUBSCRIPTION)]
+            assert "rg-new" in names and "rg-020" not in names
+
+            rg10 = await get_cloud_resources.get_resources_in_resource_group(resource_group="rg-010", subscription_id=SUBSCRIPTION)
+            assert "vm-new" in [row[rg10["columns"].index("name")] for row in rg10["rows"]]
+            # A group the snapshot doesn't know is an error, not an empty listing
+            missing = await get_cloud_resources.get_resources_in_resource_group(resource_group="rg-020", subscription_id=SUBSCRIPTION)
+            assert "error" in missing, missing
+
+            # A due full re-list doesn't hold up reads, they get the current snapshot meanwhile
+            snapshot.full_sync_seconds = 0
+            snapshot.max_staleness_seconds = 0
+            server.requests.clear()
+            started = time.perf_counter()
+            await get_cloud_resources.get_resources_in_resource_group(resource_group="rg-011", subscription_id=SUBSCRIPTION)
+            print(f"read with a full re-list due: {(time.perf_counter() - started) * 1000:.1f}ms, requests {dict(server.requests)}")
+            assert snapshot.stats["full_syncs"] == 1 and not server.requests.get("list_resources")
+            await snapshot.warm(SUBSCRIPTION)
+            assert snapshot.stats["full_syncs"] == 2
+            print("ok:", snapshot.stats)
+        finally:
+            await close_clients()
+            await server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'mcp_servers' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from fake_mcp_server import FakeLearnMcpServer
+from mcp_servers import learn_proxy as proxy_module
+from mcp_servers.learn_proxy import LearnMcpProxy, LearnResponseCache, load_topics
+
+# Runs the caching Learn proxy against the fake Learn MCP server (0.2s per
+# call): rephrased questions, concurrent lookups, errors, a timeout next to
+# another lookup, cancelling the caller that leads a shared lookup, a restart
+# on the same cache file, TTL expiry, LRU eviction and prewarming the topic
+# list.
+
+
+async def main():
+    server = FakeLearnMcpServer(latency_seconds=0.2, failing_terms=["explode"])
+    url = await server.start()
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "mslearn_cache.sqlite")
+        proxy = LearnMcpProxy(url=url, cache=LearnResponseCache(path))
+        try:
+            started = time.perf_counter()
+            first = await proxy.call_tool("microsoft_docs_search", {"query": "How do I resize a VM?"})
+            cold = time.perf_counter() - started
+            assert "resize" in first
+
+            started = time.perf_counter()
+            for question in ("how to resize vm", "Resize a VM", "resize  VM!"):
+                assert await proxy.call_tool("microsoft_docs_search", {"query": question}) == first
+            warm = (time.perf_counter() - started) / 3
+            print(f"cold lookup {cold * 1000:.0f}ms, rephrased lookups {warm * 1000:.2f}ms from the cache, upstream calls {dict(server.calls)}")
+            assert server.calls["microsoft_docs_search"] == 1
+
+            results = await asyncio.gather(*(proxy.call_tool("microsoft_docs_search", {"query": "premium SSD IOPS limits"}) for _ in range(10)))
+            assert len(set(results)) == 1 and server.calls["microsoft_docs_search"] == 2
+
+            page = await proxy.call_tool("microsoft_docs_fetch", {"url": "https://learn.microsoft.com/en-us/azure/virtual-machines/disk-bursting"})
+            same = await proxy.call_tool("microsoft_docs_fetch", {"url": "https://LEARN.microsoft.com/azure/virtual-machines/disk-bursting/#on-demand"})
+            assert page == same and server.calls["microsoft_docs_fetch"] == 1
+
+            for _ in range(2):
+                try:
+                    await proxy.call_tool("microsoft_docs_search", {"query": "explode"})
+                    raise AssertionError("error result was returned as a result")
+                except RuntimeError:
+                    pass
+            assert server.calls["microsoft_docs_search"] == 4, "error results must not be cached"
+
+            # A timed out lookup fails on its own, the session stays open for the others
+            proxy.timeout_seconds = 0.1
+            slow = asyncio.create_task(proxy.call_tool("microsoft_docs_search", {"query": "availability zones"}))
+            await asyncio.sleep(0.05)
+            proxy.timeout_seconds = 5
+            other = await proxy.call_tool("microsoft_docs_search", {"query": "scale sets"})
+            try:
+                await slow
+                raise AssertionError("the lookup should have timed out")
+            except Exception as e:
+                assert not isinstance(e, AssertionError), e
+            assert other and proxy.stats["sessions"] == 1
+
+            # Cancelling the caller that leads a shared lookup doesn't fail the callers waiting on it
+            calls = server.calls["microsoft_docs_search"]
+            leader = asyncio.create_task(proxy.call_tool("microsoft_docs_search", {"query": "disk bursting"}))
+            await asyncio.sleep(0.05)
+            follower = asyncio.create_task(proxy.call_tool("microsoft_docs_search", {"query": "disk bursting"}))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            assert "bursting" in (await follower).lower() and leader.cancelled()
+            assert server.calls["microsoft_docs_search"] == calls + 2
+            print(f"one MCP session for {sum(server.calls.values())} upstream calls: {len(server.sessions) == 1}")
+            assert len(server.sessions) == 1
+        finally:
+            await proxy.close()
+
+        # A restarted process answers from the cache file without going upstream
+        restarted = LearnMcpProxy(url=url, cache=LearnResponseCache(path))
+        calls = sum(server.calls.values())
+        try:
+            assert await restarted.call_tool("microsoft_docs_search", {"query": "resize vm"}) == first
+            assert sum(server.calls.values()) == calls and restarted.stats["sessions"] == 0
+
+            # Expired entries go back upstream
+            proxy_module.TOOL_TTL_SECONDS["microsoft_code_sample_search"] = 0.2
+            await restarted.call_tool("microsoft_code_sample_search", {"query": "resize vm", "language": "azurecli"})
+            await restarted.call_tool("microsoft_code_sample_search", {"query": "resize vm", "language": "azurecli"})
+            await asyncio.sleep(0.3)
+            await restarted.call_tool("microsoft_code_sample_search", {"query": "resize vm", "language": "azurecli"})
+            assert server.calls["microsoft_code_sample_search"] == 2
+
+            # Least recently used entries are evicted once the cache is full
+            small = LearnMcpProxy(url=url, cache=LearnResponseCache(str(Path(directory) / "small.sqlite"), max_entries=2))
+            try:
+                for query in ("resize vm", "disk bursting", "resize vm", "throttling"):
+                    await small.call_tool("microsoft_docs_search", {"query": query})
+                keys = [row[0] for row in small.cache._connection().execute("SELECT key FROM responses ORDER BY key")]
+                assert len(keys) == 2 and not any("disk bursting" in key for key in keys), keys
+            finally:
+                await small.close()
+
+            topics = load_topics()
+            started = time.perf_counter()
+            counts = await restarted.prewarm(topics)
+            print(f"prewarmed {len(topics)} topics in {time.perf_counter() - started:.1f}s: {counts}")
+            again = await restarted.prewarm(topics)
+            assert again["cached"] == len(topics), again
+            print("cache:", restarted.cache.stats(), "proxy:", restarted.stats)
+        finally:
+            await restarted.close()
+    await server.stop()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
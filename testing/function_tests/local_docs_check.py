@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'mcp_servers' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+import uvicorn
+
+from fake_mcp_server import SAMPLE_CODE, SAMPLE_DOCS
+from mcp_servers.learn_proxy import LearnMcpProxy, LearnResponseCache
+from mcp_servers.local_docs_mcp import DocsIndex, create_mcp_server
+
+# Builds the offline docs index from a generated docs tree (the fake Learn
+# corpus plus 3000 filler pages), times searches, changes the tree and checks
+# the incremental rebuild, then serves the index as an MCP server and calls it
+# the way the agent calls Microsoft Learn.
+
+FILLER_PAGES = 3000
+# Words most pages use, plus a long tail that only a few pages mention, like real docs
+COMMON_WORDS = "azure resource group portal subscription select create settings".split()
+VOCABULARY = [f"word{i}" for i in range(20)] + (
+    "virtual machine network storage account subnet gateway policy backup vault monitor alert metric log "
+    "workspace identity role assignment key secret certificate cluster node pool container registry function app "
+    "plan database server replica failover region zone availability scale set image gallery snapshot"
+).split() + [f"term{i}" for i in range(3000)]
+ZIPF_WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def write_page(root: Path, relative: str, title: str, body: str) -> None:
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"---\ntitle: {title}\ndescription: {title}\n---\n\n# {title}\n\n{body}\n")
+
+
+def generate_docs(root: Path) -> None:
+    for doc in SAMPLE_DOCS:
+        relative = doc["url"].split("/azure/", 1)[-1] if "/azure/" in doc["url"] else doc["url"].rsplit("/", 2)[-2] + "/" + doc["url"].rsplit("/", 1)[-1]
+        code = "".join(
+            f"\n## {sample['description']}\n\n```{sample['language']}\n{sample['code']}\n```\n"
+            for sample in SAMPLE_CODE if sample["description"].lower().split()[0] in doc["url"]
+        )
+        write_page(root, relative + ".md", doc["title"], doc["content"] + "\n" + code)
+
+    rng = random.Random(7)
+    for i in range(FILLER_PAGES):
+        sections = "\n\n".join(
+            f"## {' '.join(rng.choices(VOCABULARY, ZIPF_WEIGHTS, k=3))}\n\n"
+            + " ".join(rng.sample(COMMON_WORDS, 4) + rng.choices(VOCABULARY, ZIPF_WEIGHTS, k=120))
+            for _ in range(4)
+        )
+        write_page(root, f"filler/area-{i % 40}/page-{i}.md", " ".join(rng.sample(VOCABULARY, 4)), sections)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory) / "articles"
+        generate_docs(root)
+        index = DocsIndex(str(Path(directory) / "docs_index.sqlite"))
+
+        started = time.perf_counter()
+        counts = index.build(str(root))
+        print(f"full build: {time.perf_counter() - started:.1f}s, {counts}")
+        assert counts["added"] == FILLER_PAGES + len(SAMPLE_DOCS)
+
+        queries = ["How do I resize a VM?", "premium SSD IOPS limits", "ARM throttling 429", "disk bursting credits",
+                   "high CPU windows vm", "storage account backup vault policy", "azure portal resize virtual machine"]
+        timings = []
+        for _ in range(50):
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query)
+                timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"search: p50 {statistics.median(timings) * 1000:.2f}ms, p99 {timings[int(len(timings) * 0.99)] * 1000:.2f}ms")
+        assert timings[int(len(timings) * 0.99)] < 0.01
+
+        top = index.search("How do I resize a VM?")[0]
+        assert "resize" in top["contentUrl"], top
+        assert "disk-bursting" in index.search("disk bursting credits")[0]["contentUrl"]
+        assert "resize" in index.search("azure portal resize virtual machine")[0]["contentUrl"]
+        assert "request-limits-and-throttling" in index.search("resource manager throttling")[0]["contentUrl"]
+        page = index.fetch("https://learn.microsoft.com/en-us/azure/virtual-machines/disk-bursting#on-demand")
+        assert page and page.startswith("# Azure disk bursting"), page
+        samples = index.code_samples("resize a virtual machine", language="azurecli")
+        assert samples and samples[0]["code"].startswith("az vm resize"), samples
+
+        # Incremental rebuild: one page changed, one touched, one deleted, one new
+        changed = root / "virtual-machines" / "disk-bursting.md"
+        changed.write_text(changed.read_text() + "\nBursting now also covers Premium SSD v2 in preview.\n")
+        touched = root / "filler" / "area-1" / "page-1.md"
+        os.utime(touched, (time.time() + 5, time.time() + 5))
+        (root / "filler" / "area-2" / "page-2.md").unlink()
+        write_page(root, "virtual-machines/hibernate.md", "Hibernating virtual machines", "Hibernation saves the VM memory to the OS disk.")
+
+        started = time.perf_counter()
+        counts = index.build(str(root))
+        print(f"incremental rebuild: {(time.perf_counter() - started) * 1000:.0f}ms, {counts}")
+        assert counts == {"unchanged": FILLER_PAGES + len(SAMPLE_DOCS) - 2, "added": 1, "updated": 1, "deleted": 1, "chunks": counts["chunks"]}
+        assert "hibernate" in index.search("hibernation")[0]["contentUrl"]
+        assert "v2 in preview" in index.fetch("https://learn.microsoft.com/azure/virtual-machines/disk-bursting")
+
+        # The same tools over MCP, called like the agent calls Microsoft Learn
+        server = uvicorn.Server(uvicorn.Config(create_mcp_server(index).streamable_http_app(), host="127.0.0.1", port=0, log_level="warning"))
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        url = f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}/mcp"
+        proxy = LearnMcpProxy(url=url, cache=LearnResponseCache(str(Path(directory) / "cache.sqlite")), enabled=False)
+        try:
+            results = json.loads(await proxy.call_tool("microsoft_docs_search", {"query": "premium ssd iops"}))
+            assert {"title", "content", "contentUrl"} <= set(results[0])
+            started = time.perf_counter()
+            for _ in range(20):
+                await proxy.call_tool("microsoft_docs_search", {"query": "premium ssd iops"})
+            print(f"over MCP: {(time.perf_counter() - started) / 20 * 1000:.1f}ms per search")
+            assert (await proxy.call_tool("microsoft_docs_fetch", {"url": "https://learn.microsoft.com/azure/virtual-machines/hibernate"})).startswith("# ")
+            assert json.loads(await proxy.call_tool("microsoft_code_sample_search", {"query": "resize vm", "language": "azurecli"}))
+        finally:
+            await proxy.close()
+            server.should_exit = True
+            await task
+        print("index:", index.stats())
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
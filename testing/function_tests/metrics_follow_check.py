@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+# Follows a JSON Lines export the way the agent hosts do and checks that the
+# metric tools see appended samples within a poll interval (a partial batch is
+# written once the follower has caught up), that a line that isn't JSON is
+# skipped, and that the export isn't seeded a second time when it is also the
+# followed file.
+
+POLL_SECONDS = 0.05
+
+
+def sample(name: str, minute: int, iops: float) -> str:
+    return json.dumps({
+        "name": name,
+        "timestamp": f"2025-11-07T08:{minute:02d}:00Z",
+        "resourceGroup": "rg-follow",
+        "metrics": {"iops": iops, "cpuPercentage": 10},
+    }) + "\n"
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the follower"
+        await asyncio.sleep(POLL_SECONDS)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        export = Path(directory) / "vm_metrics.jsonl"
+        export.write_text(sample("vm-a", 0, 100) + sample("vm-b", 0, 200))
+        # The followed file is also the export the store would otherwise be seeded from
+        os.environ["VM_METRICS_PATH"] = str(export)
+        os.environ["VM_METRICS_FOLLOW_PATH"] = str(export)
+
+        from tools.get_virtual_machine_metrics import get_virtual_machine_metric_aggregates
+        from tools.vm_metrics_ingest import follow_metrics_export
+        from tools.vm_timeseries import get_timeseries_store
+
+        store = get_timeseries_store()
+        assert len(store) == 0, "the followed export was seeded"
+
+        follower = asyncio.create_task(follow_metrics_export(str(export), poll_interval=POLL_SECONDS))
+        try:
+            await wait_for(lambda: len(store) == 2)
+
+            started = time.monotonic()
+            with open(export, "a") as f:
+                f.write(sample("vm-a", 1, 900))
+                f.write("not json\n")
+                f.write(sample("vm-b", 1, 300))
+            await wait_for(lambda: len(store) == 4)
+            print(f"appended samples visible after {(time.monotonic() - started) * 1000:.0f}ms")
+
+            result = await get_virtual_machine_metric_aggregates("iops")
+            print(result)
+            assert "error" not in result, result
+        finally:
+            follower.cancel()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
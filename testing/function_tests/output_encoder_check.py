@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from fake_arm_server import FakeArmServer, generate_inventory
+
+# Measures the tokens the model gets from the resource listing tools before
+# and after the shared output encoder: a 600-resource group as the old list of
+# dicts against the table with id elision, the same table cut to the token
+# budget, and a filtered call. Also compares the old indented VM profile text
+# with the dict the profile tool now returns, and checks that the metric
+# aggregates of 1000 VMs and a VM's logs stay within the budget too.
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+RESOURCE_GROUP = "rg-000"
+
+
+def old_resource_listing(resources):
+    return [
+        {"name": r["name"], "type": r["type"], "location": r["location"], "kind": r["kind"], "id": r["id"]}
+        for r in resources
+    ]
+
+
+def old_profile_text(profile, resource_group):
+    return f"""
+            vm_name: {profile["vm_name"]},
+            vm_size: {profile["vm_size"]},
+            location: {profile["location"]},
+            os_type: {profile["os_type"]},
+            power_state: {profile["power_state"]},
+            provisioning_state: {profile["provisioning_state"]},
+            resource_group: {resource_group},
+            max_iops: {profile["max_iops"]},
+            max_throughput_mbps: {profile["max_throughput_mbps"]},
+            max_data_disk_count: {profile["max_data_disk_count"]}
+        """
+
+
+async def main():
+    # One subscription, one resource group with 600 resources
+    server = FakeArmServer(generate_inventory(subscriptions=1, resource_groups=1, resources_per_group=600))
+    url = await server.start()
+    # The client registry reads the endpoint on import
+    os.environ["AZURE_ARM_ENDPOINT"] = url
+    # The fake server doesn't check tokens, so the clients send none
+    os.environ["AZURE_ARM_TEST_NO_AUTH"] = "true"
+
+    from tools import get_cloud_resources
+    from tools.azure_clients import close_clients
+    from tools.get_virtual_machine_context import get_virtual_machine_logs
+    from tools.get_virtual_machine_metrics import get_virtual_machine_metric_aggregates
+    from tools.output_encoder import TOOL_OUTPUT_TOKEN_BUDGET, _token_encoding, count_tokens, encode_table
+    from tools.tool_cache import tool_cache
+    from tools.vm_timeseries import get_timeseries_store
+
+    tool_cache.enabled = False
+    get_cloud_resources.inventory_snapshot.enabled = False
+    print("token counts from", "tiktoken" if _token_encoding() else "the length estimate (tiktoken isn't installed)")
+    try:
+        resources = await get_cloud_resources.fetch_resources_in_resource_group(SUBSCRIPTION, RESOURCE_GROUP)
+        before = count_tokens(old_resource_listing(resources))
+
+        full = encode_table(resources, get_cloud_resources.RESOURCE_COLUMNS, summarize_by="type", budget=0, resource_group=RESOURCE_GROUP)
+        assert full["total"] == len(full["rows"]) == 600 and "kind" not in full["columns"], full["columns"]
+        index = full["columns"].index("id")
+        assert sorted(full["id_prefix"] + row[index] for row in full["rows"]) == sorted(r["id"] for r in resources)
+        table = count_tokens(full)
+        print(f"600 resources: list of dicts {before} tokens, table {table} tokens ({100 - table * 100 // before}% less)")
+
+        result = await get_cloud_resources.get_resources_in_resource_group(resource_group=RESOURCE_GROUP, subscription_id=SUBSCRIPTION)
+        budgeted = count_tokens(result)
+        print(f"with the {TOOL_OUTPUT_TOKEN_BUDGET} token budget: {budgeted} tokens, {len(result['rows'])} rows, more {result['more']}")
+        assert budgeted <= TOOL_OUTPUT_TOKEN_BUDGET and result["more"]["rows"] == 600 - len(result["rows"])
+        assert sum(result["more"]["type"].values()) == result["more"]["rows"]
+
+        disks = await get_cloud_resources.get_resources_in_resource_group(
+            resource_group=RESOURCE_GROUP, subscription_id=SUBSCRIPTION,
+            resource_type="Microsoft.Compute/Disks", fields=["name", "id"],
+        )
+        expected = sorted(r["name"] for r in resources if r["type"] == "microsoft.compute/disks")
+        assert sorted(row[0] for row in disks["rows"]) == expected and "more" not in disks
+        old_disks = count_tokens(old_resource_listing([r for r in resources if r["type"] == "microsoft.compute/disks"]))
+        print(f"{len(expected)} disks by type filter, name and id: {count_tokens(disks)} tokens (as list of dicts {old_disks})")
+
+        groups = await get_cloud_resources.list_resource_groups(subscription_id=SUBSCRIPTION)
+        assert groups["rows"] == [[RESOURCE_GROUP, resources[0]["location"]]]
+        assert groups["id_prefix"] + RESOURCE_GROUP == f"/subscriptions/{SUBSCRIPTION}/resourceGroups/{RESOURCE_GROUP}"
+
+        profile = {
+            "vm_name": "vm-app-001", "vm_size": "Standard_D4s_v5", "location": "westeurope", "os_type": "Linux",
+            "power_state": "VM running", "provisioning_state": "Succeeded", "max_iops": 6400,
+            "max_throughput_mbps": 144, "max_data_disk_count": 8,
+        }
+        old_profile, new_profile = count_tokens(old_profile_text(profile, "rg-app")), count_tokens({**profile, "resource_group": "rg-app"})
+        print(f"VM profile: indented text {old_profile} tokens, dict {new_profile} tokens")
+        assert table < before / 2 and new_profile < old_profile
+
+        get_timeseries_store().append_records(
+            {"name": f"vm-{i:04d}", "timestamp": "2025-11-07T08:32:14Z", "resourceGroup": "rg-metrics", "metrics": {"iops": i}}
+            for i in range(1000)
+        )
+        aggregates = await get_virtual_machine_metric_aggregates("iops", resource_group="rg-metrics")
+        print(f"iops aggregates of 1000 VMs: {count_tokens(aggregates)} tokens, {len(aggregates['rows'])} rows, more {aggregates['more']}")
+        assert count_tokens(aggregates) <= TOOL_OUTPUT_TOKEN_BUDGET and aggregates["total"] == 1000
+
+        logs = await get_virtual_machine_logs("mcat-dev-weu-vm")
+        assert logs["status"] == "Running" and ["iops", 600] in logs["rows"], logs
+        assert "error" in await get_virtual_machine_logs("vm-missing")
+    finally:
+        await close_clients()
+        await server.stop()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
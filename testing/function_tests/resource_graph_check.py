@@ -0,0 +1,50 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from azure.mgmt.resourcegraph.aio import ResourceGraphClient
+
+from fake_arm_server import FakeArmServer, FakeCredential, generate_inventory
+from tools.resource_graph import ResourceGraphInventory
+
+# Runs the Resource Graph inventory against the fake endpoint and checks the
+# answers against the generated inventory. Listing the same resources through
+# ARM would take one call per resource group plus the resource group list.
+
+
+async def main():
+    server = FakeArmServer(generate_inventory(subscriptions=2, resource_groups=300, resources_per_group=5))
+    url = await server.start()
+    try:
+        async with ResourceGraphClient(credential=FakeCredential(), base_url=url) as client:
+            inventory = ResourceGraphInventory(client, enforce_https=False)
+
+            vms = await inventory.find_resources(resource_type="Microsoft.Compute/virtualMachines")
+            expected = sorted(r["id"] for r in server.resources.values() if r["type"] == "microsoft.compute/virtualmachines")
+            assert sorted(row[-1] for row in vms["rows"]) == expected, "virtual machine ids differ"
+            print(f"find_resources: {len(vms['rows'])} VMs over 300 resource groups, {server.requests['resource_graph']} request(s)")
+
+            everything = await inventory.find_resources()
+            assert len(everything["rows"]) == len(server.resources), "resource count differs"
+            print(f"find_resources: {len(everything['rows'])} resources in {inventory.stats['pages']} pages total so far")
+
+            one_group = await inventory.find_resources(resource_group="RG-042", name_contains="disk")
+            assert all(row[4] == "rg-042" and "disk" in row[0] for row in one_group["rows"])
+
+            summary = await inventory.summarize_resources(group_by="type")
+            assert sum(count for _, count in summary["rows"]) == len(server.resources)
+            print("summarize_resources:", dict(summary["rows"]))
+
+            quoted = await inventory.find_resources(name_contains="it's | not there")
+            assert quoted["rows"] == []
+
+        print(f"ok: {server.requests['resource_graph']} Resource Graph requests, listing through ARM would take {1 + 300}")
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
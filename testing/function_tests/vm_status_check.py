@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from fake_arm_server import FakeArmServer
+
+# Lists the power state of a 200-VM resource group from the fake ARM server
+# (20ms per request): the old list + instance_view per VM loop against the
+# status tool, which reads the instance views from the listing, and the
+# tool's concurrent fallback when the listing comes back without them.
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+VIRTUAL_MACHINES = 200
+
+
+async def main():
+    server = FakeArmServer(resources=[], latency_seconds=0.02)
+    for i in range(VIRTUAL_MACHINES):
+        server.create_resource(SUBSCRIPTION, "rg-fleet", "Microsoft.Compute/virtualMachines", f"vm-{i:03d}")
+    server.create_resource(SUBSCRIPTION, "rg-other", "Microsoft.Compute/virtualMachines", "vm-other")
+    url = await server.start()
+    # The client registry reads the endpoint on import
+    os.environ["AZURE_ARM_ENDPOINT"] = url
+    # The fake server doesn't check tokens, so the clients send none
+    os.environ["AZURE_ARM_TEST_NO_AUTH"] = "true"
+    # Compare every row, not just what fits the model's token budget
+    os.environ["TOOL_OUTPUT_TOKEN_BUDGET"] = "0"
+
+    from tools.azure_clients import close_clients, get_compute_client
+    from tools.get_virtual_machine_context import get_virtual_machines_status
+    from tools.tool_cache import tool_cache
+
+    tool_cache.enabled = False
+    try:
+        compute = get_compute_client(SUBSCRIPTION)
+        started = time.perf_counter()
+        expected = {}
+        async for vm in compute.virtual_machines.list(resource_group_name="rg-fleet"):
+            instance_view = await compute.virtual_machines.instance_view(resource_group_name="rg-fleet", vm_name=vm.name)
+            expected[vm.name] = next(s.code.split("/")[1] for s in instance_view.statuses if s.code.startswith("PowerState/"))
+        serial = time.perf_counter() - started
+        print(f"list + instance_view per VM: {serial:.2f}s, requests {dict(server.requests)}")
+
+        server.requests.clear()
+        started = time.perf_counter()
+        result = await get_virtual_machines_status(subscription_id=SUBSCRIPTION, resource_group="rg-fleet")
+        bulk = time.perf_counter() - started
+        print(f"status tool: {bulk * 1000:.0f}ms, requests {dict(server.requests)}, power states {result['power_states']}")
+        assert result["virtual_machines"] == VIRTUAL_MACHINES and not result["errors"], result
+        assert {row[0]: row[2] for row in result["rows"]} == expected
+        assert server.requests == {"list_virtual_machines": 2}, "expected one paged listing (2 pages of 100)"
+
+        # Subscription-wide with statusOnly=true
+        result = await get_virtual_machines_status(subscription_id=SUBSCRIPTION)
+        assert result["virtual_machines"] == VIRTUAL_MACHINES + 1 and "rg-other" in {row[1] for row in result["rows"]}
+
+        # Listing without instance views: per-VM calls, pipelined
+        server.expand_instance_view = False
+        server.requests.clear()
+        server.peak_in_flight = 0
+        started = time.perf_counter()
+        result = await get_virtual_machines_status(subscription_id=SUBSCRIPTION, resource_group="rg-fleet")
+        fallback = time.perf_counter() - started
+        print(f"fallback: {fallback * 1000:.0f}ms, requests {dict(server.requests)}, peak in flight {server.peak_in_flight}")
+        assert {row[0]: row[2] for row in result["rows"]} == expected
+        assert server.requests["instance_view"] == VIRTUAL_MACHINES and server.peak_in_flight > 1
+        assert fallback < serial / 3
+
+        print("compact table:", result["columns"], result["rows"][:2])
+    finally:
+        await close_clients()
+        await server.stop()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ensure the project root is on sys.path when this test is run from the
+# `testing` directory. This makes the top-level `tools` package importable.
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "function_tests"))
+
+from agent_framework import WorkflowOutputEvent
+
+from fake_arm_server import FakeArmServer, generate_inventory
+
+# Runs the resource group workflow with SQLite checkpoints over a subscription
+# with 4 pages of resource groups, lets ARM fail while page 3 is listed, then
+# resumes the run in a fresh workflow (like a restarted process) and checks it
+# finishes with the same result as an uninterrupted run, without listing and
+# summarizing the first pages again. A copy of the checkpoints checks that a
+# run older than the maximum resume age is deleted instead of resumed.
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+
+
+def without_timings(summary):
+    return {key: value for key, value in summary.items() if key != "slowest_seconds"}
+
+
+async def main():
+    server = FakeArmServer(generate_inventory(subscriptions=2, resource_groups=700, resources_per_group=3), latency_seconds=0.01)
+    url = await server.start()
+    # The client registry reads the endpoint on import
+    os.environ["AZURE_ARM_ENDPOINT"] = url
+    # The fake server doesn't check tokens, so the clients send none
+    os.environ["AZURE_ARM_TEST_NO_AUTH"] = "true"
+    # The fake server doesn't need ARM's read pacing (25/s), it would dominate the timings
+    os.environ["ARM_BUCKET_REFILL_PER_SECOND"] = "1000"
+
+    from tools.azure_clients import close_clients
+    from workflows.checkpoint_storage import SqliteCheckpointStorage
+    from workflows.fetch_resource_groups_wf import CustomEvent, create_resource_group_flow, find_resume_checkpoint
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SqliteCheckpointStorage(str(Path(directory) / "checkpoints.sqlite"))
+        try:
+            started = time.perf_counter()
+            locations, expected = (await create_resource_group_flow().run(SUBSCRIPTION)).get_outputs()
+            uninterrupted = time.perf_counter() - started
+            full_requests = dict(server.requests)
+            print(f"uninterrupted run: {uninterrupted:.2f}s, requests {full_requests}")
+
+            # ARM starts failing once page 2 is in, the fetcher's next page fails the run
+            server.requests.clear()
+            failed = False
+            try:
+                async for event in create_resource_group_flow(checkpoint_storage=storage).run_stream(SUBSCRIPTION):
+                    if isinstance(event, CustomEvent) and str(event.data).startswith("Page 2:"):
+                        server.failing_subscriptions = {SUBSCRIPTION}
+            except Exception as e:
+                failed = True
+                print(f"run failed: {str(e)[:80]}")
+            assert failed, "the listing error should fail a checkpointed run"
+            failed_requests = dict(server.requests)
+
+            checkpoint_id = await find_resume_checkpoint(storage, SUBSCRIPTION)
+            checkpoint = await storage.load_checkpoint(checkpoint_id)
+            print(f"resuming from checkpoint after superstep {checkpoint.iteration_count}, "
+                  f"pending {sum(len(m) for m in checkpoint.messages.values())} messages, {len(await storage.list_checkpoint_ids())} checkpoints kept")
+            assert await find_resume_checkpoint(storage, "11111111-1111-1111-1111-111111111111") is None
+            # A workflow with another pool size can't restore it and starts over instead
+            assert await find_resume_checkpoint(storage, SUBSCRIPTION, create_resource_group_flow(workers=3).graph_signature_hash) is None
+            assert await find_resume_checkpoint(storage, SUBSCRIPTION, create_resource_group_flow().graph_signature_hash) == checkpoint_id
+
+            # A run that failed too long ago is deleted and scanned from the start
+            stale_path = Path(directory) / "stale.sqlite"
+            with sqlite3.connect(stale_path) as copy:
+                storage._connection().backup(copy)
+            await asyncio.sleep(0.01)
+            stale = SqliteCheckpointStorage(str(stale_path), max_resume_age_hours=0.001 / 3600)
+            assert await find_resume_checkpoint(stale, SUBSCRIPTION) is None and not await stale.list_checkpoint_ids()
+
+            # A new workflow object, as after a restart
+            server.failing_subscriptions = set()
+            server.requests.clear()
+            started = time.perf_counter()
+            outputs = []
+            async for event in create_resource_group_flow(checkpoint_storage=storage).run_stream(checkpoint_id=checkpoint_id):
+                if isinstance(event, WorkflowOutputEvent):
+                    outputs.append(event.data)
+            resumed = time.perf_counter() - started
+            print(f"resumed run: {resumed:.2f}s, requests {dict(server.requests)}")
+
+            assert outputs == [locations, outputs[1]] and without_timings(outputs[1]) == without_timings(expected)
+            assert server.requests["list_resource_groups"] == 2, "pages 1 and 2 must not be listed again"
+            assert server.requests["list_resources"] < full_requests["list_resources"] * 3 / 4
+            assert await find_resume_checkpoint(storage, SUBSCRIPTION) is None, "a finished run isn't resumable"
+            assert len(await storage.list_checkpoint_ids()) == 1, "a finished run keeps only its final checkpoint"
+        finally:
+            await close_clients()
+            await server.stop()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Ensure the project root is on sys.path when this test is run from the
+# `testing` directory. This makes the top-level `tools` package importable.
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "function_tests"))
+
+from fake_arm_server import FakeArmServer, generate_inventory
+
+# Runs the resource group workflow against the fake ARM server (30ms per
+# request) with the smallest pool (2 workers) and with the default pool, and
+# checks that the fan-in merges the same summary in a fraction of the time.
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+
+
+async def run(workflow) -> tuple:
+    started = time.perf_counter()
+    result = await workflow.run(message=SUBSCRIPTION)
+    elapsed = time.perf_counter() - started
+    locations, summary = result.get_outputs()
+    return elapsed, locations, summary
+
+
+async def main():
+    server = FakeArmServer(generate_inventory(subscriptions=2, resource_groups=120, resources_per_group=5), latency_seconds=0.03)
+    url = await server.start()
+    # The client registry reads the endpoint on import
+    os.environ["AZURE_ARM_ENDPOINT"] = url
+    # The fake server doesn't check tokens, so the clients send none
+    os.environ["AZURE_ARM_TEST_NO_AUTH"] = "true"
+
+    from tools.azure_clients import close_clients
+    from workflows.fetch_resource_groups_wf import WORKFLOW_FANOUT_WORKERS, create_resource_group_flow
+
+    try:
+        serial, _, expected = await run(create_resource_group_flow(workers=2))
+        print(f"2 workers: {serial:.2f}s, {expected['resource_groups']} resource groups, {expected['resources']} resources")
+
+        server.requests.clear()
+        elapsed, locations, summary = await run(create_resource_group_flow())
+        print(f"{WORKFLOW_FANOUT_WORKERS} workers: {elapsed:.2f}s, slowest resource group {summary['slowest_seconds']:.2f}s, "
+              f"peak requests in flight {server.peak_in_flight}, requests {dict(server.requests)}")
+
+        groups = [g for g in server.resource_groups.values() if g["subscriptionId"] == SUBSCRIPTION]
+        assert locations == sorted({g["location"] for g in groups}) and summary["resource_groups"] == 60 and not summary["errors"]
+        assert {k: v for k, v in summary.items() if k != "slowest_seconds"} == {k: v for k, v in expected.items() if k != "slowest_seconds"}
+        assert summary["resources"] == sum(1 for r in server.resources.values() if r["subscriptionId"] == SUBSCRIPTION)
+        vms = sum(1 for r in server.resources.values() if r["subscriptionId"] == SUBSCRIPTION and r["type"] == "microsoft.compute/virtualmachines")
+        assert sum(summary["power_states"].values()) == vms, summary["power_states"]
+        assert elapsed < serial / 3
+
+        # More workers than resource groups: the empty shares still answer
+        _, _, small = await run(create_resource_group_flow(workers=80))
+        assert small["resource_groups"] == 60
+        print("types:", summary["types"], "power states:", summary["power_states"])
+    finally:
+        await close_clients()
+        await server.stop()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Ensure the project root is on sys.path when this test is run from the
+# `testing` directory. This makes the top-level `tools` package importable.
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "function_tests"))
+
+from agent_framework import WorkflowOutputEvent
+
+from fake_arm_server import FakeArmServer, generate_inventory
+
+# Streams the resource group workflow over a subscription with 4 pages of
+# resource groups (20ms per ARM request) and checks that progress from the
+# executors downstream arrives while the fetcher is still listing, that the
+# locations come out de-duplicated and that the summary covers every group.
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+
+
+async def main():
+    server = FakeArmServer(generate_inventory(subscriptions=2, resource_groups=700, resources_per_group=3), latency_seconds=0.02)
+    url = await server.start()
+    # The client registry reads the endpoint on import
+    os.environ["AZURE_ARM_ENDPOINT"] = url
+    # The fake server doesn't check tokens, so the clients send none
+    os.environ["AZURE_ARM_TEST_NO_AUTH"] = "true"
+    # The fake server doesn't need ARM's read pacing (25/s), it would dominate the timings
+    os.environ["ARM_BUCKET_REFILL_PER_SECOND"] = "1000"
+
+    from tools.azure_clients import close_clients
+    from workflows.fetch_resource_groups_wf import CustomEvent, create_resource_group_flow
+
+    workflow = create_resource_group_flow()
+    try:
+        for run in range(2):
+            started = time.perf_counter()
+            timeline, outputs = [], []
+            async for event in workflow.run_stream(SUBSCRIPTION):
+                if isinstance(event, CustomEvent):
+                    timeline.append((time.perf_counter() - started, event.data))
+                elif isinstance(event, WorkflowOutputEvent):
+                    outputs.append(event.data)
+            elapsed = time.perf_counter() - started
+
+            locations, summary = outputs
+            listed = next(at for at, message in timeline if message.startswith("Found "))
+            first_summary = next(at for at, message in timeline if message.startswith("Page 1: summarized"))
+            first_locations = next(at for at, message in timeline if message.startswith("New locations on page 1"))
+            print(f"run {run + 1}: first locations after {first_locations * 1000:.0f}ms, first summaries after "
+                  f"{first_summary * 1000:.0f}ms, listing done after {listed * 1000:.0f}ms, finished after {elapsed * 1000:.0f}ms")
+
+            expected_groups = [g for g in server.resource_groups.values() if g["subscriptionId"] == SUBSCRIPTION]
+            assert sum(1 for _, message in timeline if message.startswith("Page ") and "resource groups," in message) == 3
+            assert first_summary < listed, "downstream work should overlap with the listing"
+            assert locations == sorted({group["location"] for group in expected_groups}), locations
+            assert summary["resource_groups"] == len(expected_groups) == len(summary["rows"]) and not summary["errors"]
+            assert summary["resources"] == sum(1 for r in server.resources.values() if r["subscriptionId"] == SUBSCRIPTION)
+
+        # A listing that breaks off after the first page still finishes with what it has
+        server.failing_subscriptions = {SUBSCRIPTION}
+        result = await workflow.run(SUBSCRIPTION)
+        locations, summary = result.get_outputs()
+        assert locations == [] and summary["resource_groups"] == 0 and summary["errors"], summary
+        print("listing error:", summary["errors"][0]["error"][:80])
+    finally:
+        await close_clients()
+        await server.stop()
+    print("ok")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
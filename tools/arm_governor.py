@@ -0,0 +1,264 @@
+import asyncio
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from azure.core.exceptions import AzureError
+from azure.core.pipeline import PipelineRequest, PipelineResponse
+from azure.core.pipeline.policies import AsyncHTTPPolicy, AsyncRetryPolicy
+
+from tools.fanout import remaining_reads, retry_after_seconds
+
+# Shared request governor in front of every ARM call.
+#
+# All management clients from tools/azure_clients.py send their requests
+# through ArmGovernorPolicy (one pipeline step after the retry policy, so
+# every attempt is governed). Per scope (a subscription, or the tenant for
+# calls outside one) it keeps:
+#
+#   - a token bucket sized like ARM's own read bucket, so bursts from many
+#     tools and conversations queue up locally instead of being rejected;
+#   - the remaining-quota headers ARM sends back, which drain the bucket
+#     when another client of the same principal spent the quota;
+#   - a shared hold after a 429: Retry-After plus jitter, so concurrent
+#     calls to the throttled scope wait together and don't retry in lockstep;
+#   - a circuit breaker that fails calls fast while most recent calls to the
+#     scope failed, and lets one probe through after a cooldown.
+#
+# Calls that would have to wait too long, or hit an open circuit, fail with
+# an error telling the model to stop retrying for a while, instead of the
+# model answering throttling with even more calls.
+
+ARM_GOVERNOR_ENABLED = os.getenv("ARM_GOVERNOR_ENABLED", "true").lower() in ("1", "true", "yes")
+# ARM refills a subscription's read bucket at 25 requests/s up to 250
+ARM_BUCKET_CAPACITY = float(os.getenv("ARM_BUCKET_CAPACITY", "250"))
+ARM_BUCKET_REFILL_PER_SECOND = float(os.getenv("ARM_BUCKET_REFILL_PER_SECOND", "25"))
+ARM_MAX_WAIT_SECONDS = float(os.getenv("ARM_MAX_WAIT_SECONDS", "30"))
+ARM_CIRCUIT_WINDOW = int(os.getenv("ARM_CIRCUIT_WINDOW", "20"))
+ARM_CIRCUIT_MIN_REQUESTS = int(os.getenv("ARM_CIRCUIT_MIN_REQUESTS", "10"))
+ARM_CIRCUIT_ERROR_RATE = float(os.getenv("ARM_CIRCUIT_ERROR_RATE", "0.5"))
+ARM_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("ARM_CIRCUIT_COOLDOWN_SECONDS", "30"))
+ARM_RETRY_TOTAL = int(os.getenv("ARM_RETRY_TOTAL", "5"))
+
+TENANT_SCOPE = "tenant"
+_SUBSCRIPTION_PATH = re.compile(r"/subscriptions/([0-9a-fA-F-]{36})", re.IGNORECASE)
+
+
+class ArmThrottledError(AzureError):
+    """ The scope is throttled for longer than a caller should wait."""
+
+
+class ArmCircuitOpenError(AzureError):
+    """ Most recent calls to the scope failed, calls fail fast until the cooldown ends."""
+
+
+def _jitter(seconds: float) -> float:
+    return seconds * random.uniform(1.0, 1.25)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float = ARM_BUCKET_CAPACITY, refill_per_second: float = ARM_BUCKET_REFILL_PER_SECOND):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.held_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """ Take a token, return how long to wait before using it (tokens go negative as a queue)."""
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.refill_per_second if self.tokens < 0 else 0.0
+        return max(wait, self.held_until - now)
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def sync_remaining(self, remaining: int, now: float) -> None:
+        """ ARM knows better: never assume more tokens than its remaining quota."""
+        self._refill(now)
+        self.tokens = min(self.tokens, float(remaining))
+
+    def hold(self, seconds: float, now: float) -> None:
+        self.held_until = max(self.held_until, now + seconds)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        window: int = ARM_CIRCUIT_WINDOW,
+        min_requests: int = ARM_CIRCUIT_MIN_REQUESTS,
+        error_rate: float = ARM_CIRCUIT_ERROR_RATE,
+        cooldown_seconds: float = ARM_CIRCUIT_COOLDOWN_SECONDS,
+    ):
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    def before_request(self, now: float) -> Optional[float]:
+        """ None if the call may go ahead, else the seconds until the circuit lets a probe through."""
+        if self.state == "closed":
+            return None
+        remaining = self.opened_at + self.cooldown_seconds - now
+        if remaining > 0:
+            return remaining
+        if self._probe_started is not None and now - self._probe_started < self.cooldown_seconds:
+            # One probe at a time while half-open (a probe that never reported back expires)
+            return self.cooldown_seconds
+        self.state = "half_open"
+        self._probe_started = now
+        return None
+
+    def record(self, success: bool, now: float) -> None:
+        if self.state == "half_open":
+            self._probe_started = None
+            if success:
+                self.state = "closed"
+                self.outcomes.clear()
+            else:
+                self._open(now)
+            return
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_requests and failures / len(self.outcomes) >= self.error_rate:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self.outcomes.clear()
+
+
+class ArmGovernor:
+    def __init__(
+        self,
+        capacity: float = ARM_BUCKET_CAPACITY,
+        refill_per_second: float = ARM_BUCKET_REFILL_PER_SECOND,
+        max_wait_seconds: float = ARM_MAX_WAIT_SECONDS,
+        circuit_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_wait_seconds = max_wait_seconds
+        self.circuit_options = circuit_options or {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._circuits: Dict[str, CircuitBreaker] = {}
+        self.stats = {"requests": 0, "waited": 0, "wait_seconds": 0.0, "throttled": 0, "rejected": 0, "circuit_open": 0}
+
+    @staticmethod
+    def scope_of(url: str) -> str:
+        match = _SUBSCRIPTION_PATH.search(url)
+        return match.group(1).lower() if match else TENANT_SCOPE
+
+    def bucket(self, scope: str) -> TokenBucket:
+        bucket = self._buckets.get(scope)
+        if bucket is None:
+            bucket = self._buckets[scope] = TokenBucket(self.capacity, self.refill_per_second)
+        return bucket
+
+    def circuit(self, scope: str) -> CircuitBreaker:
+        circuit = self._circuits.get(scope)
+        if circuit is None:
+            circuit = self._circuits[scope] = CircuitBreaker(**self.circuit_options)
+        return circuit
+
+    async def acquire(self, scope: str) -> None:
+        now = time.monotonic()
+        self.stats["requests"] += 1
+        blocked = self.circuit(scope).before_request(now)
+        if blocked is not None:
+            self.stats["circuit_open"] += 1
+            raise ArmCircuitOpenError(
+                f"Azure Resource Manager calls for {scope} are failing, paused for {blocked:.0f}s. "
+                "Don't retry this call now, tell the user the data is temporarily unavailable."
+            )
+
+        bucket = self.bucket(scope)
+        wait = bucket.reserve(now)
+        if wait > self.max_wait_seconds:
+            bucket.refund()
+            self.stats["rejected"] += 1
+            raise ArmThrottledError(
+                f"Azure Resource Manager is throttling {scope}, the next call can go out in about {wait:.0f}s. "
+                "Don't retry this call now."
+            )
+        if wait > 0:
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] += wait
+            await asyncio.sleep(wait)
+        # A 429 may have put the scope on hold while we were queued
+        while bucket.held_until > time.monotonic():
+            await asyncio.sleep(bucket.held_until - time.monotonic())
+
+    def observe(self, scope: str, status_code: int, headers) -> None:
+        now = time.monotonic()
+        bucket = self.bucket(scope)
+        remaining = remaining_reads(headers)
+        if remaining is not None:
+            bucket.sync_remaining(remaining, now)
+        if status_code == 429:
+            self.stats["throttled"] += 1
+            bucket.hold(_jitter(retry_after_seconds(headers, default=1.0)), now)
+        # Throttling is handled by the hold above, only server errors count against the circuit
+        self.circuit(scope).record(success=status_code < 500, now=now)
+
+    def observe_error(self, scope: str) -> None:
+        """ The request didn't get a response at all (connection reset, timeout)."""
+        self.circuit(scope).record(success=False, now=time.monotonic())
+
+
+class ArmGovernorPolicy(AsyncHTTPPolicy):
+    """ Pipeline step that sends every attempt through the governor."""
+
+    def __init__(self, governor: "ArmGovernor"):
+        super().__init__()
+        self.governor = governor
+
+    async def send(self, request: PipelineRequest) -> PipelineResponse:
+        scope = self.governor.scope_of(request.http_request.url)
+        await self.governor.acquire(scope)
+        try:
+            response = await self.next.send(request)
+        except (ArmThrottledError, ArmCircuitOpenError):
+            raise
+        except AzureError:
+            self.governor.observe_error(scope)
+            raise
+        self.governor.observe(scope, response.http_response.status_code, response.http_response.headers)
+        return response
+
+
+class JitteredRetryPolicy(AsyncRetryPolicy):
+    """ Exponential backoff with jitter, so clients that failed together don't retry together."""
+
+    def increment(self, settings: Dict[str, Any], response=None, error: Optional[Exception] = None) -> bool:
+        # The governor's own refusals must reach the caller, retrying them is what they prevent
+        if isinstance(error, (ArmThrottledError, ArmCircuitOpenError)):
+            return False
+        return super().increment(settings, response=response, error=error)
+
+    def get_backoff_time(self, settings: Dict[str, Any]) -> float:
+        backoff = super().get_backoff_time(settings)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+governor = ArmGovernor()
+
+
+def governed_client_kwargs(arm_governor: Optional[ArmGovernor] = None) -> Dict[str, Any]:
+    """ Client constructor arguments that put a management client behind the governor."""
+    return {
+        "per_retry_policies": [ArmGovernorPolicy(arm_governor or governor)],
+        "retry_policy": JitteredRetryPolicy(retry_total=ARM_RETRY_TOTAL),
+    }
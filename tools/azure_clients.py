@@ -0,0 +1,132 @@
+import asyncio
+import inspect
+import os
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Type, TypeVar
+
+if TYPE_CHECKING:
+    from tools.credentials import CachedAsyncCredential
+
+# Process-wide registry of async Azure management clients.
+#
+# Every management client owns its own HTTP pipeline and connection pool, so
+# building one per tool call means a cold TLS connection and a fresh token
+# lookup each time. Clients are created once per (client type, subscription)
+# and reused by all tools and workflow executors.
+#
+# The aio clients hold an aiohttp session which is bound to the event loop it
+# was created on, so the registry is kept per running loop.
+#
+# Every client sends its requests through the shared ARM governor (see
+# tools/arm_governor.py), which paces and sheds calls per subscription, and
+# authenticates with the lazily created, token-caching credential from
+# tools/credentials.py.
+#
+# azure-core, azure-identity and the management SDKs are imported when the
+# first client is built, not when a tool module imports this one.
+
+ClientT = TypeVar("ClientT")
+
+# Points every client at another management endpoint, e.g. the fake server in
+# testing/function_tests.
+AZURE_ARM_ENDPOINT = os.getenv("AZURE_ARM_ENDPOINT")
+# Test only: send requests to a plain http AZURE_ARM_ENDPOINT without a token,
+# for the fake server, which doesn't check them. Never set it in a deployment.
+AZURE_ARM_TEST_NO_AUTH = os.getenv("AZURE_ARM_TEST_NO_AUTH", "false").lower() in ("1", "true", "yes")
+
+
+class _LoopClients:
+    def __init__(self):
+        self.credential = None
+        self.clients: Dict[Tuple[type, Optional[str]], Any] = {}
+
+
+_registries: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients]" = weakref.WeakKeyDictionary()
+
+
+def _registry() -> _LoopClients:
+    loop = asyncio.get_running_loop()
+    registry = _registries.get(loop)
+    if registry is None:
+        registry = _registries[loop] = _LoopClients()
+    return registry
+
+
+def get_credential() -> "CachedAsyncCredential":
+    """ Return the async credential shared by all registered clients, creating it on first use."""
+    registry = _registry()
+    if registry.credential is None:
+        from tools.credentials import CachedAsyncCredential
+
+        registry.credential = CachedAsyncCredential()
+    return registry.credential
+
+
+def get_client(client_type: Type[ClientT], subscription_id: Optional[str], **client_kwargs) -> ClientT:
+    """ Return the pooled client of the given type for a subscription (None for tenant-wide clients)."""
+    registry = _registry()
+    key = (client_type, subscription_id)
+    client = registry.clients.get(key)
+    if client is None:
+        if subscription_id is not None:
+            client_kwargs["subscription_id"] = subscription_id
+        from tools.arm_governor import ARM_GOVERNOR_ENABLED, governed_client_kwargs
+
+        if ARM_GOVERNOR_ENABLED:
+            for name, value in governed_client_kwargs().items():
+                client_kwargs.setdefault(name, value)
+        if AZURE_ARM_ENDPOINT:
+            client_kwargs.setdefault("base_url", AZURE_ARM_ENDPOINT)
+            if AZURE_ARM_TEST_NO_AUTH and AZURE_ARM_ENDPOINT.startswith("http://"):
+                from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+                client_kwargs.setdefault("authentication_policy", SansIOHTTPPolicy())
+        client = client_type(credential=get_credential(), **client_kwargs)
+        registry.clients[key] = client
+    return client
+
+
+def get_resource_client(subscription_id: str):
+    """ Return the pooled async ResourceManagementClient for a subscription."""
+    from azure.mgmt.resource.resources.aio import ResourceManagementClient
+
+    return get_client(ResourceManagementClient, subscription_id)
+
+
+def get_compute_client(subscription_id: str):
+    """ Return the pooled async ComputeManagementClient for a subscription."""
+    from azure.mgmt.compute.aio import ComputeManagementClient
+
+    return get_client(ComputeManagementClient, subscription_id)
+
+
+def get_subscription_client():
+    """ Return the pooled async SubscriptionClient, which lists the subscriptions the credential can see."""
+    from azure.mgmt.resource.subscriptions.aio import SubscriptionClient
+
+    return get_client(SubscriptionClient, None)
+
+
+def get_resource_graph_client():
+    """ Return the pooled async ResourceGraphClient, queries are scoped per request not per client."""
+    from azure.mgmt.resourcegraph.aio import ResourceGraphClient
+
+    return get_client(ResourceGraphClient, None)
+
+
+async def close_clients() -> None:
+    """ Close every client and the credential registered on the running loop."""
+    registry = _registries.pop(asyncio.get_running_loop(), None)
+    if registry is None:
+        return
+
+    for client in registry.clients.values():
+        try:
+            result = client.close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"couldn't close client {client}: {e}")
+
+    if registry.credential is not None:
+        await registry.credential.close()
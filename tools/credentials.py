@@ -0,0 +1,403 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from azure.core.credentials import AccessToken
+
+# Shared Azure credentials with a token cache that outlives the process.
+#
+# DefaultAzureCredential walks its whole chain on first use and several of
+# its links (Azure CLI, Azure Developer CLI, PowerShell) don't cache tokens
+# at all, so every new client pipeline, and every restart, paid for a fresh
+# token. The credentials here are created on first use, never at import, and
+# put one process-wide TokenCache in front of the real credential:
+#
+#   - tokens are kept in memory per (scopes, tenant) and written to a small
+#     file (owner read/write only), so a restarted bot reuses the token it
+#     had instead of authenticating again;
+#   - a token is refreshed in the background AZURE_TOKEN_REFRESH_MARGIN_SECONDS
+#     before it expires, as long as it was used since it was fetched, so calls
+#     never wait on a token refresh;
+#   - concurrent callers asking for the same missing token share one request.
+#
+# Claims challenges (CAE) always go to the real credential.
+#
+# Tokens read back from the file are only served if the identity in their
+# claims (tenant, app or user) is the one the environment is set up to
+# authenticate as: AZURE_CLIENT_ID / AZURE_USERNAME / AZURE_TENANT_ID, or else
+# the account `az login` selected. When that can't be told without
+# authenticating, e.g. a system-assigned managed identity, the file isn't
+# used. A freshly fetched token for another principal than the ones read from
+# disk also drops those.
+
+AZURE_TOKEN_CACHE_PERSIST = os.getenv("AZURE_TOKEN_CACHE_PERSIST", "true").lower() in ("1", "true", "yes")
+AZURE_TOKEN_CACHE_PATH = os.getenv(
+    "AZURE_TOKEN_CACHE_PATH", str(Path(__file__).resolve().parents[1] / "data" / "token_cache.json")
+)
+AZURE_TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("AZURE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+# Scope for Azure OpenAI when authenticating with Entra ID instead of a key
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+# Tokens that expire within this many seconds are never handed out
+_MIN_VALIDITY_SECONDS = 30
+
+CacheKey = Tuple[Tuple[str, ...], Optional[str]]
+
+
+def _token_claims(token: str) -> Dict[str, Any]:
+    """ The claims of a JWT access token, unverified: only used to tell whose token it is."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        return {}
+    return claims if isinstance(claims, dict) else {}
+
+
+def _token_identity(token: str) -> Dict[str, str]:
+    """ Tenant, object id, app id and user name of a token, lowercased, as far as it has them."""
+    claims = _token_claims(token)
+    identity = {
+        "tid": claims.get("tid"),
+        "oid": claims.get("oid"),
+        "appid": claims.get("appid") or claims.get("azp"),
+        "upn": claims.get("upn") or claims.get("unique_name") or claims.get("preferred_username"),
+    }
+    return {name: str(value).lower() for name, value in identity.items() if value}
+
+
+def _azure_cli_identity() -> Optional[Dict[str, str]]:
+    """ The account `az login` / `az account set` selected, from the CLI's profile file."""
+    config_dir = Path(os.getenv("AZURE_CONFIG_DIR") or Path.home() / ".azure")
+    try:
+        # The CLI writes the file with a BOM
+        profile = json.loads((config_dir / "azureProfile.json").read_text(encoding="utf-8-sig"))
+    except (OSError, ValueError):
+        return None
+    for subscription in profile.get("subscriptions", []):
+        if subscription.get("isDefault"):
+            user = subscription.get("user") or {}
+            if not user.get("name") or not subscription.get("tenantId"):
+                return None
+            name = "upn" if user.get("type") == "user" else "appid"
+            return {name: user["name"].lower(), "tid": subscription["tenantId"].lower()}
+    return None
+
+
+def _expected_identity() -> Optional[Dict[str, str]]:
+    """ Who the environment authenticates as, as far as that is known without authenticating, or None."""
+    tenant_id = os.getenv("AZURE_TENANT_ID")
+    identity = {"tid": tenant_id.lower()} if tenant_id else {}
+    if os.getenv("AZURE_CLIENT_ID"):
+        return {**identity, "appid": os.environ["AZURE_CLIENT_ID"].lower()}
+    if os.getenv("AZURE_USERNAME"):
+        return {**identity, "upn": os.environ["AZURE_USERNAME"].lower()}
+    return _azure_cli_identity()
+
+
+def _same_principal(identity: Dict[str, str], other: Dict[str, str]) -> bool:
+    return bool(identity) and all(identity.get(name) == value for name, value in other.items() if name in ("tid", "oid"))
+
+
+class TokenCache:
+    def __init__(
+        self,
+        path: Optional[str] = AZURE_TOKEN_CACHE_PATH if AZURE_TOKEN_CACHE_PERSIST else None,
+        refresh_margin_seconds: float = AZURE_TOKEN_REFRESH_MARGIN_SECONDS,
+    ):
+        self.path = Path(path) if path else None
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._tokens: Dict[CacheKey, "AccessToken"] = {}
+        # Identity of each token read from disk, checked against freshly fetched ones
+        self._from_disk: Dict[CacheKey, Dict[str, str]] = {}
+        self._last_used: Dict[CacheKey, float] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "loaded_from_disk": 0}
+
+    @staticmethod
+    def key(scopes, tenant_id: Optional[str]) -> CacheKey:
+        return tuple(sorted(scopes)), tenant_id
+
+    def get(self, key: CacheKey) -> Optional["AccessToken"]:
+        """ A cached token that is still valid for a while, or None."""
+        with self._lock:
+            self._load()
+            token = self._tokens.get(key)
+            if token is None or token.expires_on - time.time() < _MIN_VALIDITY_SECONDS:
+                self.stats["misses"] += 1
+                return None
+            self._last_used[key] = time.monotonic()
+            self.stats["hits"] += 1
+            return token
+
+    def needs_refresh(self, key: CacheKey) -> bool:
+        token = self._tokens.get(key)
+        return token is None or token.expires_on - time.time() < self.refresh_margin_seconds
+
+    def used_since(self, key: CacheKey, since: float) -> bool:
+        return self._last_used.get(key, 0.0) >= since
+
+    def put(self, key: CacheKey, token: "AccessToken") -> None:
+        with self._lock:
+            self._load()
+            if self._from_disk:
+                # Fail closed: tokens from disk for another principal than this fresh one are dropped
+                identity = _token_identity(token.token)
+                for other_key, other_identity in list(self._from_disk.items()):
+                    if other_key == key or not _same_principal(identity, other_identity):
+                        self._tokens.pop(other_key, None)
+                    del self._from_disk[other_key]
+            self._tokens[key] = token
+            self._last_used.setdefault(key, time.monotonic())
+            self._save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._last_used.clear()
+            self._from_disk.clear()
+            if self.path is not None and self.path.exists():
+                self.path.unlink()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.path is None or not self.path.exists():
+            return
+        # Checked on first use so a .env loaded after import still counts
+        expected = _expected_identity()
+        if expected is None:
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"couldn't read token cache {self.path}: {e}")
+            return
+        from azure.core.credentials import AccessToken
+
+        now = time.time()
+        for entry in data.get("tokens", []):
+            if entry["expires_on"] - now <= _MIN_VALIDITY_SECONDS:
+                continue
+            identity = _token_identity(entry["token"])
+            # A token for an explicitly requested tenant carries that tenant
+            wanted = {**expected, "tid": entry["tenant_id"].lower()} if entry.get("tenant_id") else expected
+            if not identity or any(identity.get(name) != value for name, value in wanted.items()):
+                continue
+            key = self.key(entry["scopes"], entry.get("tenant_id"))
+            self._tokens[key] = AccessToken(entry["token"], int(entry["expires_on"]))
+            self._from_disk[key] = identity
+            self.stats["loaded_from_disk"] += 1
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        now = time.time()
+        data = {
+            "tokens": [
+                {"scopes": list(scopes), "tenant_id": tenant_id, "token": token.token, "expires_on": token.expires_on}
+                for (scopes, tenant_id), token in self._tokens.items()
+                if token.expires_on > now
+            ],
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            # Access tokens are secrets, only the owner may read the file
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"couldn't write token cache {self.path}: {e}")
+
+
+token_cache = TokenCache()
+
+
+def _default_async_credential():
+    from azure.identity.aio import DefaultAzureCredential
+
+    return DefaultAzureCredential()
+
+
+def _default_sync_credential():
+    from azure.identity import DefaultAzureCredential
+
+    return DefaultAzureCredential()
+
+
+class CachedAsyncCredential:
+    """ AsyncTokenCredential that creates the real credential on first use and answers from token_cache."""
+
+    def __init__(self, factory: Callable[[], Any] = _default_async_credential, cache: Optional[TokenCache] = None):
+        self._factory = factory
+        self._credential = None
+        self.cache = cache or token_cache
+        self._pending: Dict[CacheKey, asyncio.Future] = {}
+        self._refresh_tasks: Dict[CacheKey, Tuple[asyncio.Task, float]] = {}
+
+    @property
+    def credential(self):
+        if self._credential is None:
+            self._credential = self._factory()
+        return self._credential
+
+    async def get_token(self, *scopes: str, claims: Optional[str] = None, tenant_id: Optional[str] = None, **kwargs) -> "AccessToken":
+        if claims:
+            return await self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+
+        key = self.cache.key(scopes, tenant_id)
+        token = self.cache.get(key)
+        if token is not None:
+            # Also covers tokens loaded from disk, which have no refresh scheduled yet
+            delay = token.expires_on - time.time() - self.cache.refresh_margin_seconds
+            self._schedule_refresh(key, scopes, tenant_id, delay=delay)
+            return token
+        return await self._fetch(key, scopes, tenant_id, **kwargs)
+
+    async def _fetch(self, key: CacheKey, scopes, tenant_id: Optional[str], **kwargs) -> "AccessToken":
+        pending = self._pending.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request we were waiting for was cancelled, not us: make our own
+                return await self._fetch(key, scopes, tenant_id, **kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            token = await self.credential.get_token(*scopes, tenant_id=tenant_id, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting, don't log "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            self.cache.put(key, token)
+            future.set_result(token)
+        finally:
+            self._pending.pop(key, None)
+
+        delay = token.expires_on - time.time() - self.cache.refresh_margin_seconds
+        self._schedule_refresh(key, scopes, tenant_id, delay=delay * random.uniform(0.9, 1.0))
+        return token
+
+    def _schedule_refresh(self, key: CacheKey, scopes, tenant_id: Optional[str], delay: float) -> None:
+        due = time.monotonic() + max(delay, 0.0)
+        scheduled = self._refresh_tasks.get(key)
+        if scheduled is not None and not scheduled[0].done():
+            if scheduled[1] <= due:
+                return
+            # Only a refresh that is still sleeping gets here, never one in flight
+            scheduled[0].cancel()
+        task = asyncio.get_running_loop().create_task(self._refresh_later(key, scopes, tenant_id, delay))
+        self._refresh_tasks[key] = (task, due)
+
+    async def _refresh_later(self, key: CacheKey, scopes, tenant_id: Optional[str], delay: float) -> None:
+        scheduled = time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            # Tokens nobody asked for since the last fetch are left to expire
+            if not self.cache.used_since(key, scheduled):
+                return
+        self._refresh_tasks.pop(key, None)
+        try:
+            await self._fetch(key, scopes, tenant_id)
+            self.cache.stats["refreshes"] += 1
+        except Exception as e:
+            # The cached token is still valid, the next caller tries again
+            print(f"background token refresh for {key[0]} failed: {e}")
+
+    async def close(self) -> None:
+        for task, _ in self._refresh_tasks.values():
+            task.cancel()
+        self._refresh_tasks.clear()
+        if self._credential is not None:
+            await self._credential.close()
+            self._credential = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+
+class CachedCredential:
+    """ Synchronous TokenCredential on the same token_cache, for the sync SDK clients."""
+
+    def __init__(self, factory: Callable[[], Any] = _default_sync_credential, cache: Optional[TokenCache] = None):
+        self._factory = factory
+        self._credential = None
+        self.cache = cache or token_cache
+        self._lock = threading.Lock()
+
+    @property
+    def credential(self):
+        with self._lock:
+            if self._credential is None:
+                self._credential = self._factory()
+            return self._credential
+
+    def get_token(self, *scopes: str, claims: Optional[str] = None, tenant_id: Optional[str] = None, **kwargs) -> "AccessToken":
+        if claims:
+            return self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+
+        key = self.cache.key(scopes, tenant_id)
+        token = self.cache.get(key)
+        # No background task here, refresh inline once the token is within the margin
+        if token is not None and not self.cache.needs_refresh(key):
+            return token
+        try:
+            token = self.credential.get_token(*scopes, tenant_id=tenant_id, **kwargs)
+        except Exception:
+            if token is not None:
+                return token
+            raise
+        self.cache.put(key, token)
+        return token
+
+    def close(self) -> None:
+        if self._credential is not None:
+            self._credential.close()
+            self._credential = None
+
+
+_sync_credential: Optional[CachedCredential] = None
+
+
+def get_sync_credential() -> CachedCredential:
+    """ Return the process-wide synchronous credential, creating it on first use."""
+    global _sync_credential
+    if _sync_credential is None:
+        _sync_credential = CachedCredential()
+    return _sync_credential
+
+
+def openai_token_provider(scope: str = COGNITIVE_SERVICES_SCOPE) -> Callable[[], Any]:
+    """ An async azure_ad_token_provider for the OpenAI clients, served from the shared token cache."""
+
+    async def provide_token() -> str:
+        from tools.azure_clients import get_credential
+
+        return (await get_credential().get_token(scope)).token
+
+    return provide_token
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, Set, Tuple, TypeVar
+
+# Bounded, throttling-aware fan-out of one ARM call over many subscriptions.
+#
+# AdaptiveLimiter caps the number of calls in flight and adapts the cap to
+# what ARM reports back: every response's x-ms-ratelimit-remaining-*-reads
+# header and 429s are fed to observe() (wire it up as the call's
+# raw_response_hook). A throttled response halves the cap and holds new
+# calls back for Retry-After, a nearly spent quota lowers it by one, and
+# healthy responses raise it again by one, so a 40-subscription fan-out runs
+# as wide as the quota allows without tipping the tenant into throttling.
+
+FANOUT_MAX_CONCURRENCY = int(os.getenv("FANOUT_MAX_CONCURRENCY", "8"))
+# Remaining reads below which the limiter backs off
+FANOUT_LOW_REMAINING_READS = int(os.getenv("FANOUT_LOW_REMAINING_READS", "100"))
+
+RATE_LIMIT_HEADERS = (
+    "x-ms-ratelimit-remaining-subscription-reads",
+    "x-ms-ratelimit-remaining-tenant-reads",
+)
+
+T = TypeVar("T")
+
+
+def remaining_reads(headers) -> Optional[int]:
+    """ The lowest remaining-reads quota in a response's headers, if any."""
+    values = []
+    for header in RATE_LIMIT_HEADERS:
+        value = headers.get(header)
+        if value is not None:
+            try:
+                values.append(int(value))
+            except ValueError:
+                pass
+    return min(values) if values else None
+
+
+def retry_after_seconds(headers, default: float = 0.0) -> float:
+    value = headers.get("retry-after")
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        max_concurrency: int = FANOUT_MAX_CONCURRENCY,
+        min_concurrency: int = 1,
+        low_remaining_reads: int = FANOUT_LOW_REMAINING_READS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.low_remaining_reads = low_remaining_reads
+        self.limit = max_concurrency
+        self._active = 0
+        self._paused_until = 0.0
+        self._changed: Optional[asyncio.Condition] = None
+        # The event loop only keeps weak references to tasks, these are held until they ran
+        self._notifications: Set[asyncio.Task] = set()
+        self.stats = {"calls": 0, "throttled": 0, "backoffs": 0, "peak_concurrency": 0}
+
+    @property
+    def changed(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.changed:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self.changed.wait(), timeout=pause)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self._active < self.limit:
+                    break
+                await self.changed.wait()
+            self._active += 1
+            self.stats["calls"] += 1
+            self.stats["peak_concurrency"] = max(self.stats["peak_concurrency"], self._active)
+        try:
+            yield
+        finally:
+            async with self.changed:
+                self._active -= 1
+                self.changed.notify_all()
+
+    def observe(self, response) -> None:
+        """ raw_response_hook: adapt the cap to a response's status and quota headers."""
+        http_response = getattr(response, "http_response", response)
+        headers = http_response.headers
+        remaining = remaining_reads(headers)
+        if http_response.status_code == 429:
+            self.stats["throttled"] += 1
+            now = time.monotonic()
+            # Calls already in flight get throttled together, halve once per pause
+            if now >= self._paused_until:
+                self.stats["backoffs"] += 1
+                self.limit = max(self.min_concurrency, self.limit // 2)
+            self._paused_until = max(self._paused_until, now + retry_after_seconds(headers, default=1.0))
+        elif remaining is not None and remaining < self.low_remaining_reads:
+            if self.limit > self.min_concurrency:
+                self.stats["backoffs"] += 1
+                self.limit -= 1
+        elif self.limit < self.max_concurrency:
+            self.limit += 1
+            self._notify()
+
+    def _notify(self) -> None:
+        # observe() is called from inside the pipeline, wake waiters without blocking on the condition
+        condition = self._changed
+        if condition is None:
+            return
+
+        async def notify():
+            async with condition:
+                condition.notify_all()
+
+        task = asyncio.get_running_loop().create_task(notify())
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+
+async def fan_out(
+    keys: Iterable[str],
+    call: Callable[[str], Awaitable[T]],
+    limiter: Optional[AdaptiveLimiter] = None,
+) -> AsyncIterator[Tuple[str, Optional[T], Optional[Exception]]]:
+    """ Run call(key) for every key within the limiter, yield (key, result, error) as they finish."""
+    limiter = limiter or AdaptiveLimiter()
+
+    async def run(key: str) -> Tuple[str, Optional[T], Optional[Exception]]:
+        async with limiter.slot():
+            try:
+                return key, await call(key), None
+            except Exception as e:
+                return key, None, e
+
+    tasks = [asyncio.ensure_future(run(key)) for key in dict.fromkeys(keys)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
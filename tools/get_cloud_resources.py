@@ -1,70 +1,247 @@
 import asyncio
 import os
-from typing import Annotated, Any, Dict, List
+from typing import Annotated, Any, Dict, List, Optional
 
 from agent_framework import ai_function
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
 from dotenv import load_dotenv
 from pydantic import Field
 
+from tools.azure_clients import get_resource_client, get_subscription_client
+from tools.fanout import AdaptiveLimiter, fan_out
+from tools.inventory_snapshot import InventorySnapshot, ResourceGraphChangeFeed
+from tools.output_encoder import compact_table, encode_table, filter_records
+from tools.resource_graph import get_inventory
+from tools.tool_cache import cached_tool
+
 load_dotenv()
 
-credential = DefaultAzureCredential()
 subscription_id = os.getenv("AZURE_SUBSCRIPTION_ID")
 
+RESOURCE_COLUMNS = ["name", "type", "location", "kind", "id"]
+
+
+async def fetch_subscription_ids() -> List[str]:
+    """ List the enabled subscriptions the credential can see."""
+    subscription_client = get_subscription_client()
+    subscription_ids = []
+    async for subscription in subscription_client.subscriptions.list():
+        state = getattr(subscription.state, "value", subscription.state) or "Enabled"
+        if state.lower() not in ("disabled", "deleted"):
+            subscription_ids.append(subscription.subscription_id)
+    return subscription_ids
+
+
+async def fetch_resource_groups(subscription_id: str, **list_kwargs) -> List[Dict[str, Any]]:
+    """ List the resource groups of a subscription from ARM."""
+    resource_group_list = []
+    resource_client = get_resource_client(subscription_id)
+
+    async for resource_group in resource_client.resource_groups.list(**list_kwargs):
+        resource_group_list.append({
+            "id": resource_group.id, 
+            "name": resource_group.name, 
+            "location": resource_group.location,
+            "tags": resource_group.tags or {},
+        })
+    return resource_group_list
+
+
+async def fetch_resources_in_resource_group(subscription_id: str, resource_group: str) -> List[Dict[str, Any]]:
+    """ List the resources of a resource group from ARM."""
+    resource_client = get_resource_client(subscription_id)
+
+    resources = resource_client.resources.list_by_resource_group(resource_group_name=resource_group, expand="changedTime")
+
+    resource_list = []
+    async for resource in resources:
+        changed_time = getattr(resource, "changed_time", None)
+        resource_list.append({
+            "name": resource.name, 
+            "type": resource.type, 
+            "location": resource.location, 
+            "kind": resource.kind, 
+            "id": resource.id, 
+            "tags": resource.tags or {},
+            "changed_time": changed_time.isoformat() if changed_time else None,
+        })
+    return resource_list
+
+
+async def iter_resource_groups(subscription_ids: List[str], limiter: Optional[AdaptiveLimiter] = None):
+    """ List the resource groups of many subscriptions concurrently, yield (subscription, groups, error) as each finishes."""
+    limiter = limiter or AdaptiveLimiter()
+    subscription_ids = list(dict.fromkeys(subscription_id.strip().lower() for subscription_id in subscription_ids))
+
+    async def fetch(subscription_id: str) -> List[Dict[str, Any]]:
+        return await fetch_resource_groups(subscription_id, raw_response_hook=limiter.observe)
+
+    async for subscription_id, resource_groups, error in fan_out(subscription_ids, fetch, limiter):
+        yield subscription_id, resource_groups, error
+
+
+# Local, incrementally refreshed copy of the listings above which the tools read from
+inventory_snapshot = InventorySnapshot(
+    fetch_resource_groups, fetch_resources_in_resource_group, change_feed=ResourceGraphChangeFeed()
+)
+
+
+async def read_resource_groups(subscription_id: str) -> List[Dict[str, Any]]:
+    """ The resource groups from the snapshot, or from ARM while the subscription's snapshot is warming up."""
+    if inventory_snapshot.enabled:
+        if await inventory_snapshot.is_synced(subscription_id):
+            return await inventory_snapshot.resource_groups(subscription_id)
+        inventory_snapshot.warm(subscription_id)
+    return await fetch_resource_groups(subscription_id)
+
+
+async def read_resources_in_resource_group(subscription_id: str, resource_group: str) -> List[Dict[str, Any]]:
+    """ The resources of a group from the snapshot, or from ARM while the subscription's snapshot is warming up."""
+    from azure.core.exceptions import ResourceNotFoundError
+
+    if inventory_snapshot.enabled:
+        if await inventory_snapshot.is_synced(subscription_id):
+            resources = await inventory_snapshot.resources(subscription_id, resource_group=resource_group)
+            # An empty group and one that doesn't exist look the same in the resources table
+            if not resources and not await inventory_snapshot.has_resource_group(subscription_id, resource_group):
+                raise ResourceNotFoundError(f"Resource group '{resource_group}' could not be found in subscription {subscription_id}.")
+            return resources
+        inventory_snapshot.warm(subscription_id)
+    return await fetch_resources_in_resource_group(subscription_id, resource_group)
+
+
 @ai_function(
     name="list_resource_groups", 
-    description="Use this function when the user requests the resource groups in their subscription. This function will list all of the available resoure groups in the subscription.", 
+    description="Use this function when the user requests the resource groups in their subscription. This function will list all of the available resoure groups in the subscription as a table of name and location. A resource group's ID is id_prefix followed by its name.", 
     approval_mode="never_require"
 )
+@cached_tool(ttl_seconds=300)
 async def list_resource_groups(
     subscription_id: Annotated[str, Field(description="The subscription ID for the requested resource groups")]
-) -> List[Dict[str, Any]]:
+) -> Dict[str, Any]:
     """ List all of the resources in a specific subscription."""
     try:
-        resource_group_list = []
-        resource_client = ResourceManagementClient(credential=credential, subscription_id=subscription_id)
+        resource_groups = await read_resource_groups(subscription_id)
 
-        for resource_group in resource_client.resource_groups.list():
-            resource_group_list.append({
-                "id": resource_group.id, 
-                "name": resource_group.name, 
-                "location": resource_group.location
-            })
+        # A resource group's id is the prefix plus its name, no need to repeat it per row
+        id_prefix = resource_groups[0]["id"][:-len(resource_groups[0]["name"])] if resource_groups else None
+        return encode_table(resource_groups, ["name", "location"], summarize_by="location", id_prefix=id_prefix)
+    except Exception as e:
+        return {"error": f"An error occured trying to get resources in {subscription_id}: {e}"}
 
-        return resource_group_list
+@ai_function(
+    name="list_resource_groups_across_subscriptions",
+    description="List the resource groups of several subscriptions at once. Pass the subscription IDs, or leave them empty to list every subscription the agent can see. Use this instead of calling list_resource_groups once per subscription. Subscriptions that fail are reported separately under errors. A resource group's ID is /subscriptions/<subscription_id>/resourceGroups/<name>.",
+    approval_mode="never_require"
+)
+@cached_tool(ttl_seconds=300)
+async def list_resource_groups_across_subscriptions(
+    subscription_ids: Annotated[Optional[List[str]], Field(description="Subscription IDs to list, leave empty for all subscriptions the agent can see")] = None,
+) -> Dict[str, Any]:
+    """ List the resource groups of many subscriptions, merged into one table."""
+    try:
+        if not subscription_ids:
+            subscription_ids = await fetch_subscription_ids()
     except Exception as e:
-        return [{"error": f"An error occured trying to get resources in {subscription_id}: {e}"}]
+        return {"error": f"An error occured trying to list the subscriptions: {e}"}
+
+    # A tool call returns a single value, so the streamed results are merged
+    # here. Callers that can use them as they arrive take iter_resource_groups.
+    rows, errors, seen = [], [], set()
+    async for subscription_id, resource_groups, error in iter_resource_groups(subscription_ids):
+        if error is not None:
+            errors.append({"subscription_id": subscription_id, "error": str(error)})
+            continue
+        for resource_group in resource_groups:
+            if resource_group["id"].lower() in seen:
+                continue
+            seen.add(resource_group["id"].lower())
+            rows.append([subscription_id, resource_group["name"], resource_group["location"]])
+
+    return compact_table(
+        {
+            "subscriptions": len(set(subscription_id.lower() for subscription_id in subscription_ids)),
+            "columns": ["subscription_id", "name", "location"],
+            "rows": sorted(rows),
+            "errors": errors,
+        },
+        summarize_by="subscription_id",
+    )
 
 @ai_function(
         name="get_resources_in_resource_group", 
-        description="This function list all of the resources in a resource group. It cannot give specific information about individual resources", 
+        description="This function list all of the resources in a resource group as a table. It cannot give specific information about individual resources. Filter by type, location or name prefix rather than listing everything when the user asks about specific resources. IDs are relative to id_prefix, and a listing that is too long is cut off with a summary of the remaining rows under more.", 
         approval_mode="never_require"
 )
+@cached_tool(ttl_seconds=120)
 async def get_resources_in_resource_group(
     resource_group: Annotated[str, Field(description="The resource group name for the requested resources")], 
-    subscription_id: Annotated[str, Field(description="The subscription ID for the requested resource group")]
-) -> List[Dict[str, Any]]:
+    subscription_id: Annotated[str, Field(description="The subscription ID for the requested resource group")],
+    resource_type: Annotated[Optional[str], Field(description="Only resources of this type, e.g. Microsoft.Compute/virtualMachines")] = None,
+    location: Annotated[Optional[str], Field(description="Only resources in this Azure region, e.g. westeurope")] = None,
+    name_prefix: Annotated[Optional[str], Field(description="Only resources whose name starts with this text")] = None,
+    fields: Annotated[Optional[List[str]], Field(description="Columns to return out of name, type, location, kind and id, leave empty for all")] = None,
+) -> Dict[str, Any]:
     """Return the resources with a specific resource group."""
     try:
-        resource_client = ResourceManagementClient(credential=credential, subscription_id=subscription_id)
+        resources = await read_resources_in_resource_group(subscription_id, resource_group)
 
-        resources = resource_client.resources.list_by_resource_group(resource_group_name=resource_group)
+        resources = filter_records(resources, resource_type=resource_type, location=location, name_prefix=name_prefix)
+        return encode_table(resources, RESOURCE_COLUMNS, fields=fields, summarize_by="type", resource_group=resource_group)
+    except Exception as e:
+        return {"error": f"Error listing resources in {resource_group}: {e}"}
 
-        resource_list = []
-        for resource in resources:
-            resource_list.append({
-                "name": resource.name, 
-                "type": resource.type, 
-                "location": resource.location, 
-                "kind": resource.kind, 
-                "id": resource.id, 
-            })
 
-        return resource_list 
+@ai_function(
+        name="find_resources",
+        description="Search resources across all resource groups and subscriptions in one query (Azure Resource Graph). Use this instead of listing resource groups one by one when the user asks where resources are, e.g. all virtual machines in a subscription. Filters are optional and case-insensitive. IDs are relative to id_prefix, and a result that is too long is cut off with a summary of the remaining rows under more.",
+        approval_mode="never_require"
+)
+@cached_tool(ttl_seconds=120)
+async def find_resources(
+    subscription_ids: Annotated[Optional[List[str]], Field(description="Subscription IDs to search, leave empty to search every subscription the agent can read")] = None,
+    resource_type: Annotated[Optional[str], Field(description="Resource type, e.g. Microsoft.Compute/virtualMachines")] = None,
+    resource_group: Annotated[Optional[str], Field(description="Only resources in this resource group")] = None,
+    location: Annotated[Optional[str], Field(description="Only resources in this Azure region, e.g. westeurope")] = None,
+    name_contains: Annotated[Optional[str], Field(description="Only resources whose name contains this text")] = None,
+) -> Dict[str, Any]:
+    """ Return the matching resources as columns and rows."""
+    try:
+        result = await get_inventory().find_resources(
+            subscription_ids=subscription_ids,
+            resource_type=resource_type,
+            resource_group=resource_group,
+            location=location,
+            name_contains=name_contains,
+        )
+        return compact_table(result, summarize_by="type")
+    except Exception as e:
+        return {"error": f"Error querying Resource Graph: {e}"}
+
+
+@ai_function(
+        name="summarize_resources",
+        description="Count resources across all resource groups and subscriptions (Azure Resource Graph), grouped by type, location, resourceGroup, subscriptionId or kind. Use this for inventory overviews such as how many resources of each type exist.",
+        approval_mode="never_require"
+)
+@cached_tool(ttl_seconds=120)
+async def summarize_resources(
+    group_by: Annotated[str, Field(description="Column to group by: type, location, resourceGroup, subscriptionId or kind")] = "type",
+    subscription_ids: Annotated[Optional[List[str]], Field(description="Subscription IDs to count, leave empty for every subscription the agent can read")] = None,
+    resource_type: Annotated[Optional[str], Field(description="Only count resources of this type")] = None,
+    resource_group: Annotated[Optional[str], Field(description="Only count resources in this resource group")] = None,
+    location: Annotated[Optional[str], Field(description="Only count resources in this Azure region")] = None,
+) -> Dict[str, Any]:
+    """ Return resource counts per group."""
+    try:
+        return await get_inventory().summarize_resources(
+            group_by=group_by,
+            subscription_ids=subscription_ids,
+            resource_type=resource_type,
+            resource_group=resource_group,
+            location=location,
+        )
     except Exception as e:
-        return[{"error":f"Error listing resources in {resource_group}: {e}"}]
+        return {"error": f"Error querying Resource Graph: {e}"}
 
 
 
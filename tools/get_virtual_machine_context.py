@@ -1,109 +1,266 @@
 import asyncio
 import os
-from typing import Annotated, Any, Dict, List
-import json 
+from typing import Annotated, Any, Dict, List, Optional, Tuple
 
 from agent_framework import ai_function
-from azure.identity import DefaultAzureCredential
 from dotenv import load_dotenv
 from pydantic import Field
 
-from azure.mgmt.compute import ComputeManagementClient
+from tools.azure_clients import get_compute_client
+from tools.concurrency import run_blocking
+from tools.output_encoder import compact_table
+from tools.tool_cache import cached_tool
+from tools.vm_capabilities import capability_cache
+from tools.vm_metrics_store import get_metrics_store
 
 load_dotenv()
 
-credential = DefaultAzureCredential()
+PROFILE_COLUMNS = [
+    "vm_name",
+    "vm_size",
+    "location",
+    "os_type",
+    "power_state",
+    "provisioning_state",
+    "max_iops",
+    "max_throughput_mbps",
+    "max_data_disk_count",
+]
+
+STATUS_COLUMNS = ["vm_name", "resource_group", "power_state", "vm_size", "location", "os_type"]
+
+# Upper bound on concurrent VM GETs issued by the batch profile tool
+VM_PROFILE_CONCURRENCY = int(os.getenv("VM_PROFILE_CONCURRENCY", "8"))
+
+
+def _power_state(virtual_machine) -> str:
+    power_state = "Unknown"
+    if virtual_machine.instance_view and virtual_machine.instance_view.statuses:
+        for status in virtual_machine.instance_view.statuses:
+            if status.code and status.code.startswith("PowerState/"):
+                power_state = status.display_status
+    return power_state
+
+
+def _power_state_code(statuses) -> str:
+    """ 'running', 'deallocated', ... from the PowerState/ status of an instance view."""
+    for status in statuses or []:
+        if status.code and status.code.startswith("PowerState/"):
+            return status.code.split("/", 1)[1]
+    return "unknown"
+
+
+def _os_type(virtual_machine) -> str:
+    os_type = "Unknown"
+    if virtual_machine.os_profile:
+        os_type = "Linux" if virtual_machine.os_profile.linux_configuration else "Windows"
+    return os_type
+
+
+async def _build_profile(compute, virtual_machine) -> Dict[str, Any]:
+    """ Combine a VM (fetched with its instance view) with the capabilities of its size."""
+    vm_size = virtual_machine.hardware_profile.vm_size
+    max_iops = "Unknown"
+    max_throughput_mbps = "Unknown"
+    max_data_disk_count = "Unknown"
+
+    try:
+        capabilities = await capability_cache.lookup(compute, virtual_machine.location, vm_size)
+        max_iops = capabilities.get("max_iops", max_iops)
+        max_throughput_mbps = capabilities.get("max_throughput_mbps", max_throughput_mbps)
+        max_data_disk_count = capabilities.get("max_data_disk_count", max_data_disk_count)
+    except Exception as e:
+        # If we can't get size info, continue with basic VM info
+        max_iops = f"Error getting IOPS info: {str(e)}"
+
+    return {
+        "vm_name": virtual_machine.name,
+        "vm_size": vm_size,
+        "location": virtual_machine.location,
+        "os_type": _os_type(virtual_machine),
+        "power_state": _power_state(virtual_machine),
+        "provisioning_state": virtual_machine.provisioning_state,
+        "max_iops": max_iops,
+        "max_throughput_mbps": max_throughput_mbps,
+        "max_data_disk_count": max_data_disk_count,
+    }
+
 
 @ai_function(
     name="get_virtual_machine_information",
     description="""This tool can be used when more information is requested of a specific virtual machine.""",
     approval_mode="never_require"
 )
+@cached_tool(ttl_seconds=60)
 async def get_virtual_machine_profile(
     virtual_machine_name: Annotated[str, Field(description="The name of the Virtual Machine")],
     resource_group: Annotated[str, Field(description="The name of the resource group of the Virtual Machine")],
     subscription_id: Annotated[str, Field(description="The subscription ID of the Virtual Machine")]
-) -> str:
+) -> Dict[str, Any]:
     """Return basic profile information for the virtual machine including max IOPS"""
     try:
-        compute = ComputeManagementClient(credential=credential, subscription_id=subscription_id)
+        compute = get_compute_client(subscription_id)
         
         # Get VM with instance view for power state
-        virtual_machine = compute.virtual_machines.get(
+        virtual_machine = await compute.virtual_machines.get(
             resource_group_name=resource_group, 
             vm_name=virtual_machine_name,
             expand='instanceView'
         )
 
-        # Extract power state
-        power_state = "Unknown"
-        if virtual_machine.instance_view and virtual_machine.instance_view.statuses:
-            for status in virtual_machine.instance_view.statuses:
-                if status.code and status.code.startswith("PowerState/"):
-                    power_state = status.display_status
-
-        # Determine OS type
-        os_type = "Unknown"
-        if virtual_machine.os_profile:
-            os_type = "Linux" if virtual_machine.os_profile.linux_configuration else "Windows"
-
-        # Get VM size capabilities including max IOPS
-        vm_size = virtual_machine.hardware_profile.vm_size
-        max_iops = "Unknown"
-        max_throughput_mbps = "Unknown"
-        max_data_disk_count = "Unknown"
-        
+        profile = await _build_profile(compute, virtual_machine)
+        return {**profile, "resource_group": resource_group}
+    except Exception as e:
+        return {"error": f"Failed to get VM profile: {str(e)}", "vm_name": virtual_machine_name}
+
+
+@ai_function(
+    name="get_virtual_machine_profiles",
+    description="Use this tool instead of calling get_virtual_machine_information repeatedly when information about several virtual machines is needed, for example all VMs in a resource group. It returns size, power state and max IOPS/throughput for every VM in one table.",
+    approval_mode="never_require"
+)
+@cached_tool(ttl_seconds=60)
+async def get_virtual_machine_profiles(
+    resource_group: Annotated[str, Field(description="The name of the resource group of the Virtual Machines")],
+    subscription_id: Annotated[str, Field(description="The subscription ID of the Virtual Machines")],
+    virtual_machine_names: Annotated[Optional[List[str]], Field(description="The names of the Virtual Machines. Leave empty to get every Virtual Machine in the resource group")] = None,
+) -> Dict[str, Any]:
+    """Return profile information for many virtual machines, fetched concurrently"""
+    try:
+        compute = get_compute_client(subscription_id)
+
+        if not virtual_machine_names:
+            virtual_machine_names = [vm.name async for vm in compute.virtual_machines.list(resource_group_name=resource_group)]
+
+        semaphore = asyncio.Semaphore(VM_PROFILE_CONCURRENCY)
+
+        async def fetch(name: str):
+            async with semaphore:
+                return await compute.virtual_machines.get(
+                    resource_group_name=resource_group,
+                    vm_name=name,
+                    expand='instanceView'
+                )
+
+        results = await asyncio.gather(*(fetch(name) for name in virtual_machine_names), return_exceptions=True)
+
+        virtual_machines = []
+        errors = []
+        for name, result in zip(virtual_machine_names, results):
+            if isinstance(result, Exception):
+                errors.append({"vm_name": name, "error": str(result)})
+            else:
+                virtual_machines.append(result)
+
+        # Load each location's capability catalog once before building the profiles
+        locations = {vm.location for vm in virtual_machines}
+        await asyncio.gather(
+            *(capability_cache.get_location(compute, location) for location in locations),
+            return_exceptions=True,
+        )
+
+        profiles = await asyncio.gather(*(_build_profile(compute, vm) for vm in virtual_machines))
+
+        return compact_table(
+            {
+                "resource_group": resource_group,
+                "columns": PROFILE_COLUMNS,
+                "rows": [[profile[column] for column in PROFILE_COLUMNS] for profile in profiles],
+                "errors": errors,
+            },
+            id_column=None,
+            summarize_by="vm_size",
+        )
+    except Exception as e:
+        return {"error": f"Failed to get VM profiles in {resource_group}: {str(e)}"}
+
+
+async def fetch_virtual_machine_statuses(compute, resource_group: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+    """ Power state, size and location of every VM in a resource group (or the subscription) as dicts.
+
+    The listing embeds the instance views ($expand=instanceView for a resource
+    group, statusOnly=true for the subscription), so the whole table costs one
+    paged listing. VMs listed without one, e.g. on an API version without the
+    expansion, get their instance view fetched concurrently while the next
+    pages are still being listed.
+    """
+    if resource_group:
+        pages = compute.virtual_machines.list(resource_group_name=resource_group, expand="instanceView")
+    else:
+        pages = compute.virtual_machines.list_all(status_only="true")
+
+    semaphore = asyncio.Semaphore(VM_PROFILE_CONCURRENCY)
+
+    async def fetch_instance_view(group: str, name: str):
+        async with semaphore:
+            return await compute.virtual_machines.instance_view(resource_group_name=group, vm_name=name)
+
+    statuses, pending = [], []
+    try:
+        async for virtual_machine in pages:
+            os_disk = virtual_machine.storage_profile.os_disk if virtual_machine.storage_profile else None
+            os_type = getattr(os_disk.os_type, "value", os_disk.os_type) if os_disk and os_disk.os_type else "Unknown"
+            status = {
+                "vm_name": virtual_machine.name,
+                "resource_group": virtual_machine.id.split("/")[4],
+                "power_state": "unknown",
+                "vm_size": virtual_machine.hardware_profile.vm_size if virtual_machine.hardware_profile else "Unknown",
+                "location": virtual_machine.location,
+                "os_type": os_type,
+            }
+            if virtual_machine.instance_view is not None:
+                status["power_state"] = _power_state_code(virtual_machine.instance_view.statuses)
+            else:
+                pending.append((status, asyncio.ensure_future(fetch_instance_view(status["resource_group"], status["vm_name"]))))
+            statuses.append(status)
+    except BaseException:
+        for _, task in pending:
+            task.cancel()
+        raise
+
+    errors = []
+    for status, task in pending:
         try:
-            # Get VM size capabilities
-            vm_sizes = compute.virtual_machine_sizes.list(location=virtual_machine.location)
-            for size in vm_sizes:
-                if size.name == vm_size:
-                    max_iops = getattr(size, 'max_data_disk_count', 'Unknown')
-                    max_data_disk_count = getattr(size, 'max_data_disk_count', 'Unknown')
-                    # Note: Azure VM sizes don't directly expose IOPS limits in the sizes API
-                    # IOPS limits are typically based on VM size and disk type
-                    break
-                    
-            # Try to get more detailed VM size info if available
-            try:
-                # Get resource SKUs for more detailed specs
-                from azure.mgmt.compute.models import ResourceSkuRestrictionsType
-                resource_skus = compute.resource_skus.list(filter=f"location eq '{virtual_machine.location}'")
-                for sku in resource_skus:
-                    if sku.resource_type == "virtualMachines" and sku.name == vm_size:
-                        # Look for IOPS capabilities in the SKU
-                        if sku.capabilities:
-                            for capability in sku.capabilities:
-                                if capability.name == "UncachedDiskIOPS":
-                                    max_iops = capability.value
-                                elif capability.name == "UncachedDiskBytesPerSecond":
-                                    # Convert bytes to MB/s
-                                    max_throughput_mbps = str(int(capability.value) // (1024 * 1024))
-                        break
-            except Exception:
-                # If resource SKUs API fails, continue with basic info
-                pass
-                
+            status["power_state"] = _power_state_code((await task).statuses)
         except Exception as e:
-            # If we can't get size info, continue with basic VM info
-            max_iops = f"Error getting IOPS info: {str(e)}"
-
-        virtual_machine_profile = f"""
-            vm_name: {virtual_machine.name},
-            vm_size: {virtual_machine.hardware_profile.vm_size},
-            location: {virtual_machine.location},
-            os_type: {os_type},
-            power_state: {power_state},
-            provisioning_state: {virtual_machine.provisioning_state},
-            resource_group: {resource_group},
-            max_iops: {max_iops},
-            max_throughput_mbps: {max_throughput_mbps},
-            max_data_disk_count: {max_data_disk_count}
-        """
-
-        return virtual_machine_profile
+            errors.append({"vm_name": status["vm_name"], "error": str(e)})
+    return statuses, errors
+
+
+@ai_function(
+    name="get_virtual_machines_status",
+    description="Use this tool when the user asks which virtual machines are running, stopped or deallocated. It returns the power state, size, location and OS of every VM in a resource group, or in the whole subscription when no resource group is given, as one table with a count per power state.",
+    approval_mode="never_require"
+)
+@cached_tool(ttl_seconds=30)
+async def get_virtual_machines_status(
+    subscription_id: Annotated[str, Field(description="The subscription ID of the Virtual Machines")],
+    resource_group: Annotated[Optional[str], Field(description="The name of the resource group of the Virtual Machines. Leave empty for every Virtual Machine in the subscription")] = None,
+) -> Dict[str, Any]:
+    """Return the power state of many virtual machines in one table"""
+    try:
+        compute = get_compute_client(subscription_id)
+        statuses, errors = await fetch_virtual_machine_statuses(compute, resource_group)
+        statuses.sort(key=lambda status: (status["resource_group"].lower(), status["vm_name"].lower()))
+
+        power_states: Dict[str, int] = {}
+        for status in statuses:
+            power_states[status["power_state"]] = power_states.get(status["power_state"], 0) + 1
+
+        return compact_table(
+            {
+                "scope": resource_group or subscription_id,
+                "virtual_machines": len(statuses),
+                "power_states": power_states,
+                "columns": STATUS_COLUMNS,
+                "rows": [[status[column] for column in STATUS_COLUMNS] for status in statuses],
+                "errors": errors,
+            },
+            id_column=None,
+            summarize_by="resource_group",
+        )
     except Exception as e:
-        return {"error": f"Failed to get VM profile: {str(e)}", "vm_name": virtual_machine_name}
+        return {"error": f"Failed to get VM status in {resource_group or subscription_id}: {str(e)}"}
 
 
 @ai_function(
@@ -115,12 +272,21 @@ async def get_virtual_machine_logs(
      virtual_machine_name: Annotated[str, Field(description="The name of the Virtual Machine")],
 ):
     """ Return log information regarding specific virtual machine"""
-    file_path = "/Users/dylan/Documents/school/internship/development/cloud-solution-v1/data/vm_data.json"
     try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
-
-        return data.get(virtual_machine_name, None)
+        record = await run_blocking(get_metrics_store().get, virtual_machine_name)
+        if record is None:
+            return {"error": f"No logs found for {virtual_machine_name}"}
 
+        # The metrics become a table so the record gets the same token budget as the other tools
+        metrics = record.get("metrics") or {}
+        return compact_table(
+            {
+                "vm_name": virtual_machine_name,
+                **{key: value for key, value in record.items() if key not in ("name", "metrics")},
+                "columns": ["metric", "value"],
+                "rows": [[metric, value] for metric, value in metrics.items()],
+            },
+            id_column=None,
+        )
     except Exception as e:
-        return f"something went wrong: {e}"
\ No newline at end of file
+        return {"error": f"Failed to get logs of {virtual_machine_name}: {e}"}
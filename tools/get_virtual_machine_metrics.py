@@ -0,0 +1,71 @@
+from typing import Annotated, Any, Dict, List, Optional
+
+from agent_framework import ai_function
+from pydantic import Field
+
+from tools.concurrency import run_blocking
+from tools.output_encoder import compact_table
+from tools.vm_timeseries import METRICS, get_timeseries_store
+
+METRIC_DESCRIPTION = f"The metric to analyse, one of: {', '.join(METRICS)}"
+
+
+def _window_seconds(window_hours: Optional[float]) -> Optional[int]:
+    return int(window_hours * 3600) if window_hours else None
+
+
+@ai_function(
+    name="get_virtual_machine_metric_aggregates",
+    description="Use this tool to summarise a performance metric for many virtual machines at once, for example to compare IOPS or CPU usage across a resource group. It returns per-VM sample count, mean, p50/p95/p99, max and rate of change per hour over a time window.",
+    approval_mode="never_require"
+)
+async def get_virtual_machine_metric_aggregates(
+    metric: Annotated[str, Field(description=METRIC_DESCRIPTION)],
+    window_hours: Annotated[Optional[float], Field(description="Only use samples from the last N hours. Leave empty to use all samples")] = None,
+    resource_group: Annotated[Optional[str], Field(description="Only include Virtual Machines in this resource group")] = None,
+    virtual_machine_names: Annotated[Optional[List[str]], Field(description="Only include these Virtual Machines")] = None,
+) -> Dict[str, Any]:
+    """ Return windowed aggregates of a metric per virtual machine"""
+    try:
+        store = await run_blocking(get_timeseries_store)
+        result = await run_blocking(
+            store.aggregate,
+            metric,
+            window_seconds=_window_seconds(window_hours),
+            vm_names=virtual_machine_names,
+            resource_group=resource_group,
+        )
+        return compact_table(result, id_column=None)
+    except Exception as e:
+        return {"error": f"Failed to aggregate {metric}: {e}"}
+
+
+@ai_function(
+    name="find_virtual_machine_threshold_breaches",
+    description="Use this tool to find which virtual machines exceed (or fall below) a metric threshold, for example VMs that are IOPS-bound or CPU-starved. It returns the breaching VMs with the number and fraction of samples over the threshold and the worst value seen.",
+    approval_mode="never_require"
+)
+async def find_virtual_machine_threshold_breaches(
+    metric: Annotated[str, Field(description=METRIC_DESCRIPTION)],
+    threshold: Annotated[float, Field(description="The threshold value for the metric")],
+    window_hours: Annotated[Optional[float], Field(description="Only use samples from the last N hours. Leave empty to use all samples")] = None,
+    min_fraction: Annotated[float, Field(description="Only report VMs where at least this fraction (0-1) of samples breach the threshold")] = 0.0,
+    below: Annotated[bool, Field(description="Report samples below the threshold instead of above it")] = False,
+    resource_group: Annotated[Optional[str], Field(description="Only include Virtual Machines in this resource group")] = None,
+) -> Dict[str, Any]:
+    """ Return the virtual machines whose metric crosses a threshold"""
+    try:
+        store = await run_blocking(get_timeseries_store)
+        result = await run_blocking(
+            store.threshold_breaches,
+            metric,
+            threshold,
+            window_seconds=_window_seconds(window_hours),
+            min_fraction=min_fraction,
+            below=below,
+            resource_group=resource_group,
+        )
+        # Rows are sorted by breach fraction, so a cut off table keeps the worst VMs
+        return compact_table(result, id_column=None)
+    except Exception as e:
+        return {"error": f"Failed to check {metric} against {threshold}: {e}"}
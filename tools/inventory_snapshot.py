@@ -0,0 +1,506 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from tools.concurrency import run_blocking
+from tools.resource_graph import ResourceGraphInventory, get_inventory, kql_string
+from tools.tool_cache import tool_cache
+
+# Local inventory snapshot of resource groups and resources.
+#
+# The resource tools read from a SQLite database instead of going to ARM on
+# every question. A subscription is listed in full once (with the existing
+# listing logic), after that it's refreshed incrementally: Resource Graph's
+# resourcechanges table says which resources were created, updated or deleted
+# since the last refresh, and only those are fetched again. Reads accept a
+# snapshot up to INVENTORY_MAX_STALENESS_SECONDS old and refresh it first
+# otherwise; a background task keeps known subscriptions within that bound.
+# A subscription without a snapshot yet is answered from ARM while its first
+# sync runs in the background (see warm()).
+#
+# A full re-list still happens when the last refresh is older than the change
+# history Resource Graph keeps, when no change feed is available, or once per
+# INVENTORY_FULL_SYNC_SECONDS to catch anything the deltas missed. A read never
+# waits for one: it is answered from the current snapshot while warm() lists
+# the subscription in the background.
+
+INVENTORY_SNAPSHOT_ENABLED = os.getenv("INVENTORY_SNAPSHOT_ENABLED", "true").lower() in ("1", "true", "yes")
+INVENTORY_SNAPSHOT_PATH = os.getenv(
+    "INVENTORY_SNAPSHOT_PATH", str(Path(__file__).resolve().parents[1] / "data" / "inventory.sqlite")
+)
+INVENTORY_MAX_STALENESS_SECONDS = float(os.getenv("INVENTORY_MAX_STALENESS_SECONDS", "300"))
+INVENTORY_REFRESH_INTERVAL_SECONDS = float(os.getenv("INVENTORY_REFRESH_INTERVAL_SECONDS", "120"))
+INVENTORY_FULL_SYNC_SECONDS = float(os.getenv("INVENTORY_FULL_SYNC_SECONDS", str(24 * 60 * 60)))
+INVENTORY_LIST_CONCURRENCY = int(os.getenv("INVENTORY_LIST_CONCURRENCY", "8"))
+
+# resourcechanges keeps 14 days of history, stay well inside it
+CHANGE_FEED_RETENTION_SECONDS = 6 * 24 * 60 * 60
+# Changes can show up in resourcechanges a little after they happened, so
+# every delta re-reads this much before the previous watermark
+CHANGE_FEED_OVERLAP_SECONDS = 5 * 60
+CHANGE_FEED_BATCH_SIZE = 100
+
+RESOURCE_FIELDS = ["id", "name", "type", "location", "kind", "resource_group", "tags", "changed_time"]
+
+
+def _utc_iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _resource_group_of(resource_id: str) -> Optional[str]:
+    parts = resource_id.split("/")
+    for index, part in enumerate(parts[:-1]):
+        if part.lower() == "resourcegroups":
+            return parts[index + 1]
+    return None
+
+
+class InventoryDatabase:
+    """ SQLite tables for the snapshot, all methods are blocking (call through run_blocking)."""
+
+    def __init__(self, path: str = INVENTORY_SNAPSHOT_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across the blocking pool's threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS resource_groups (
+                    subscription_id TEXT NOT NULL COLLATE NOCASE,
+                    name TEXT NOT NULL COLLATE NOCASE,
+                    id TEXT NOT NULL,
+                    location TEXT,
+                    tags TEXT,
+                    PRIMARY KEY (subscription_id, name)
+                );
+                CREATE TABLE IF NOT EXISTS resources (
+                    id TEXT PRIMARY KEY COLLATE NOCASE,
+                    subscription_id TEXT NOT NULL COLLATE NOCASE,
+                    resource_group TEXT NOT NULL COLLATE NOCASE,
+                    name TEXT NOT NULL,
+                    type TEXT COLLATE NOCASE,
+                    location TEXT COLLATE NOCASE,
+                    kind TEXT,
+                    tags TEXT,
+                    changed_time TEXT
+                );
+                CREATE INDEX IF NOT EXISTS resources_by_group ON resources (subscription_id, resource_group);
+                CREATE INDEX IF NOT EXISTS resources_by_type ON resources (type);
+                CREATE INDEX IF NOT EXISTS resources_by_location ON resources (location);
+                CREATE TABLE IF NOT EXISTS resource_tags (
+                    resource_id TEXT NOT NULL COLLATE NOCASE,
+                    key TEXT NOT NULL COLLATE NOCASE,
+                    value TEXT
+                );
+                CREATE INDEX IF NOT EXISTS resource_tags_by_key ON resource_tags (key, value);
+                CREATE INDEX IF NOT EXISTS resource_tags_by_resource ON resource_tags (resource_id);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    subscription_id TEXT PRIMARY KEY COLLATE NOCASE,
+                    full_sync_at REAL NOT NULL,
+                    refreshed_at REAL NOT NULL,
+                    watermark TEXT NOT NULL
+                );
+                """
+            )
+            self._local.connection = connection
+        return connection
+
+    # ---- writes
+
+    @staticmethod
+    def _upsert_resources(connection: sqlite3.Connection, subscription_id: str, resources: Iterable[Dict[str, Any]]) -> None:
+        for resource in resources:
+            tags = resource.get("tags") or {}
+            connection.execute(
+                "INSERT OR REPLACE INTO resources (id, subscription_id, resource_group, name, type, location, kind, tags, changed_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    resource["id"],
+                    subscription_id,
+                    resource.get("resource_group") or _resource_group_of(resource["id"]),
+                    resource["name"],
+                    resource.get("type"),
+                    resource.get("location"),
+                    resource.get("kind"),
+                    json.dumps(tags),
+                    resource.get("changed_time"),
+                ),
+            )
+            connection.execute("DELETE FROM resource_tags WHERE resource_id = ?", (resource["id"],))
+            connection.executemany(
+                "INSERT INTO resource_tags (resource_id, key, value) VALUES (?, ?, ?)",
+                [(resource["id"], key, value) for key, value in tags.items()],
+            )
+
+    @staticmethod
+    def _delete_resources(connection: sqlite3.Connection, resource_ids: Iterable[str]) -> None:
+        for resource_id in resource_ids:
+            connection.execute("DELETE FROM resources WHERE id = ?", (resource_id,))
+            connection.execute("DELETE FROM resource_tags WHERE resource_id = ?", (resource_id,))
+
+    @staticmethod
+    def _replace_resource_groups(connection: sqlite3.Connection, subscription_id: str, resource_groups: List[Dict[str, Any]]) -> None:
+        connection.execute("DELETE FROM resource_groups WHERE subscription_id = ?", (subscription_id,))
+        connection.executemany(
+            "INSERT INTO resource_groups (subscription_id, name, id, location, tags) VALUES (?, ?, ?, ?, ?)",
+            [(subscription_id, group["name"], group["id"], group.get("location"), json.dumps(group.get("tags") or {})) for group in resource_groups],
+        )
+
+    def replace_subscription(self, subscription_id: str, resource_groups: List[Dict[str, Any]], resources: List[Dict[str, Any]], synced_at: float) -> None:
+        """ Swap in a full listing of a subscription in one transaction."""
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM resource_tags WHERE resource_id IN (SELECT id FROM resources WHERE subscription_id = ?)", (subscription_id,)
+            )
+            connection.execute("DELETE FROM resources WHERE subscription_id = ?", (subscription_id,))
+            self._replace_resource_groups(connection, subscription_id, resource_groups)
+            self._upsert_resources(connection, subscription_id, resources)
+            connection.execute(
+                "INSERT OR REPLACE INTO sync_state (subscription_id, full_sync_at, refreshed_at, watermark) VALUES (?, ?, ?, ?)",
+                (subscription_id, synced_at, synced_at, _utc_iso(synced_at)),
+            )
+
+    def apply_delta(
+        self,
+        subscription_id: str,
+        resource_groups: List[Dict[str, Any]],
+        upserts: List[Dict[str, Any]],
+        deletes: List[str],
+        removed_groups: List[str],
+        refreshed_at: float,
+    ) -> None:
+        with self._connection() as connection:
+            self._replace_resource_groups(connection, subscription_id, resource_groups)
+            for group in removed_groups:
+                ids = [row[0] for row in connection.execute(
+                    "SELECT id FROM resources WHERE subscription_id = ? AND resource_group = ?", (subscription_id, group)
+                )]
+                self._delete_resources(connection, ids)
+            self._delete_resources(connection, deletes)
+            self._upsert_resources(connection, subscription_id, upserts)
+            connection.execute(
+                "UPDATE sync_state SET refreshed_at = ?, watermark = ? WHERE subscription_id = ?",
+                (refreshed_at, _utc_iso(refreshed_at), subscription_id),
+            )
+
+    # ---- reads
+
+    def sync_state(self, subscription_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM sync_state WHERE subscription_id = ?", (subscription_id,)).fetchone()
+        return dict(row) if row else None
+
+    def subscriptions(self) -> List[str]:
+        return [row[0] for row in self._connection().execute("SELECT subscription_id FROM sync_state")]
+
+    def has_resource_group(self, subscription_id: str, name: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM resource_groups WHERE subscription_id = ? AND name = ?", (subscription_id, name)
+        ).fetchone()
+        return row is not None
+
+    def resource_groups(self, subscription_id: str) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(
+            "SELECT id, name, location, tags FROM resource_groups WHERE subscription_id = ? ORDER BY name", (subscription_id,)
+        )
+        return [{**dict(row), "tags": json.loads(row["tags"] or "{}")} for row in rows]
+
+    def resources(
+        self,
+        subscription_id: str,
+        resource_group: Optional[str] = None,
+        resource_type: Optional[str] = None,
+        location: Optional[str] = None,
+        tag: Optional[str] = None,
+        tag_value: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        query = f"SELECT {', '.join(RESOURCE_FIELDS)} FROM resources WHERE subscription_id = ?"
+        params: List[Any] = [subscription_id]
+        if resource_group:
+            query += " AND resource_group = ?"
+            params.append(resource_group)
+        if resource_type:
+            query += " AND type = ?"
+            params.append(resource_type)
+        if location:
+            query += " AND location = ?"
+            params.append(location)
+        if tag:
+            query += " AND id IN (SELECT resource_id FROM resource_tags WHERE key = ?" + (" AND value = ?)" if tag_value is not None else ")")
+            params.extend([tag] if tag_value is None else [tag, tag_value])
+        rows = self._connection().execute(query + " ORDER BY name", params)
+        return [{**dict(row), "tags": json.loads(row["tags"] or "{}")} for row in rows]
+
+
+class ResourceGraphChangeFeed:
+    """ Changed resources of a subscription, from Resource Graph's resourcechanges table."""
+
+    def __init__(self, inventory: Optional[ResourceGraphInventory] = None):
+        self._inventory = inventory
+
+    @property
+    def inventory(self) -> ResourceGraphInventory:
+        return self._inventory or get_inventory()
+
+    async def changes_since(self, subscription_id: str, since: str) -> List[Dict[str, Any]]:
+        query = " | ".join([
+            "resourcechanges",
+            f"where subscriptionId =~ {kql_string(subscription_id)}",
+            f"where properties.changeAttributes.timestamp > datetime({since})",
+            "project id = tostring(properties.targetResourceId), "
+            "changeType = tostring(properties.changeType), "
+            "timestamp = tostring(properties.changeAttributes.timestamp)",
+        ])
+        rows = []
+        async for page in self.inventory.query_pages(query, [subscription_id]):
+            rows.extend(page["rows"])
+        return rows
+
+    async def current(self, subscription_id: str, resource_ids: List[str]) -> List[Dict[str, Any]]:
+        """ Current state of the given resources, ids that no longer exist are left out."""
+        resources = []
+        for start in range(0, len(resource_ids), CHANGE_FEED_BATCH_SIZE):
+            batch = resource_ids[start:start + CHANGE_FEED_BATCH_SIZE]
+            query = " | ".join([
+                "Resources",
+                f"where id in~ ({', '.join(kql_string(resource_id) for resource_id in batch)})",
+                "project id, name, type, location, kind, resourceGroup, tags",
+            ])
+            async for page in self.inventory.query_pages(query, [subscription_id]):
+                for row in page["rows"]:
+                    resources.append({
+                        "id": row["id"],
+                        "name": row["name"],
+                        "type": row.get("type"),
+                        "location": row.get("location"),
+                        "kind": row.get("kind"),
+                        "resource_group": row.get("resourceGroup"),
+                        "tags": row.get("tags") or {},
+                    })
+        return resources
+
+
+class InventorySnapshot:
+    def __init__(
+        self,
+        list_resource_groups: Callable[[str], Awaitable[List[Dict[str, Any]]]],
+        list_resources: Callable[[str, str], Awaitable[List[Dict[str, Any]]]],
+        change_feed: Optional[ResourceGraphChangeFeed] = None,
+        database: Optional[InventoryDatabase] = None,
+        max_staleness_seconds: float = INVENTORY_MAX_STALENESS_SECONDS,
+        full_sync_seconds: float = INVENTORY_FULL_SYNC_SECONDS,
+        list_concurrency: int = INVENTORY_LIST_CONCURRENCY,
+        enabled: bool = INVENTORY_SNAPSHOT_ENABLED,
+    ):
+        self.list_resource_groups = list_resource_groups
+        self.list_resources = list_resources
+        self.change_feed = change_feed
+        self.database = database or InventoryDatabase()
+        self.max_staleness_seconds = max_staleness_seconds
+        self.full_sync_seconds = full_sync_seconds
+        self.list_concurrency = list_concurrency
+        self.enabled = enabled
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._warming: Dict[str, asyncio.Task] = {}
+        self.stats = {"full_syncs": 0, "delta_syncs": 0, "upserted": 0, "deleted": 0, "reads": 0}
+
+    # ---- reads
+
+    async def resource_groups(self, subscription_id: str) -> List[Dict[str, Any]]:
+        await self.ensure_fresh(subscription_id, background_full_sync=True)
+        self.stats["reads"] += 1
+        return await run_blocking(self.database.resource_groups, subscription_id)
+
+    async def resources(self, subscription_id: str, **filters) -> List[Dict[str, Any]]:
+        await self.ensure_fresh(subscription_id, background_full_sync=True)
+        self.stats["reads"] += 1
+        return await run_blocking(self.database.resources, subscription_id, **filters)
+
+    async def is_synced(self, subscription_id: str) -> bool:
+        """ Whether the subscription has been listed into the snapshot at all."""
+        return await run_blocking(self.database.sync_state, subscription_id.lower()) is not None
+
+    async def has_resource_group(self, subscription_id: str, name: str) -> bool:
+        await self.ensure_fresh(subscription_id, background_full_sync=True)
+        return await run_blocking(self.database.has_resource_group, subscription_id.lower(), name)
+
+    def warm(self, subscription_id: str) -> asyncio.Task:
+        """ Start a full sync of a subscription in the background, once at a time.
+
+        A full sync lists every resource group, so callers shouldn't wait for
+        it: they answer from ARM until the subscription is first synced, and
+        from the current snapshot when it is re-listed.
+        """
+        key = subscription_id.lower()
+        task = self._warming.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._warm(key))
+            self._warming[key] = task
+        return task
+
+    async def _warm(self, subscription_id: str) -> None:
+        try:
+            await self.ensure_fresh(subscription_id)
+        except Exception as e:
+            print(f"Warming the inventory snapshot of {subscription_id} failed: {e}")
+        finally:
+            self._warming.pop(subscription_id, None)
+
+    async def ensure_fresh(
+        self,
+        subscription_id: str,
+        max_staleness_seconds: Optional[float] = None,
+        background_full_sync: bool = False,
+    ) -> Dict[str, Any]:
+        """ Refresh the subscription first if its snapshot is older than the bound (or missing).
+
+        With background_full_sync a due full re-list is left to warm() and the
+        current snapshot is returned meanwhile, so the caller waits for a delta
+        refresh at most.
+        """
+        bound = self.max_staleness_seconds if max_staleness_seconds is None else max_staleness_seconds
+        key = subscription_id.lower()
+        state = await run_blocking(self.database.sync_state, key)
+        if state is not None and time.time() - state["refreshed_at"] <= bound:
+            return state
+        # The running full sync holds the lock, don't queue up behind it
+        if background_full_sync and state is not None and (key in self._warming or self._needs_full_sync(state)):
+            self.warm(key)
+            return state
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another caller may have refreshed it while we waited
+            state = await run_blocking(self.database.sync_state, key)
+            if state is None or time.time() - state["refreshed_at"] > bound:
+                await self._refresh(key, state, background_full_sync=background_full_sync and state is not None)
+                state = await run_blocking(self.database.sync_state, key)
+        return state
+
+    # ---- refresh
+
+    async def refresh(self, subscription_id: str, full: bool = False) -> Dict[str, Any]:
+        key = subscription_id.lower()
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            state = None if full else await run_blocking(self.database.sync_state, key)
+            return await self._refresh(key, state)
+
+    def _needs_full_sync(self, state: Optional[Dict[str, Any]]) -> bool:
+        now = time.time()
+        return (
+            state is None
+            or self.change_feed is None
+            or now - state["refreshed_at"] > CHANGE_FEED_RETENTION_SECONDS
+            or now - state["full_sync_at"] > self.full_sync_seconds
+        )
+
+    async def _refresh(self, subscription_id: str, state: Optional[Dict[str, Any]], background_full_sync: bool = False) -> Dict[str, Any]:
+        if self._needs_full_sync(state):
+            if background_full_sync:
+                self.warm(subscription_id)
+                return {"mode": "full", "background": True}
+            return await self._full_sync(subscription_id)
+        try:
+            return await self._delta_sync(subscription_id, state)
+        except Exception as e:
+            if background_full_sync:
+                print(f"Delta refresh of {subscription_id} failed, listing it in full in the background: {e}")
+                self.warm(subscription_id)
+                return {"mode": "full", "background": True}
+            print(f"Delta refresh of {subscription_id} failed, listing it in full: {e}")
+            return await self._full_sync(subscription_id)
+
+    async def _full_sync(self, subscription_id: str) -> Dict[str, Any]:
+        started = time.time()
+        resource_groups = await self.list_resource_groups(subscription_id)
+        semaphore = asyncio.Semaphore(self.list_concurrency)
+
+        async def list_group(group: Dict[str, Any]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self._list_group(subscription_id, group["name"])
+
+        listings = await asyncio.gather(*(list_group(group) for group in resource_groups))
+        resources = [resource for listing in listings for resource in listing]
+
+        await run_blocking(self.database.replace_subscription, subscription_id, resource_groups, resources, started)
+        tool_cache.invalidate(subscription_id=subscription_id)
+        self.stats["full_syncs"] += 1
+        self.stats["upserted"] += len(resources)
+        return {"mode": "full", "resource_groups": len(resource_groups), "upserted": len(resources), "deleted": 0,
+                "seconds": round(time.time() - started, 3)}
+
+    async def _list_group(self, subscription_id: str, resource_group: str) -> List[Dict[str, Any]]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            resources = await self.list_resources(subscription_id, resource_group)
+        except ResourceNotFoundError:
+            # Deleted between listing the groups and listing its resources
+            return []
+        return [{**resource, "resource_group": resource_group} for resource in resources]
+
+    async def _delta_sync(self, subscription_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.time()
+        since = datetime.strptime(state["watermark"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        since -= timedelta(seconds=CHANGE_FEED_OVERLAP_SECONDS)
+
+        # The group list is one cheap call, it catches created and deleted groups
+        resource_groups = await self.list_resource_groups(subscription_id)
+        known_groups = {group["name"].lower() for group in await run_blocking(self.database.resource_groups, subscription_id)}
+        current_groups = {group["name"].lower(): group["name"] for group in resource_groups}
+        removed_groups = sorted(known_groups - current_groups.keys())
+        added_groups = [current_groups[name] for name in current_groups.keys() - known_groups]
+
+        changes = await self.change_feed.changes_since(subscription_id, since.strftime("%Y-%m-%dT%H:%M:%SZ"))
+        latest: Dict[str, Dict[str, Any]] = {}
+        for change in sorted(changes, key=lambda change: change.get("timestamp") or ""):
+            latest[change["id"].lower()] = change
+        deletes = [change["id"] for change in latest.values() if change.get("changeType") == "Delete"]
+        changed = [change["id"] for change in latest.values() if change.get("changeType") != "Delete"]
+
+        upserts = await self.change_feed.current(subscription_id, changed) if changed else []
+        found = {resource["id"].lower() for resource in upserts}
+        # Changed, then deleted before we got to it
+        deletes.extend(resource_id for resource_id in changed if resource_id.lower() not in found)
+        for group in added_groups:
+            upserts.extend(await self._list_group(subscription_id, group))
+
+        await run_blocking(
+            self.database.apply_delta, subscription_id, resource_groups, upserts, deletes, removed_groups, started
+        )
+        for resource_id in [*deletes, *(resource["id"] for resource in upserts)]:
+            tool_cache.invalidate_resource_id(resource_id)
+        if added_groups or removed_groups:
+            tool_cache.invalidate(subscription_id=subscription_id, tools=["list_resource_groups"])
+        for group in removed_groups:
+            tool_cache.invalidate(subscription_id=subscription_id, resource_group=group)
+
+        self.stats["delta_syncs"] += 1
+        self.stats["upserted"] += len(upserts)
+        self.stats["deleted"] += len(deletes)
+        return {"mode": "delta", "resource_groups": len(resource_groups), "changes": len(changes),
+                "upserted": len(upserts), "deleted": len(deletes), "seconds": round(time.time() - started, 3)}
+
+    async def run_background(self, subscriptions: Iterable[str] = (), interval_seconds: float = INVENTORY_REFRESH_INTERVAL_SECONDS) -> None:
+        """ Keep every known subscription (and the given ones) fresh until cancelled."""
+        extra = {subscription.lower() for subscription in subscriptions if subscription}
+        while True:
+            known = set(await run_blocking(self.database.subscriptions)) | extra
+            for subscription_id in sorted(known):
+                try:
+                    await self.ensure_fresh(subscription_id, max_staleness_seconds=interval_seconds)
+                except Exception as e:
+                    print(f"Background refresh of {subscription_id} failed: {e}")
+            await asyncio.sleep(interval_seconds)
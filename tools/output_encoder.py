@@ -0,0 +1,178 @@
+import json
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Shared encoder for what the tools hand back to the model.
+#
+# Every tool result is serialized into the prompt, so its size drives the
+# latency and cost of the next model turn. Listings are returned as one table
+# that states its keys once ({"columns", "rows"}) instead of a list of dicts,
+# only the requested columns are kept and columns that are empty in every row
+# are left out. ARM ids share their /subscriptions/.../resourceGroups/... part
+# within a listing, so it is stated once as "id_prefix" and the rows only keep
+# the rest of the id.
+#
+# A table that would exceed TOOL_OUTPUT_TOKEN_BUDGET tokens is cut off and the
+# rows that didn't fit are summarized under "more", e.g. how many of each type
+# were left out, so the model can narrow the call down with the tool's filters.
+# Tokens are counted with tiktoken when it is installed and estimated from the
+# serialized length otherwise. A budget of 0 disables the truncation.
+
+TOOL_OUTPUT_TOKEN_BUDGET = int(os.getenv("TOOL_OUTPUT_TOKEN_BUDGET", "4000"))
+TOOL_OUTPUT_TOKEN_ENCODING = os.getenv("TOOL_OUTPUT_TOKEN_ENCODING", "o200k_base")
+
+# Characters per token for the estimate when tiktoken isn't available. JSON
+# with ARM names and ids comes out at about 3 characters per token.
+CHARS_PER_TOKEN = 3.0
+
+# How many distinct values the "more" summary lists counts for
+MORE_SUMMARY_VALUES = 10
+
+_encoding = None
+
+
+def _token_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOOL_OUTPUT_TOKEN_ENCODING)
+        except Exception:
+            # Not installed, or the encoding can't be downloaded: fall back to the estimate
+            _encoding = False
+    return _encoding or None
+
+
+def serialize(value: Any) -> str:
+    """ The text the model sees for a tool result: strings as they are, anything else as JSON."""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+def count_tokens(value: Any) -> int:
+    """ Tokens a tool result takes up in the prompt."""
+    text = serialize(value)
+    encoding = _token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def filter_records(
+    records: Iterable[Dict[str, Any]],
+    resource_type: Optional[str] = None,
+    location: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """ Keep the records matching every given filter, compared case-insensitively like ARM does."""
+    resource_type = resource_type.strip().lower() if resource_type else None
+    location = location.strip().lower().replace(" ", "") if location else None
+    name_prefix = name_prefix.strip().lower() if name_prefix else None
+
+    return [
+        record for record in records
+        if (not resource_type or (record.get("type") or "").lower() == resource_type)
+        and (not location or (record.get("location") or "").lower().replace(" ", "") == location)
+        and (not name_prefix or (record.get("name") or "").lower().startswith(name_prefix))
+    ]
+
+
+def common_id_prefix(ids: Sequence[str]) -> str:
+    """ The longest path prefix ("/subscriptions/.../") all ids share, ending at a '/'."""
+    ids = [resource_id for resource_id in ids if isinstance(resource_id, str)]
+    if not ids:
+        return ""
+    shortest, longest = min(ids), max(ids)
+    length = 0
+    while length < len(shortest) and shortest[length] == longest[length]:
+        length += 1
+    prefix = shortest[:length]
+    # Never cut an id down to nothing
+    if length == len(shortest):
+        prefix = prefix[:-1]
+    return prefix[:prefix.rfind("/") + 1]
+
+
+def compact_table(
+    table: Dict[str, Any],
+    id_column: Optional[str] = "id",
+    summarize_by: Optional[str] = None,
+    budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """ Return a compacted copy of a {"columns", "rows", ...} result, see the module comment.
+
+    The other keys of the table are kept. The result gets "total" (rows before
+    truncation), "id_prefix" when ids were shortened and "more" with the
+    counts per summarize_by value of the rows that were cut off.
+    """
+    budget = TOOL_OUTPUT_TOKEN_BUDGET if budget is None else budget
+    columns, rows = list(table["columns"]), [list(row) for row in table["rows"]]
+
+    # Counted from the original rows, so the summary works even if the column is left out
+    summary_values = [row[columns.index(summarize_by)] for row in rows] if summarize_by in columns else None
+
+    keep = [index for index, column in enumerate(columns) if any(row[index] not in (None, "", {}, []) for row in rows)]
+    if rows and len(keep) < len(columns):
+        columns = [columns[index] for index in keep]
+        rows = [[row[index] for index in keep] for row in rows]
+
+    result = {key: value for key, value in table.items() if key not in ("columns", "rows")}
+    result["columns"] = columns
+
+    if id_column in columns and rows:
+        index = columns.index(id_column)
+        prefix = common_id_prefix([row[index] for row in rows])
+        if prefix:
+            result["id_prefix"] = prefix
+            for row in rows:
+                if isinstance(row[index], str):
+                    row[index] = row[index][len(prefix):]
+
+    result["rows"] = rows
+    result["total"] = len(rows)
+    if budget <= 0 or count_tokens(result) <= budget:
+        return result
+
+    # Fill up to the budget row by row, keeping room for the "more" summary
+    used = count_tokens({**result, "rows": []}) + 40
+    fitted = 0
+    for row in rows:
+        used += count_tokens(row) + 1
+        if used > budget:
+            break
+        fitted += 1
+
+    result["rows"] = rows[:fitted]
+    more: Dict[str, Any] = {"rows": len(rows) - fitted}
+    if summary_values is not None:
+        counts = Counter(str(value) for value in summary_values[fitted:])
+        more[summarize_by] = dict(counts.most_common(MORE_SUMMARY_VALUES))
+        if len(counts) > MORE_SUMMARY_VALUES:
+            more["other_values"] = len(counts) - MORE_SUMMARY_VALUES
+    result["more"] = more
+    return result
+
+
+def encode_table(
+    records: Iterable[Dict[str, Any]],
+    columns: Sequence[str],
+    fields: Optional[Sequence[str]] = None,
+    id_column: Optional[str] = "id",
+    summarize_by: Optional[str] = None,
+    budget: Optional[int] = None,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """ Encode a list of dicts as a compact table of `columns`, projected to `fields` if given.
+
+    Unknown field names are ignored, a projection without any known field
+    falls back to all columns. Extra keyword arguments go into the result
+    ahead of the table.
+    """
+    if fields:
+        wanted = {field.strip().lower() for field in fields}
+        columns = [column for column in columns if column.lower() in wanted] or list(columns)
+    table = {**extra, "columns": list(columns), "rows": [[record.get(column) for column in columns] for record in records]}
+    return compact_table(table, id_column=id_column, summarize_by=summarize_by, budget=budget)
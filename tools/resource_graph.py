@@ -0,0 +1,153 @@
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from tools.azure_clients import get_resource_graph_client
+
+# Subscription-wide inventory through Azure Resource Graph.
+#
+# Listing resources through ARM takes one paged call per resource group, so a
+# question about "all my VMs" in a tenant with hundreds of resource groups is
+# hundreds of round trips. Resource Graph answers a KQL query across every
+# resource group and subscription the caller can see in one paged request,
+# with the filtering and projection done server-side.
+
+RESOURCE_GRAPH_PAGE_SIZE = int(os.getenv("RESOURCE_GRAPH_PAGE_SIZE", "1000"))
+RESOURCE_GRAPH_MAX_ROWS = int(os.getenv("RESOURCE_GRAPH_MAX_ROWS", "5000"))
+
+RESOURCE_COLUMNS = ["name", "type", "location", "kind", "resourceGroup", "subscriptionId", "id"]
+GROUP_BY_COLUMNS = ("type", "location", "resourceGroup", "subscriptionId", "kind")
+
+
+def kql_string(value: str) -> str:
+    """ Quote a value as a KQL string literal."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _filters(
+    resource_type: Optional[str] = None,
+    resource_group: Optional[str] = None,
+    location: Optional[str] = None,
+    name_contains: Optional[str] = None,
+) -> List[str]:
+    # =~ and contains are case-insensitive, like ARM names
+    filters = []
+    if resource_type:
+        filters.append(f"where type =~ {kql_string(resource_type)}")
+    if resource_group:
+        filters.append(f"where resourceGroup =~ {kql_string(resource_group)}")
+    if location:
+        filters.append(f"where location =~ {kql_string(location)}")
+    if name_contains:
+        filters.append(f"where name contains {kql_string(name_contains)}")
+    return filters
+
+
+def resources_query(**filters) -> str:
+    return " | ".join(["Resources", *_filters(**filters), f"project {', '.join(RESOURCE_COLUMNS)}", "order by id asc"])
+
+
+def summary_query(group_by: str, **filters) -> str:
+    if group_by not in GROUP_BY_COLUMNS:
+        raise ValueError(f"Can't group by '{group_by}', use one of {', '.join(GROUP_BY_COLUMNS)}")
+    return " | ".join(["Resources", *_filters(**filters), f"summarize count_=count() by {group_by}", "order by count_ desc"])
+
+
+class ResourceGraphInventory:
+    def __init__(self, client=None, page_size: int = RESOURCE_GRAPH_PAGE_SIZE, enforce_https: bool = True):
+        self._client = client
+        self.page_size = page_size
+        # Only the local fake endpoint (plain http) turns this off
+        self.enforce_https = enforce_https
+        self.stats = {"queries": 0, "pages": 0}
+
+    @property
+    def client(self):
+        return self._client or get_resource_graph_client()
+
+    async def query_pages(
+        self,
+        query: str,
+        subscription_ids: Optional[List[str]] = None,
+        max_rows: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """ Yield the result pages of a query as {"rows", "total_records"}, following $skipToken.
+
+        Without subscription_ids the query covers every subscription the credential can read.
+        """
+        from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+
+        self.stats["queries"] += 1
+        skip_token = None
+        fetched = 0
+        while True:
+            top = self.page_size if max_rows is None else min(self.page_size, max_rows - fetched)
+            request = QueryRequest(
+                subscriptions=subscription_ids or None,
+                query=query,
+                options=QueryRequestOptions(result_format="objectArray", top=top, skip_token=skip_token),
+            )
+            kwargs = {} if self.enforce_https else {"enforce_https": False}
+            response = await self.client.resources(request, **kwargs)
+            self.stats["pages"] += 1
+
+            rows = response.data or []
+            fetched += len(rows)
+            yield {"rows": rows, "total_records": response.total_records}
+
+            skip_token = response.skip_token
+            if not skip_token or not rows or (max_rows is not None and fetched >= max_rows):
+                return
+
+    async def query(self, query: str, subscription_ids: Optional[List[str]] = None, max_rows: int = RESOURCE_GRAPH_MAX_ROWS) -> Dict[str, Any]:
+        """ Run a query and collect up to max_rows rows."""
+        rows: List[Dict[str, Any]] = []
+        total_records = 0
+        async for page in self.query_pages(query, subscription_ids, max_rows=max_rows):
+            rows.extend(page["rows"])
+            total_records = page["total_records"] or len(rows)
+        return {"rows": rows[:max_rows], "total_records": total_records, "truncated": total_records > len(rows)}
+
+    async def find_resources(
+        self,
+        subscription_ids: Optional[List[str]] = None,
+        resource_type: Optional[str] = None,
+        resource_group: Optional[str] = None,
+        location: Optional[str] = None,
+        name_contains: Optional[str] = None,
+        max_rows: int = RESOURCE_GRAPH_MAX_ROWS,
+    ) -> Dict[str, Any]:
+        query = resources_query(
+            resource_type=resource_type, resource_group=resource_group, location=location, name_contains=name_contains
+        )
+        result = await self.query(query, subscription_ids, max_rows=max_rows)
+        return {
+            "columns": RESOURCE_COLUMNS,
+            "rows": [[row.get(column) for column in RESOURCE_COLUMNS] for row in result["rows"]],
+            "total_records": result["total_records"],
+            "truncated": result["truncated"],
+        }
+
+    async def summarize_resources(
+        self,
+        group_by: str = "type",
+        subscription_ids: Optional[List[str]] = None,
+        resource_type: Optional[str] = None,
+        resource_group: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        query = summary_query(group_by, resource_type=resource_type, resource_group=resource_group, location=location)
+        result = await self.query(query, subscription_ids)
+        return {
+            "columns": [group_by, "count"],
+            "rows": [[row.get(group_by), row.get("count_")] for row in result["rows"]],
+        }
+
+
+_inventory: Optional[ResourceGraphInventory] = None
+
+
+def get_inventory() -> ResourceGraphInventory:
+    global _inventory
+    if _inventory is None:
+        _inventory = ResourceGraphInventory()
+    return _inventory
@@ -0,0 +1,256 @@
+import asyncio
+import copy
+import functools
+import inspect
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# Shared memoization layer for the agent's tools.
+#
+# The model often calls the same read-only tool several times in one
+# conversation, and many users ask about the same subscriptions, so tool
+# results are cached process-wide. Entries are keyed on the tool name and its
+# normalized arguments (ARM names are case-insensitive), expire after a per-tool
+# TTL and are evicted least-recently-used once the cache is full. Concurrent
+# identical calls share one in-flight call instead of each hitting ARM.
+#
+# Every entry records the ARM scope it was read from (subscription and
+# resource group), so a change to a resource only drops the entries that
+# could have seen it, see invalidate() and invalidate_resource_id().
+#
+# Put @cached_tool beneath @ai_function so the tool's schema is still built
+# from the original signature.
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+
+# Argument names that identify the ARM scope an entry was read from
+SUBSCRIPTION_ARGS = ("subscription_id",)
+RESOURCE_GROUP_ARGS = ("resource_group", "resource_group_name")
+
+
+def _normalize(value: Any) -> Hashable:
+    if isinstance(value, str):
+        return value.strip().lower()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), _normalize(item)) for key, item in value.items()))
+    return value
+
+
+def _is_error(result: Any) -> bool:
+    """ Tools report failures as {"error": ...} (or a list of them), those aren't cached.
+
+    Partial results listing per-item "errors" aren't cached either, the
+    failures may be transient (throttling) and the next call can fill them in.
+    """
+    if isinstance(result, dict):
+        return "error" in result or bool(result.get("errors"))
+    if isinstance(result, list):
+        return any(isinstance(item, dict) and "error" in item for item in result)
+    return False
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "subscription", "resource_group")
+
+    def __init__(self, value: Any, expires_at: float, subscription: Optional[str], resource_group: Optional[str]):
+        self.value = value
+        self.expires_at = expires_at
+        self.subscription = subscription
+        self.resource_group = resource_group
+
+
+class ToolResultCache:
+    """ TTL + LRU cache of tool results with single-flight loading."""
+
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES, enabled: bool = TOOL_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        # Bumped on every invalidation, a call that started before one isn't cached
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _tool_stats(self, tool: str) -> Dict[str, int]:
+        stats = self._stats.get(tool)
+        if stats is None:
+            stats = self._stats[tool] = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """ Hit/miss counters per tool plus totals."""
+        totals: Dict[str, int] = {}
+        for stats in self._stats.values():
+            for name, count in stats.items():
+                totals[name] = totals.get(name, 0) + count
+        lookups = totals.get("hits", 0) + totals.get("misses", 0) + totals.get("coalesced", 0)
+        hit_rate = (totals.get("hits", 0) + totals.get("coalesced", 0)) / lookups if lookups else 0.0
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round(hit_rate, 3),
+            "totals": totals,
+            "tools": {tool: dict(stats) for tool, stats in self._stats.items()},
+        }
+
+    async def get_or_call(
+        self,
+        key: Tuple,
+        ttl_seconds: float,
+        call: Callable[[], Any],
+        subscription: Optional[str] = None,
+        resource_group: Optional[str] = None,
+        cache_if: Callable[[Any], bool] = lambda result: not _is_error(result),
+    ) -> Any:
+        tool = key[0]
+        stats = self._tool_stats(tool)
+        if not self.enabled:
+            stats["misses"] += 1
+            return await call()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                stats["hits"] += 1
+                self._entries.move_to_end(key)
+                # Callers may mutate what they get back, the cached copy stays intact
+                return copy.deepcopy(entry.value)
+            del self._entries[key]
+
+        loop = asyncio.get_running_loop()
+        future = self._in_flight.get(key)
+        if future is not None and future.get_loop() is loop:
+            stats["coalesced"] += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The call we were waiting for was cancelled, not us: make our own
+                return await self.get_or_call(key, ttl_seconds, call, subscription, resource_group, cache_if)
+
+        stats["misses"] += 1
+        future = loop.create_future()
+        self._in_flight[key] = future
+        generation = self._generation
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting, don't log "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if cache_if(result) and generation == self._generation:
+                self._store(key, result, time.monotonic() + ttl_seconds, subscription, resource_group)
+            return copy.deepcopy(result)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _store(self, key: Tuple, value: Any, expires_at: float, subscription: Optional[str], resource_group: Optional[str]) -> None:
+        self._entries[key] = _Entry(value, expires_at, subscription, resource_group)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._tool_stats(evicted_key[0])["evictions"] += 1
+
+    def invalidate(
+        self,
+        subscription_id: Optional[str] = None,
+        resource_group: Optional[str] = None,
+        tools: Optional[Iterable[str]] = None,
+    ) -> int:
+        """ Drop the entries read from a subscription / resource group (or of some tools).
+
+        Entries without a resource group (e.g. the subscription's resource group
+        list) are dropped on any change in their subscription, as that change
+        may have added or removed a resource group.
+        """
+        subscription_id = _normalize(subscription_id) if subscription_id else None
+        resource_group = _normalize(resource_group) if resource_group else None
+        tools = set(tools) if tools is not None else None
+
+        self._generation += 1
+        dropped = 0
+        for key, entry in list(self._entries.items()):
+            if tools is not None and key[0] not in tools:
+                continue
+            if subscription_id is not None and entry.subscription not in (None, subscription_id):
+                continue
+            if resource_group is not None and entry.resource_group not in (None, resource_group):
+                continue
+            del self._entries[key]
+            self._tool_stats(key[0])["invalidations"] += 1
+            dropped += 1
+        return dropped
+
+    def invalidate_resource_id(self, resource_id: str) -> int:
+        """ Drop the entries a change to an ARM resource (or resource group) may have made stale."""
+        subscription_id, resource_group = parse_resource_scope(resource_id)
+        if subscription_id is None:
+            return 0
+        return self.invalidate(subscription_id=subscription_id, resource_group=resource_group)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+
+def parse_resource_scope(resource_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """ Return (subscription, resource group) of an ARM id like /subscriptions/x/resourceGroups/y/..."""
+    parts = [part for part in resource_id.split("/") if part]
+    subscription_id = resource_group = None
+    for name, value in zip(parts[::2], parts[1::2]):
+        if name.lower() == "subscriptions" and subscription_id is None:
+            subscription_id = value
+        elif name.lower() == "resourcegroups" and resource_group is None:
+            resource_group = value
+    return subscription_id, resource_group
+
+
+tool_cache = ToolResultCache()
+
+
+def cached_tool(ttl_seconds: float, name: Optional[str] = None, cache: Optional[ToolResultCache] = None):
+    """ Memoize an async tool for ttl_seconds, keyed on its normalized arguments.
+
+    The TTL can be overridden per tool with TOOL_CACHE_TTL_<TOOL NAME>.
+    """
+    def decorator(func):
+        tool_name = name or func.__name__
+        ttl = float(os.getenv(f"TOOL_CACHE_TTL_{tool_name.upper()}", ttl_seconds))
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            target = cache or tool_cache
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            key = (tool_name,) + tuple((arg, _normalize(value)) for arg, value in sorted(arguments.items()))
+            subscription = next((_normalize(arguments[arg]) for arg in SUBSCRIPTION_ARGS if arguments.get(arg)), None)
+            resource_group = next((_normalize(arguments[arg]) for arg in RESOURCE_GROUP_ARGS if arguments.get(arg)), None)
+            return await target.get_or_call(
+                key,
+                ttl,
+                lambda: func(*args, **kwargs),
+                subscription=subscription,
+                resource_group=resource_group,
+            )
+
+        wrapper.cache_ttl_seconds = ttl
+        return wrapper
+
+    return decorator
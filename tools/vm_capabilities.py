@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from tools.concurrency import run_blocking
+
+# Per-location cache of VM size capabilities.
+#
+# The sizes and resource SKU catalogs hold thousands of entries per location
+# and almost never change, so they are fetched once per location, indexed by
+# SKU name and kept for a TTL. The least recently used locations are evicted
+# once the cache is full. When a persist path is configured the index is also
+# written to disk so a restarted worker starts warm.
+#
+# If only one of the two catalogs could be listed, the partial index is used
+# for CAPABILITY_CACHE_PARTIAL_TTL_SECONDS and never written to disk, so the
+# missing capabilities are fetched again soon instead of a day later.
+
+CAPABILITY_CACHE_TTL_SECONDS = int(os.getenv("VM_CAPABILITY_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+CAPABILITY_CACHE_MAX_LOCATIONS = int(os.getenv("VM_CAPABILITY_CACHE_MAX_LOCATIONS", "16"))
+CAPABILITY_CACHE_PATH = os.getenv("VM_CAPABILITY_CACHE_PATH")
+CAPABILITY_CACHE_PARTIAL_TTL_SECONDS = int(os.getenv("VM_CAPABILITY_CACHE_PARTIAL_TTL_SECONDS", "300"))
+
+
+class VMCapabilityCache:
+    def __init__(
+        self,
+        ttl_seconds: int = CAPABILITY_CACHE_TTL_SECONDS,
+        max_locations: int = CAPABILITY_CACHE_MAX_LOCATIONS,
+        persist_path: Optional[str] = CAPABILITY_CACHE_PATH,
+        partial_ttl_seconds: int = CAPABILITY_CACHE_PARTIAL_TTL_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.partial_ttl_seconds = partial_ttl_seconds
+        self.max_locations = max_locations
+        self.persist_path = Path(persist_path) if persist_path else None
+        # location -> {"loaded_at": epoch seconds, "skus": {sku name -> capabilities}, "partial": bool}
+        self._locations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._restored = False
+
+    async def lookup(self, compute, location: str, vm_size: str) -> Dict[str, Any]:
+        """ Return the capabilities of a VM size in a location, or an empty dict if unknown."""
+        skus = await self.get_location(compute, location)
+        return skus.get(vm_size.lower(), {})
+
+    async def get_location(self, compute, location: str) -> Dict[str, Dict[str, Any]]:
+        """ Return the capability index for a location, loading it at most once per TTL."""
+        location = location.lower()
+        await self._restore()
+
+        entry = self._fresh_entry(location)
+        if entry is not None:
+            return entry["skus"]
+
+        lock = self._locks.setdefault(location, asyncio.Lock())
+        async with lock:
+            # Another caller may have loaded the location while we waited.
+            entry = self._fresh_entry(location)
+            if entry is not None:
+                return entry["skus"]
+
+            skus, partial = await _load_location(compute, location)
+            self._locations[location] = {"loaded_at": time.time(), "skus": skus, "partial": partial}
+            self._locations.move_to_end(location)
+            while len(self._locations) > self.max_locations:
+                self._locations.popitem(last=False)
+
+            if not partial:
+                await self._persist()
+            return skus
+
+    def clear(self) -> None:
+        self._locations.clear()
+
+    def _fresh_entry(self, location: str) -> Optional[Dict[str, Any]]:
+        entry = self._locations.get(location)
+        if entry is None:
+            return None
+        ttl_seconds = self.partial_ttl_seconds if entry.get("partial") else self.ttl_seconds
+        if time.time() - entry["loaded_at"] > ttl_seconds:
+            del self._locations[location]
+            return None
+        self._locations.move_to_end(location)
+        return entry
+
+    async def _restore(self) -> None:
+        if self._restored:
+            return
+        self._restored = True
+        if self.persist_path is None:
+            return
+        try:
+            data = await run_blocking(_read_json, self.persist_path)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"couldn't restore VM capability cache from {self.persist_path}: {e}")
+            return
+
+        now = time.time()
+        entries = sorted(data.items(), key=lambda item: item[1].get("loaded_at", 0))
+        for location, entry in entries[-self.max_locations:]:
+            if not entry.get("partial") and now - entry.get("loaded_at", 0) <= self.ttl_seconds:
+                self._locations[location] = entry
+
+    async def _persist(self) -> None:
+        if self.persist_path is None:
+            return
+        try:
+            complete = {location: entry for location, entry in self._locations.items() if not entry.get("partial")}
+            await run_blocking(_write_json, self.persist_path, complete)
+        except Exception as e:
+            print(f"couldn't persist VM capability cache to {self.persist_path}: {e}")
+
+
+async def _load_location(compute, location: str) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+    """ Index both catalogs of a location by SKU name, and whether one of them failed to list."""
+    sizes, skus = await asyncio.gather(
+        _list_sizes(compute, location),
+        _list_skus(compute, location),
+        return_exceptions=True,
+    )
+    if isinstance(sizes, Exception) and isinstance(skus, Exception):
+        raise sizes
+
+    index: Dict[str, Dict[str, Any]] = {}
+    if not isinstance(skus, Exception):
+        for name, capabilities in skus.items():
+            index.setdefault(name, {}).update(capabilities)
+    if not isinstance(sizes, Exception):
+        for name, max_data_disk_count in sizes.items():
+            index.setdefault(name, {})["max_data_disk_count"] = max_data_disk_count
+
+    partial = isinstance(sizes, Exception) or isinstance(skus, Exception)
+    if partial:
+        error = sizes if isinstance(sizes, Exception) else skus
+        print(f"VM capabilities for {location} are incomplete, retrying in a few minutes: {error}")
+    return index, partial
+
+
+async def _list_sizes(compute, location: str) -> Dict[str, Any]:
+    sizes = {}
+    async for size in compute.virtual_machine_sizes.list(location=location):
+        sizes[size.name.lower()] = size.max_data_disk_count
+    return sizes
+
+
+async def _list_skus(compute, location: str) -> Dict[str, Dict[str, Any]]:
+    skus = {}
+    async for sku in compute.resource_skus.list(filter=f"location eq '{location}'"):
+        if sku.resource_type != "virtualMachines" or not sku.capabilities:
+            continue
+        capabilities = {}
+        for capability in sku.capabilities:
+            if capability.name == "UncachedDiskIOPS":
+                capabilities["max_iops"] = capability.value
+            elif capability.name == "UncachedDiskBytesPerSecond":
+                # Convert bytes to MB/s
+                capabilities["max_throughput_mbps"] = str(int(capability.value) // (1024 * 1024))
+            elif capability.name == "MaxDataDiskCount":
+                capabilities["max_data_disk_count"] = capability.value
+        skus[sku.name.lower()] = capabilities
+    return skus
+
+
+def _read_json(path: Path) -> Dict[str, Any]:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+capability_cache = VMCapabilityCache()
@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import codecs
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Add project root to sys.path so 'tools' module can be imported when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.concurrency import run_blocking
+from tools.vm_metrics_store import VM_METRICS_FOLLOW_PATH
+
+# Streaming ingestion of VM metric exports into the time-series store.
+#
+# Readers are generators that yield (record, byte position) pairs, so a file
+# is never materialised in memory: JSON Lines are read line by line, and a
+# top-level JSON object or array is decoded one value at a time from a small
+# rolling buffer. Records are appended to the store in fixed-size batches.
+# The async pipeline puts a bounded queue between the reader and the writer,
+# so a slow writer pauses reading instead of letting RSS grow with the file.
+#
+# The time-series store lives in the process that queries it. The Teams and
+# DevUI hosts therefore follow VM_METRICS_FOLLOW_PATH themselves (see
+# follow_metrics_export) so the metric tools see new samples as they are
+# written; running this module as a script only loads a file into its own
+# process, e.g. to check an export and time the ingestion.
+
+CHUNK_SIZE = 1024 * 1024
+BATCH_SIZE = int(os.getenv("VM_METRICS_INGEST_BATCH_SIZE", "10000"))
+QUEUE_SIZE = int(os.getenv("VM_METRICS_INGEST_QUEUE_SIZE", "4"))
+FOLLOW_POLL_SECONDS = float(os.getenv("VM_METRICS_FOLLOW_POLL_SECONDS", "5"))
+
+Record = Dict[str, Any]
+
+
+@dataclass
+class IngestProgress:
+    records: int = 0
+    batches: int = 0
+    bytes_read: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def records_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.records / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.records} records in {self.batches} batches, {self.bytes_read / (1024 * 1024):.1f} MB read ({self.records_per_second:.0f} records/s)"
+
+
+def print_progress(progress: IngestProgress) -> None:
+    print(f"ingested {progress}")
+
+
+def iter_json_lines(path: str, start_offset: int = 0) -> Iterator[Tuple[Record, int]]:
+    """ Yield (record, end position) for every line of a JSON Lines file."""
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        position = start_offset
+        for line in f:
+            position += len(line)
+            if line.strip():
+                yield json.loads(line), position
+
+
+def iter_json_document(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[Record, int]]:
+    """ Yield (record, position) for every value of a top-level JSON object or array.
+
+    Values of an object keyed by VM name (data/vm_data.json) get the key added
+    as "name". Only one value plus one chunk is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    index = 0
+    position = 0
+    container = None
+
+    with open(path, "rb") as f:
+        def fill() -> bool:
+            nonlocal buffer, index, position
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return False
+            position += len(chunk)
+            buffer = buffer[index:] + utf8.decode(chunk)
+            index = 0
+            return True
+
+        def skip(characters: str) -> Optional[str]:
+            # Skip whitespace and the given separators, returning the next significant character
+            nonlocal index
+            while True:
+                while index < len(buffer) and (buffer[index].isspace() or buffer[index] in characters):
+                    index += 1
+                if index < len(buffer):
+                    return buffer[index]
+                if not fill():
+                    return None
+
+        def decode():
+            nonlocal index
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, index)
+                    # A number at the end of the buffer may continue in the next chunk
+                    if end < len(buffer) or not fill():
+                        index = end
+                        return value
+                except json.JSONDecodeError:
+                    if not fill():
+                        raise
+
+        start = skip("")
+        if start not in ("{", "["):
+            raise ValueError(f"{path} is not a JSON object or array")
+        container = start
+        index += 1
+
+        while True:
+            char = skip(",")
+            if char is None:
+                raise ValueError(f"{path} ended before the end of the top-level JSON value")
+            if char in "}]":
+                return
+            if container == "{":
+                name = decode()
+                skip(":")
+                value = decode()
+                if isinstance(value, dict):
+                    yield dict(value, name=name), position
+            else:
+                value = decode()
+                if isinstance(value, dict):
+                    yield value, position
+
+
+def iter_metrics_file(path: str) -> Iterator[Tuple[Record, int]]:
+    """ Pick the streaming reader for a metrics export based on its extension."""
+    if Path(path).suffix in (".jsonl", ".ndjson"):
+        return iter_json_lines(path)
+    return iter_json_document(path)
+
+
+async def tail_json_lines(
+    path: str,
+    start_offset: int = 0,
+    poll_interval: float = 1.0,
+    chunk_size: int = CHUNK_SIZE,
+    idle_marker: bool = False,
+) -> AsyncIterator[Tuple[Optional[Record], int]]:
+    """ Follow an append-only JSON Lines file, yielding records as complete lines are written.
+
+    A partially written last line is held back until its newline arrives. If
+    the file shrinks (rotated or truncated) reading restarts from the top.
+    Lines that aren't JSON objects are skipped. With idle_marker, (None,
+    position) is yielded whenever reading has caught up with the file, so
+    consumers can flush a partial batch.
+    """
+    offset = start_offset
+    pending = b""
+    while True:
+        chunk, size = await run_blocking(_read_from, path, offset, chunk_size)
+        if size < offset:
+            offset = 0
+            pending = b""
+            continue
+        if not chunk:
+            if idle_marker:
+                yield None, offset - len(pending)
+            await asyncio.sleep(poll_interval)
+            continue
+
+        offset += len(chunk)
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        position = offset - len(pending)
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                # One bad line from the exporter shouldn't stop the follower
+                print(f"skipping a line of {path} that isn't JSON: {e}")
+                continue
+            if isinstance(record, dict):
+                yield record, position
+
+
+def _read_from(path: str, offset: int, size: int) -> Tuple[bytes, int]:
+    try:
+        with open(path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size < offset:
+                return b"", file_size
+            f.seek(offset)
+            return f.read(size), file_size
+    except FileNotFoundError:
+        # The exporter may not have created the file yet
+        return b"", offset
+
+
+def batched(records: Iterable[Tuple[Record, int]], batch_size: int = BATCH_SIZE) -> Iterator[Tuple[List[Record], int]]:
+    """ Group (record, position) pairs into (records, last position) batches."""
+    batch: List[Record] = []
+    position = 0
+    for record, position in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch, position
+            batch = []
+    if batch:
+        yield batch, position
+
+
+def ingest(
+    records: Iterable[Tuple[Record, int]],
+    store=None,
+    batch_size: int = BATCH_SIZE,
+    on_progress: Optional[Callable[[IngestProgress], None]] = print_progress,
+) -> IngestProgress:
+    """ Append streamed records to the time-series store in batches."""
+    if store is None:
+        from tools.vm_timeseries import get_timeseries_store
+
+        store = get_timeseries_store()
+
+    progress = IngestProgress()
+    for batch, position in batched(records, batch_size):
+        store.append_records(batch)
+        progress.records += len(batch)
+        progress.batches += 1
+        progress.bytes_read = position
+        if on_progress:
+            on_progress(progress)
+    return progress
+
+
+async def ingest_async(
+    records: AsyncIterator[Tuple[Optional[Record], int]],
+    store=None,
+    batch_size: int = BATCH_SIZE,
+    queue_size: int = QUEUE_SIZE,
+    on_progress: Optional[Callable[[IngestProgress], None]] = print_progress,
+) -> IngestProgress:
+    """ Ingest an async record stream (such as tail_json_lines) with a bounded reader/writer queue.
+
+    A None record (tail_json_lines' idle marker) writes the partial batch
+    right away instead of holding it until the batch is full.
+    """
+    if store is None:
+        from tools.vm_timeseries import get_timeseries_store
+
+        store = await run_blocking(get_timeseries_store)
+
+    queue: "asyncio.Queue[Optional[Tuple[List[Record], int]]]" = asyncio.Queue(maxsize=queue_size)
+    progress = IngestProgress()
+
+    async def read():
+        batch: List[Record] = []
+        position = 0
+        try:
+            async for record, position in records:
+                if record is None:
+                    if batch:
+                        await queue.put((batch, position))
+                        batch = []
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    # Blocks while the writer is behind
+                    await queue.put((batch, position))
+                    batch = []
+            if batch:
+                await queue.put((batch, position))
+        finally:
+            await queue.put(None)
+
+    async def write():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            batch, position = item
+            await run_blocking(store.append_records, batch)
+            progress.records += len(batch)
+            progress.batches += 1
+            progress.bytes_read = position
+            if on_progress:
+                on_progress(progress)
+
+    reader = asyncio.create_task(read())
+    try:
+        await write()
+        # Surface errors raised while reading
+        await reader
+    finally:
+        reader.cancel()
+    return progress
+
+
+async def follow_metrics_export(
+    path: Optional[str] = VM_METRICS_FOLLOW_PATH,
+    poll_interval: float = FOLLOW_POLL_SECONDS,
+    on_progress: Optional[Callable[[IngestProgress], None]] = None,
+) -> IngestProgress:
+    """ Tail the exporter's JSON Lines file into the process-wide store the metric tools read, until cancelled.
+
+    The store is in memory, so the file is read from the top on every start.
+    """
+    from tools.vm_timeseries import get_timeseries_store
+
+    store = await run_blocking(get_timeseries_store)
+    records = tail_json_lines(path, poll_interval=poll_interval, idle_marker=True)
+    return await ingest_async(records, store=store, on_progress=on_progress)
+
+
+def start_follow_thread(path: Optional[str] = VM_METRICS_FOLLOW_PATH) -> Optional[threading.Thread]:
+    """ Follow the export on a daemon thread, for hosts that don't expose their event loop (DevUI)."""
+    if not path:
+        return None
+    thread = threading.Thread(target=asyncio.run, args=(follow_metrics_export(path),), name="vm-metrics-follow", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream a VM metrics export into a time-series store in this process, to check the export and time "
+                    "the ingestion. The agent hosts follow VM_METRICS_FOLLOW_PATH themselves."
+    )
+    parser.add_argument("path", help="JSON Lines (.jsonl/.ndjson) or JSON export to ingest")
+    parser.add_argument("--follow", action="store_true", help="keep tailing the JSON Lines file for appended records")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    from tools.vm_timeseries import get_timeseries_store
+
+    # Only the given file, the default export would be counted on top of it
+    store = get_timeseries_store(seed=False)
+    if args.follow:
+        asyncio.run(ingest_async(tail_json_lines(args.path, idle_marker=True), store=store, batch_size=args.batch_size))
+    else:
+        print(f"done: {ingest(iter_metrics_file(args.path), store=store, batch_size=args.batch_size)}")
+
+
+if __name__ == '__main__':
+    main()
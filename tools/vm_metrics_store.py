@@ -0,0 +1,225 @@
+import json
+import mmap
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Indexed, memory-mapped access to the VM metrics export.
+#
+# The export is either one JSON object keyed by VM name (data/vm_data.json) or
+# JSON Lines with one record per line. Building the index scans the file once
+# and records the byte span of every VM's record, together with its resource
+# group and timestamp. Lookups then decode only that span from a memory map,
+# so a call costs the same no matter how large the export grows. The index is
+# rebuilt only when the file's mtime or size changes, and is saved next to the
+# file so a restarted worker doesn't have to rescan it.
+
+DEFAULT_METRICS_PATH = Path(__file__).resolve().parents[1] / "data" / "vm_data.json"
+VM_METRICS_PATH = os.getenv("VM_METRICS_PATH", str(DEFAULT_METRICS_PATH))
+# JSON Lines file an exporter appends samples to, followed into the time-series
+# store by the agent hosts (see tools/vm_metrics_ingest.py). Unset: not followed.
+VM_METRICS_FOLLOW_PATH = os.getenv("VM_METRICS_FOLLOW_PATH")
+
+INDEX_VERSION = 1
+
+# JSON strings (with escapes) and the structural characters we need to track nesting
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\],:]')
+
+# name -> (start, end, resource group, timestamp)
+IndexEntry = Tuple[int, int, Optional[str], Optional[str]]
+
+
+class VMMetricsStore:
+    def __init__(self, path: str = VM_METRICS_PATH, persist_index: bool = True):
+        self.path = Path(path)
+        self.persist_index = persist_index
+        self._lock = threading.Lock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._entries: Dict[str, IndexEntry] = {}
+        self._by_resource_group: Dict[str, List[str]] = {}
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".idx.json")
+
+    def get(self, vm_name: str) -> Optional[Dict[str, Any]]:
+        """ Return the metrics record of a VM, or None if the export has no record for it."""
+        with self._lock:
+            self._ensure_index()
+            entry = self._entries.get(vm_name)
+            if entry is None:
+                return None
+            start, end, _, _ = entry
+            return json.loads(self._map[start:end])
+
+    def names(self) -> List[str]:
+        with self._lock:
+            self._ensure_index()
+            return list(self._entries)
+
+    def names_in_resource_group(self, resource_group: str) -> List[str]:
+        with self._lock:
+            self._ensure_index()
+            return list(self._by_resource_group.get(resource_group.lower(), []))
+
+    def names_since(self, timestamp: str) -> List[str]:
+        """ Return the VMs whose record timestamp is at or after an ISO-8601 timestamp."""
+        with self._lock:
+            self._ensure_index()
+            return [name for name, entry in self._entries.items() if entry[3] and entry[3] >= timestamp]
+
+    def iter_records(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            self._ensure_index()
+            records = [(name, json.loads(self._map[start:end])) for name, (start, end, _, _) in self._entries.items()]
+        return iter(records)
+
+    def build_index(self) -> None:
+        """ (Re)build the index from the source file."""
+        with self._lock:
+            self._open(force_rebuild=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _ensure_index(self) -> None:
+        # Caller holds self._lock
+        stat = os.stat(self.path)
+        if self._signature != (stat.st_mtime_ns, stat.st_size):
+            self._open()
+
+    def _open(self, force_rebuild: bool = False) -> None:
+        self._close()
+        self._file = open(self.path, "rb")
+        stat = os.fstat(self._file.fileno())
+        signature = (stat.st_mtime_ns, stat.st_size)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else None
+
+        entries = None if force_rebuild else self._load_saved_index(signature)
+        if entries is None:
+            entries = self._scan() if self._map is not None else {}
+            self._save_index(signature, entries)
+
+        self._entries = entries
+        self._by_resource_group = {}
+        for name, (_, _, resource_group, _) in entries.items():
+            if resource_group:
+                self._by_resource_group.setdefault(resource_group.lower(), []).append(name)
+        self._signature = signature
+
+    def _close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._map = None
+        self._file = None
+        self._signature = None
+
+    def _scan(self) -> Dict[str, IndexEntry]:
+        if self.path.suffix in (".jsonl", ".ndjson"):
+            spans = _scan_json_lines(self._map)
+        else:
+            spans = _scan_json_object(self._map)
+
+        entries = {}
+        for name, start, end in spans:
+            record = json.loads(self._map[start:end])
+            if not isinstance(record, dict):
+                # An array or other non-record value under a top-level key, not a VM
+                continue
+            entries[name] = (start, end, record.get("resourceGroup"), record.get("timestamp"))
+        return entries
+
+    def _load_saved_index(self, signature: Tuple[int, int]) -> Optional[Dict[str, IndexEntry]]:
+        if not self.persist_index:
+            return None
+        try:
+            with open(self.index_path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("version") != INDEX_VERSION or tuple(saved.get("signature", ())) != signature:
+            return None
+        return {name: tuple(entry) for name, entry in saved["entries"].items()}
+
+    def _save_index(self, signature: Tuple[int, int], entries: Dict[str, IndexEntry]) -> None:
+        if not self.persist_index:
+            return
+        tmp_path = self.index_path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"version": INDEX_VERSION, "signature": list(signature), "entries": entries}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"couldn't save metrics index to {self.index_path}: {e}")
+
+
+def _scan_json_object(data) -> Iterator[Tuple[str, int, int]]:
+    """ Yield (key, start, end) for every object or array value of a top-level JSON object."""
+    depth = 0
+    key = None
+    expecting_value = False
+    value_start = None
+
+    for match in _TOKEN.finditer(data):
+        token = match.group()
+        char = token[:1]
+        if char == b'"':
+            if depth == 1:
+                if expecting_value:
+                    # Scalar string value, not a record
+                    expecting_value = False
+                else:
+                    key = json.loads(token)
+        elif char == b":":
+            if depth == 1:
+                expecting_value = True
+        elif char == b",":
+            if depth == 1:
+                expecting_value = False
+                key = None
+        elif char in b"{[":
+            if depth == 1 and expecting_value:
+                value_start = match.start()
+                expecting_value = False
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1 and value_start is not None:
+                yield key, value_start, match.end()
+                value_start = None
+                key = None
+
+
+def _scan_json_lines(data) -> Iterator[Tuple[str, int, int]]:
+    """ Yield (vm name, start, end) for every record of a JSON Lines file."""
+    start = 0
+    size = len(data)
+    while start < size:
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = size
+        line = data[start:end].strip()
+        if line:
+            record = json.loads(line)
+            name = record.get("name") or record.get("vmName")
+            if name:
+                yield name, start, end
+        start = end + 1
+
+
+_store: Optional[VMMetricsStore] = None
+
+
+def get_metrics_store() -> VMMetricsStore:
+    """ Return the process-wide metrics store for VM_METRICS_PATH."""
+    global _store
+    if _store is None:
+        _store = VMMetricsStore()
+    return _store
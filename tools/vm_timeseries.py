@@ -0,0 +1,341 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Columnar, NumPy-backed time-series store for VM metrics.
+#
+# Samples are kept as parallel arrays (VM code, epoch seconds, one float
+# column per metric) that grow by doubling, so appending a batch is amortised
+# O(batch). Queries select a window with boolean masks, then sort once by
+# (VM, value) or (VM, time) and read every group's percentiles, max and
+# first/last sample straight from the group offsets. No query loops over rows
+# in Python, which keeps fleet-wide aggregates cheap on millions of samples.
+#
+# NumPy is imported by the functions that use it rather than at import: the
+# metric tools import this module, and most turns never touch metrics.
+#
+# The hosts keep appending followed samples for the life of the process, so
+# the store is bounded: samples more than VM_TIMESERIES_RETENTION_HOURS older
+# than the newest one are dropped, and past VM_TIMESERIES_MAX_SAMPLES the
+# oldest samples go first. Both are checked when the arrays are full, before
+# they grow. 0 turns either bound off.
+
+METRICS = ("iops", "cpuPercentage", "memoryUsedMB", "networkInKB", "networkOutKB")
+
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+VM_TIMESERIES_RETENTION_HOURS = float(os.getenv("VM_TIMESERIES_RETENTION_HOURS", str(7 * 24)))
+VM_TIMESERIES_MAX_SAMPLES = int(os.getenv("VM_TIMESERIES_MAX_SAMPLES", "2000000"))
+
+# Trimming to the sample cap goes this far below it, so the next batches
+# don't have to trim again right away
+TRIM_TO_FRACTION = 0.9
+
+
+class VMTimeSeriesStore:
+    def __init__(
+        self,
+        metrics: Sequence[str] = METRICS,
+        initial_capacity: int = 1024,
+        retention_hours: float = VM_TIMESERIES_RETENTION_HOURS,
+        max_samples: int = VM_TIMESERIES_MAX_SAMPLES,
+    ):
+        import numpy as np
+
+        self.metrics = list(metrics)
+        self.retention_seconds = int(retention_hours * 3600) if retention_hours > 0 else None
+        self.max_samples = max_samples if max_samples > 0 else None
+        self.dropped = 0
+        self._columns = {metric: index for index, metric in enumerate(self.metrics)}
+        self._lock = threading.Lock()
+        self._vm_codes: Dict[str, int] = {}
+        self._vm_names: List[str] = []
+        self._resource_groups: List[Optional[str]] = []
+        self._size = 0
+        self._vm = np.empty(initial_capacity, dtype=np.int32)
+        self._ts = np.empty(initial_capacity, dtype=np.int64)
+        self._values = np.empty((initial_capacity, len(self.metrics)), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vm_names(self) -> List[str]:
+        return list(self._vm_names)
+
+    def append(
+        self,
+        vm_names: Sequence[str],
+        timestamps: Sequence[Any],
+        values: Dict[str, Sequence[float]],
+        resource_groups: Optional[Sequence[Optional[str]]] = None,
+    ) -> None:
+        """ Append a columnar batch of samples. Missing metrics are stored as NaN."""
+        import numpy as np
+
+        count = len(vm_names)
+        if count == 0:
+            return
+        timestamps = _to_epoch_seconds(timestamps)
+
+        with self._lock:
+            codes = np.fromiter(
+                (self._code(name, resource_groups[i] if resource_groups else None) for i, name in enumerate(vm_names)),
+                dtype=np.int32,
+                count=count,
+            )
+            self._reserve(count)
+            end = self._size + count
+            self._vm[self._size:end] = codes
+            self._ts[self._size:end] = timestamps
+            self._values[self._size:end] = np.nan
+            for metric, column in values.items():
+                if metric in self._columns:
+                    self._values[self._size:end, self._columns[metric]] = np.asarray(column, dtype=np.float64)
+            self._size = end
+
+    def append_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """ Append metric records shaped like the entries of data/vm_data.json (plus a "name" key)."""
+        import numpy as np
+
+        names, timestamps, resource_groups = [], [], []
+        columns: Dict[str, List[float]] = {metric: [] for metric in self.metrics}
+        for record in records:
+            names.append(record["name"])
+            timestamps.append(record["timestamp"])
+            resource_groups.append(record.get("resourceGroup"))
+            metrics = record.get("metrics") or {}
+            for metric, column in columns.items():
+                value = metrics.get(metric)
+                column.append(np.nan if value is None else value)
+
+        self.append(names, timestamps, columns, resource_groups)
+        return len(names)
+
+    def aggregate(
+        self,
+        metric: str,
+        window_seconds: Optional[int] = None,
+        vm_names: Optional[Sequence[str]] = None,
+        resource_group: Optional[str] = None,
+        percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    ) -> Dict[str, Any]:
+        """ Per-VM count, mean, percentiles, max and rate of change (per hour) over a window."""
+        import numpy as np
+
+        vm, ts, values = self._select(metric, window_seconds, vm_names, resource_group)
+        columns = ["vm_name", "samples", "mean"] + [f"p{p:g}" for p in percentiles] + ["max", "rate_per_hour"]
+        if vm.size == 0:
+            return {"metric": metric, "columns": columns, "rows": []}
+
+        # Group by VM with the values sorted inside each group
+        order = np.lexsort((values, vm))
+        vm_sorted, values_sorted = vm[order], values[order]
+        codes, starts, counts = np.unique(vm_sorted, return_index=True, return_counts=True)
+
+        mean = np.add.reduceat(values_sorted, starts) / counts
+        quantiles = [_group_quantile(values_sorted, starts, counts, p / 100.0) for p in percentiles]
+        maximum = values_sorted[starts + counts - 1]
+
+        # Group by VM ordered by time for the first/last sample of each group
+        order = np.lexsort((ts, vm))
+        ts_sorted, values_by_time = ts[order], values[order]
+        last = starts + counts - 1
+        elapsed = (ts_sorted[last] - ts_sorted[starts]).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(elapsed > 0, (values_by_time[last] - values_by_time[starts]) / elapsed * 3600.0, np.nan)
+
+        table = np.column_stack([counts, mean, *quantiles, maximum, rate])
+        rows = [[self._vm_names[code]] + _round_row(row) for code, row in zip(codes.tolist(), table.tolist())]
+        return {"metric": metric, "columns": columns, "rows": rows}
+
+    def threshold_breaches(
+        self,
+        metric: str,
+        threshold: float,
+        window_seconds: Optional[int] = None,
+        min_fraction: float = 0.0,
+        below: bool = False,
+        vm_names: Optional[Sequence[str]] = None,
+        resource_group: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """ VMs whose samples cross a threshold, with breach count, fraction of samples and worst value."""
+        import numpy as np
+
+        vm, _, values = self._select(metric, window_seconds, vm_names, resource_group)
+        columns = ["vm_name", "breaches", "samples", "fraction", "worst"]
+        if vm.size == 0:
+            return {"metric": metric, "threshold": threshold, "columns": columns, "rows": []}
+
+        breached = values < threshold if below else values > threshold
+        groups = len(self._vm_names)
+        samples = np.bincount(vm, minlength=groups)
+        breaches = np.bincount(vm, weights=breached.astype(np.float64), minlength=groups)
+        worst = np.full(groups, np.inf if below else -np.inf)
+        (np.minimum if below else np.maximum).at(worst, vm, values)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = breaches / samples
+        selected = np.flatnonzero((breaches > 0) & (fraction >= min_fraction))
+        selected = selected[np.argsort(-fraction[selected], kind="stable")]
+
+        rows = [
+            [self._vm_names[code], int(breaches[code]), int(samples[code]), round(float(fraction[code]), 3), _round(worst[code])]
+            for code in selected.tolist()
+        ]
+        return {"metric": metric, "threshold": threshold, "columns": columns, "rows": rows}
+
+    def _select(self, metric, window_seconds, vm_names, resource_group):
+        import numpy as np
+
+        if metric not in self._columns:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(self.metrics)}")
+
+        with self._lock:
+            size = self._size
+            vm = self._vm[:size]
+            ts = self._ts[:size]
+            values = self._values[:size, self._columns[metric]]
+
+            mask = ~np.isnan(values)
+            if window_seconds and size:
+                mask &= ts >= ts.max() - window_seconds
+            if vm_names:
+                codes = [self._vm_codes[name] for name in vm_names if name in self._vm_codes]
+                mask &= np.isin(vm, codes)
+            if resource_group:
+                resource_group = resource_group.lower()
+                codes = [code for code, rg in enumerate(self._resource_groups) if rg and rg.lower() == resource_group]
+                mask &= np.isin(vm, codes)
+
+            return vm[mask], ts[mask], values[mask]
+
+    def _code(self, name: str, resource_group: Optional[str]) -> int:
+        code = self._vm_codes.get(name)
+        if code is None:
+            code = self._vm_codes[name] = len(self._vm_names)
+            self._vm_names.append(name)
+            self._resource_groups.append(resource_group)
+        elif resource_group:
+            self._resource_groups[code] = resource_group
+        return code
+
+    def _reserve(self, count: int) -> None:
+        import numpy as np
+
+        if self._size + count <= len(self._vm):
+            return
+        self._trim(count)
+        capacity = len(self._vm)
+        needed = self._size + count
+        # Grow unless trimming left real headroom (or the cap does), else every batch would trim again
+        if needed <= capacity and (needed <= capacity * 3 // 4 or (self.max_samples and capacity >= self.max_samples)):
+            return
+        new_capacity = max(needed, 2 * capacity)
+        if self.max_samples:
+            new_capacity = max(needed, min(new_capacity, self.max_samples))
+        self._vm = np.resize(self._vm, new_capacity)
+        self._ts = np.resize(self._ts, new_capacity)
+        values = np.empty((new_capacity, len(self.metrics)), dtype=np.float64)
+        values[:self._size] = self._values[:self._size]
+        self._values = values
+
+    def _trim(self, incoming: int) -> None:
+        """ Drop the samples outside the retention window, then the oldest ones over the cap."""
+        import numpy as np
+
+        size = self._size
+        if size == 0:
+            return
+        ts = self._ts[:size]
+        keep = np.ones(size, dtype=bool)
+        if self.retention_seconds:
+            keep &= ts >= ts.max() - self.retention_seconds
+        if self.max_samples and int(keep.sum()) + incoming > self.max_samples:
+            target = max(int(self.max_samples * TRIM_TO_FRACTION) - incoming, 0)
+            kept = np.flatnonzero(keep)
+            newest = kept[np.argsort(ts[kept], kind="stable")[len(kept) - target:]] if target else kept[:0]
+            keep[:] = False
+            keep[newest] = True
+
+        remaining = int(keep.sum())
+        if remaining == size:
+            return
+        # Boolean indexing copies, so the compacted samples can be written back in place
+        self._vm[:remaining] = self._vm[:size][keep]
+        self._ts[:remaining] = ts[keep]
+        self._values[:remaining] = self._values[:size][keep]
+        self._size = remaining
+        self.dropped += size - remaining
+
+
+def _group_quantile(values_sorted: "np.ndarray", starts: "np.ndarray", counts: "np.ndarray", q: float) -> "np.ndarray":
+    """ Linear-interpolated quantile of every group of an array sorted within groups."""
+    import numpy as np
+
+    position = starts + (counts - 1) * q
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    weight = position - lower
+    return values_sorted[lower] + (values_sorted[upper] - values_sorted[lower]) * weight
+
+
+def _to_epoch_seconds(timestamps: Sequence[Any]) -> "np.ndarray":
+    import numpy as np
+
+    array = np.asarray(timestamps)
+    if np.issubdtype(array.dtype, np.integer) or np.issubdtype(array.dtype, np.floating):
+        return array.astype(np.int64)
+    if not np.issubdtype(array.dtype, np.datetime64):
+        # numpy only parses naive ISO-8601, the exports are all UTC
+        array = np.char.replace(np.char.replace(array.astype(str), "Z", ""), "+00:00", "")
+        array = array.astype("datetime64[s]")
+    return array.astype("datetime64[s]").astype(np.int64)
+
+
+def _round(value: float):
+    import numpy as np
+
+    return None if not np.isfinite(value) else round(float(value), 2)
+
+
+def _round_row(row: List[float]) -> List[Any]:
+    return [int(row[0])] + [_round(value) for value in row[1:]]
+
+
+_store: Optional[VMTimeSeriesStore] = None
+_store_lock = threading.Lock()
+
+
+def get_timeseries_store(seed: Optional[bool] = None) -> VMTimeSeriesStore:
+    """ Return the process-wide time-series store, seeded from the VM metrics export on first use.
+
+    seed=False creates it empty, for callers that ingest a file themselves.
+    By default the export isn't seeded when it is also the followed file
+    (VM_METRICS_FOLLOW_PATH), whose ingestion would count it a second time.
+    Only the first call decides.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from tools.vm_metrics_store import VM_METRICS_FOLLOW_PATH, get_metrics_store
+
+                store = VMTimeSeriesStore()
+                metrics_store = get_metrics_store()
+                if seed is None:
+                    seed = not VM_METRICS_FOLLOW_PATH or not _same_file(VM_METRICS_FOLLOW_PATH, str(metrics_store.path))
+                if seed:
+                    store.append_records(dict(record, name=name) for name, record in metrics_store.iter_records())
+                _store = store
+    return _store
+
+
+def _same_file(path: str, other: str) -> bool:
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        return os.path.abspath(path) == os.path.abspath(other)
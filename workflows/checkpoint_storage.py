@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from agent_framework import WorkflowCheckpoint
+
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.concurrency import run_blocking
+
+# SQLite checkpoint storage for the workflows.
+#
+# With checkpointing on, the workflow runner saves a checkpoint after every
+# superstep: the executors' state (snapshot_state) and the messages that are
+# still to be delivered. A run that failed or whose process was restarted
+# resumes from its newest checkpoint instead of listing the subscription
+# again. A run whose newest checkpoint has no pending messages has finished.
+#
+# Only the newest WORKFLOW_CHECKPOINT_KEEP checkpoints of an unfinished run
+# are kept, a finished run keeps just its final one, and finished runs are
+# dropped after WORKFLOW_CHECKPOINT_RETENTION_DAYS.
+#
+# An unfinished run is only resumed within
+# WORKFLOW_CHECKPOINT_MAX_RESUME_AGE_HOURS of its last checkpoint. Older runs
+# hold ARM continuation tokens that may have expired and pages listed long
+# ago, so they are deleted and the workflow scans from the start instead.
+# 0 resumes runs of any age.
+
+WORKFLOW_CHECKPOINT_PATH = os.getenv(
+    "WORKFLOW_CHECKPOINT_PATH", str(Path(__file__).resolve().parents[1] / "data" / "workflow_checkpoints.sqlite")
+)
+WORKFLOW_CHECKPOINT_KEEP = int(os.getenv("WORKFLOW_CHECKPOINT_KEEP", "3"))
+WORKFLOW_CHECKPOINT_RETENTION_DAYS = float(os.getenv("WORKFLOW_CHECKPOINT_RETENTION_DAYS", "7"))
+WORKFLOW_CHECKPOINT_MAX_RESUME_AGE_HOURS = float(os.getenv("WORKFLOW_CHECKPOINT_MAX_RESUME_AGE_HOURS", "6"))
+
+
+class SqliteCheckpointStorage:
+    """ CheckpointStorage for agent_framework workflows in a local SQLite file."""
+
+    def __init__(
+        self,
+        path: str = WORKFLOW_CHECKPOINT_PATH,
+        keep: int = WORKFLOW_CHECKPOINT_KEEP,
+        max_resume_age_hours: float = WORKFLOW_CHECKPOINT_MAX_RESUME_AGE_HOURS,
+    ):
+        self.path = path
+        self.keep = keep
+        self.max_resume_age_hours = max_resume_age_hours
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across the blocking pool's threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    checkpoint_id TEXT NOT NULL UNIQUE,
+                    workflow_id TEXT NOT NULL,
+                    iteration INTEGER NOT NULL,
+                    pending_messages INTEGER NOT NULL,
+                    saved_at REAL NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS checkpoints_by_workflow ON checkpoints (workflow_id, seq);
+                """
+            )
+            self._local.connection = connection
+        return connection
+
+    # ---- blocking
+
+    def _save(self, checkpoint: WorkflowCheckpoint) -> str:
+        pending = sum(len(messages) for messages in checkpoint.messages.values())
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoints (checkpoint_id, workflow_id, iteration, pending_messages, saved_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (checkpoint.checkpoint_id, checkpoint.workflow_id, checkpoint.iteration_count, pending, time.time(),
+                 json.dumps(checkpoint.to_dict())),
+            )
+            # A finished run only needs its final checkpoint, an unfinished one its newest few
+            keep = 1 if pending == 0 else self.keep
+            connection.execute(
+                "DELETE FROM checkpoints WHERE workflow_id = ? AND seq NOT IN "
+                "(SELECT seq FROM checkpoints WHERE workflow_id = ? ORDER BY seq DESC LIMIT ?)",
+                (checkpoint.workflow_id, checkpoint.workflow_id, keep),
+            )
+            connection.execute(
+                "DELETE FROM checkpoints WHERE pending_messages = 0 AND saved_at < ?",
+                (time.time() - WORKFLOW_CHECKPOINT_RETENTION_DAYS * 24 * 60 * 60,),
+            )
+            self._delete_stale_runs(connection)
+        return checkpoint.checkpoint_id
+
+    def _delete_stale_runs(self, connection: sqlite3.Connection) -> int:
+        # Unfinished runs too old to resume, see the module comment
+        if self.max_resume_age_hours <= 0:
+            return 0
+        return connection.execute(
+            "DELETE FROM checkpoints WHERE pending_messages > 0 AND saved_at < ?",
+            (time.time() - self.max_resume_age_hours * 60 * 60,),
+        ).rowcount
+
+    def _unfinished(self) -> List[sqlite3.Row]:
+        connection = self._connection()
+        with connection:
+            stale = self._delete_stale_runs(connection)
+        if stale:
+            print(f"deleted {stale} checkpoints of runs older than {self.max_resume_age_hours}h, they won't be resumed")
+        return connection.execute(
+            "SELECT data FROM checkpoints WHERE seq IN (SELECT MAX(seq) FROM checkpoints GROUP BY workflow_id) "
+            "AND pending_messages > 0 ORDER BY seq DESC"
+        ).fetchall()
+
+    def _load(self, checkpoint_id: str) -> Optional[WorkflowCheckpoint]:
+        row = self._connection().execute("SELECT data FROM checkpoints WHERE checkpoint_id = ?", (checkpoint_id,)).fetchone()
+        return WorkflowCheckpoint.from_dict(json.loads(row["data"])) if row else None
+
+    def _select(self, sql: str, parameters=()) -> List[sqlite3.Row]:
+        return self._connection().execute(sql, parameters).fetchall()
+
+    def _delete(self, checkpoint_id: str) -> bool:
+        connection = self._connection()
+        with connection:
+            return connection.execute("DELETE FROM checkpoints WHERE checkpoint_id = ?", (checkpoint_id,)).rowcount > 0
+
+    # ---- CheckpointStorage
+
+    async def save_checkpoint(self, checkpoint: WorkflowCheckpoint) -> str:
+        return await run_blocking(self._save, checkpoint)
+
+    async def load_checkpoint(self, checkpoint_id: str) -> Optional[WorkflowCheckpoint]:
+        return await run_blocking(self._load, checkpoint_id)
+
+    async def list_checkpoint_ids(self, workflow_id: Optional[str] = None) -> List[str]:
+        if workflow_id is None:
+            rows = await run_blocking(self._select, "SELECT checkpoint_id FROM checkpoints ORDER BY seq")
+        else:
+            rows = await run_blocking(
+                self._select, "SELECT checkpoint_id FROM checkpoints WHERE workflow_id = ? ORDER BY seq", (workflow_id,)
+            )
+        return [row["checkpoint_id"] for row in rows]
+
+    async def list_checkpoints(self, workflow_id: Optional[str] = None) -> List[WorkflowCheckpoint]:
+        if workflow_id is None:
+            rows = await run_blocking(self._select, "SELECT data FROM checkpoints ORDER BY seq")
+        else:
+            rows = await run_blocking(self._select, "SELECT data FROM checkpoints WHERE workflow_id = ? ORDER BY seq", (workflow_id,))
+        return [WorkflowCheckpoint.from_dict(json.loads(row["data"])) for row in rows]
+
+    async def delete_checkpoint(self, checkpoint_id: str) -> bool:
+        return await run_blocking(self._delete, checkpoint_id)
+
+    # ---- resuming
+
+    async def unfinished_checkpoints(self) -> List[WorkflowCheckpoint]:
+        """ The newest checkpoint of every run that still had messages pending, newest run first.
+
+        Runs older than the maximum resume age are deleted first.
+        """
+        rows = await run_blocking(self._unfinished)
+        return [WorkflowCheckpoint.from_dict(json.loads(row["data"])) for row in rows]
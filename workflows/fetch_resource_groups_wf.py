@@ -1,9 +1,15 @@
 import asyncio
 import json 
+import os
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
 
-from typing import Dict, List 
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set 
 
 from agent_framework import (
+    CheckpointStorage,
     Executor,
     Workflow, 
     WorkflowBuilder, 
@@ -11,9 +17,79 @@ from agent_framework import (
     handler,
     WorkflowEvent,
 )
+from typing_extensions import Never
 
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.azure_clients import close_clients, get_compute_client, get_resource_client
+from tools.get_cloud_resources import fetch_resources_in_resource_group
+from tools.get_virtual_machine_context import fetch_virtual_machine_statuses
+from workflows.checkpoint_storage import SqliteCheckpointStorage
+
+# The resource groups stream through the workflow one ARM page at a time.
+# Messages only reach the next executors when a superstep ends, so the
+# fetcher reads a single page per superstep, sends it on as a
+# ResourceGroupBatch and sends itself a ResourceGroupPage with the
+# continuation token. While it reads the next page, the executors downstream
+# already work on the previous one, and the first results show up after one
+# page instead of after the whole subscription.
+#
+# Besides the locations, every batch is fanned out over a fixed pool of
+# ResourceGroupWorker executors. Every worker receives the batch, takes its
+# share (every n-th group of the listing) and works through it, all workers
+# run concurrently. The fan-in edge waits until each worker has sent its
+# reports, so every worker answers each batch exactly once, with an empty
+# list if its share is empty. ResourceGroupAggregator keeps running totals
+# and yields the merged table after the last batch.
+#
+# The pool size bounds the ARM calls in flight, wall time is roughly the
+# slowest share instead of the sum over all resource groups.
+#
+# With a checkpoint storage (see checkpoint_storage.py) the run is saved
+# after every superstep: the extractor's and aggregator's running state
+# (snapshot_state / restore_state) and the pending pages and batches. A
+# listing error then fails the run instead of closing it early, and
+# fetch_resource_groups_workflow resumes the subscription's unfinished run
+# from its newest checkpoint, at the page it stopped at.
+
+WORKFLOW_FANOUT_WORKERS = int(os.getenv("WORKFLOW_FANOUT_WORKERS", "16"))
+# Every page takes a superstep, the framework's default of 100 would cap a
+# subscription at 100 pages
+WORKFLOW_MAX_SUPERSTEPS = int(os.getenv("WORKFLOW_MAX_SUPERSTEPS", "1000"))
+
+VIRTUAL_MACHINE_TYPE = "microsoft.compute/virtualmachines"
+# Shared state key holding the subscription a run lists, to find its checkpoints
+RESOURCE_GROUP_SCAN_KEY = "resource_group_scan"
+
+
+@dataclass
+class ResourceGroupPage:
+    """ Where the fetcher continues listing (sent to itself)."""
+    subscription_id: str
+    continuation_token: Optional[str] = None
+    page: int = 1
+    offset: int = 0
+
+
+@dataclass
+class ResourceGroupBatch:
+    """ One page of resource groups. offset is the position of its first group in the whole listing."""
+    subscription_id: str
+    resource_groups: List[Dict[str, str]]
+    page: int
+    offset: int
+    last: bool
+    error: Optional[str] = None
+
+
+@dataclass
+class ResourceGroupReports:
+    """ A worker's reports on its share of one batch."""
+    page: int
+    last: bool
+    reports: List[Dict[str, Any]]
+    error: Optional[str] = None
 
 
 class CustomEvent(WorkflowEvent):
@@ -21,14 +97,14 @@ class CustomEvent(WorkflowEvent):
         super().__init__(message)
 
 class ResourceGroupFetcher(Executor):
-    def __init__(self, id:str):
+    def __init__(self, id:str, fail_on_error: bool = False):
         super().__init__(id=id)
+        self.fail_on_error = fail_on_error
 
     @handler 
-    async def __call__(self, subscription_id: str, ctx: WorkflowContext[List[Dict[str,str]]]) -> None: 
+    async def __call__(self, subscription_id: str, ctx: WorkflowContext[ResourceGroupBatch | ResourceGroupPage]) -> None: 
         """ List all resource groups based on subscription ID"""
         print(subscription_id)
-        credential = DefaultAzureCredential()
 
         try:
             data = json.loads(subscription_id)
@@ -37,85 +113,245 @@ class ResourceGroupFetcher(Executor):
         except Exception as e: 
             print(f"couldn't use json because: {e}")
 
-        try:
-            await ctx.add_event(CustomEvent(f"Starting to fetch resource groups for subscription: {subscription_id}"))
-            print("try block")
-            resource_group_list = []
-            resource_client = ResourceManagementClient(credential=credential, subscription_id=subscription_id)
-
-            print(resource_client)
-
-            for resource_group in resource_client.resource_groups.list():
-                resource_group_list.append({
-                    "id": resource_group.id, 
-                    "name": resource_group.name, 
-                    "location": resource_group.location
-                })
-
-            await ctx.add_event(CustomEvent(f"Found {len(resource_group_list)} resource groups"))
-            await ctx.send_message(resource_group_list)
+        await ctx.add_event(CustomEvent(f"Starting to fetch resource groups for subscription: {subscription_id}"))
+        await ctx.set_shared_state(RESOURCE_GROUP_SCAN_KEY, subscription_id)
+        await self.next_page(ResourceGroupPage(subscription_id=subscription_id), ctx)
 
+    @handler
+    async def next_page(self, page: ResourceGroupPage, ctx: WorkflowContext[ResourceGroupBatch | ResourceGroupPage]) -> None:
+        """ Fetch one page of resource groups, send it on and continue with the next page in the next superstep"""
+        try:
+            resource_client = get_resource_client(page.subscription_id)
+            pages = resource_client.resource_groups.list().by_page(continuation_token=page.continuation_token)
+            resource_group_list = [
+                {"id": resource_group.id, "name": resource_group.name, "location": resource_group.location}
+                async for resource_group in await pages.__anext__()
+            ]
+            continuation_token = pages.continuation_token
         except Exception as e:
             await ctx.add_event(CustomEvent(f"Error fetching resource groups: {e}"))
             print(f"something went wrong: {e}")
+            if self.fail_on_error:
+                # The run can be resumed from the last checkpoint, at this page
+                raise
+            # Close the listing so the executors downstream still finish with what they have
+            await ctx.send_message(ResourceGroupBatch(page.subscription_id, [], page.page, page.offset, last=True, error=str(e)))
+            return
+
+        last = continuation_token is None
+        await ctx.send_message(ResourceGroupBatch(page.subscription_id, resource_group_list, page.page, page.offset, last))
+        total = page.offset + len(resource_group_list)
+        if last:
+            await ctx.add_event(CustomEvent(f"Found {total} resource groups"))
+        else:
+            await ctx.add_event(CustomEvent(f"Page {page.page}: {len(resource_group_list)} resource groups, {total} so far"))
+            await ctx.send_message(
+                ResourceGroupPage(page.subscription_id, continuation_token, page.page + 1, total), target_id=self.id
+            )
 
 class LocationExtractor(Executor):
     def __init__(self, id:str):
         super().__init__(id=id)
+        self.locations: Set[str] = set()
         
     @handler
-    async def __call__(self, resource_groups: List[Dict[str, str]], ctx: WorkflowContext[list]) -> None: 
+    async def __call__(self, batch: ResourceGroupBatch, ctx: WorkflowContext[list]) -> None: 
         try:
-            await ctx.add_event(CustomEvent(f"Processing {len(resource_groups)} resource groups for location extraction"))
-            location_list = []
-            for rg in resource_groups:
-                location = rg.get("location")
-                if location:
-                    location_list.append(location)
+            if batch.offset == 0:
+                # First page of a new run
+                self.locations = set()
+            new_locations = {rg["location"] for rg in batch.resource_groups if rg.get("location")} - self.locations
+            self.locations |= new_locations
+            if new_locations:
+                await ctx.add_event(CustomEvent(f"New locations on page {batch.page}: {', '.join(sorted(new_locations))}"))
 
-            await ctx.add_event(CustomEvent(f"Extracted {len(location_list)} unique locations"))
-            await ctx.yield_output(location_list)
-            await ctx.send_message(location_list)
+            if batch.last:
+                location_list = sorted(self.locations)
+                await ctx.add_event(CustomEvent(f"Extracted {len(location_list)} unique locations"))
+                await ctx.yield_output(location_list)
 
         except Exception as e:
             await ctx.add_event(CustomEvent(f"Error extracting locations: {e}"))
             print(f"Something went wrong in location extract: {e}")
 
+    def snapshot_state(self) -> Dict[str, Any]:
+        return {"locations": sorted(self.locations)}
 
-def create_resource_group_flow() -> Workflow: 
-    fetch_rgs = ResourceGroupFetcher(id="fetch_resource_groups")
-    fetch_locations = LocationExtractor(id="fetch_resource_group_locations")
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        self.locations = set(state.get("locations", []))
 
-    workflow = (WorkflowBuilder(
-        name="Resource group fetching workflow",
-        description="This workflow fetches all of the resourcegroups in a subscription"
-    )
-    .set_start_executor(fetch_rgs)
-    .add_edge(fetch_rgs, fetch_locations)
-    .build()
-    )
 
-    return workflow 
+async def summarize_resource_group(resource_group: Dict[str, str]) -> Dict[str, Any]:
+    """ Resource counts per type and VM power states of one resource group."""
+    subscription_id = resource_group["id"].split("/")[2]
+    resources = await fetch_resources_in_resource_group(subscription_id, resource_group["name"])
+
+    types: Dict[str, int] = {}
+    for resource in resources:
+        types[resource["type"].lower()] = types.get(resource["type"].lower(), 0) + 1
 
+    power_states: Dict[str, int] = {}
+    if types.get(VIRTUAL_MACHINE_TYPE):
+        statuses, _ = await fetch_virtual_machine_statuses(get_compute_client(subscription_id), resource_group["name"])
+        for status in statuses:
+            power_states[status["power_state"]] = power_states.get(status["power_state"], 0) + 1
 
-async def fetch_resource_groups_workflow():
+    return {"resources": len(resources), "types": types, "power_states": power_states}
 
-    fetch_rgs = ResourceGroupFetcher(id="fetch_resource_groups")
+
+class ResourceGroupWorker(Executor):
+    def __init__(self, id: str, index: int, pool_size: int,
+                 work: Callable[[Dict[str, str]], Awaitable[Dict[str, Any]]] = summarize_resource_group):
+        super().__init__(id=id)
+        self.index = index
+        self.pool_size = pool_size
+        self.work = work
+
+    @handler
+    async def __call__(self, batch: ResourceGroupBatch, ctx: WorkflowContext[ResourceGroupReports]) -> None:
+        """ Run the per resource group work on this worker's share of a batch"""
+        reports = []
+        # Shares are taken over the whole listing, so they stay even across pages
+        first = (self.index - batch.offset) % self.pool_size
+        for resource_group in batch.resource_groups[first::self.pool_size]:
+            started = time.perf_counter()
+            report = {"name": resource_group["name"], "location": resource_group.get("location"), "error": None}
+            try:
+                report.update(await self.work(resource_group))
+            except Exception as e:
+                report["error"] = str(e)
+            report["seconds"] = round(time.perf_counter() - started, 3)
+            reports.append(report)
+
+        # Always answer, the fan-in only fires once every worker has
+        await ctx.send_message(ResourceGroupReports(batch.page, batch.last, reports, batch.error))
+
+
+class ResourceGroupAggregator(Executor):
+    def __init__(self, id: str):
+        super().__init__(id=id)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.types: Dict[str, int] = {}
+        self.power_states: Dict[str, int] = {}
+        self.rows: List[List[Any]] = []
+        self.errors: List[Dict[str, str]] = []
+        self.summarized = 0
+        self.slowest_seconds = 0.0
+
+    def snapshot_state(self) -> Dict[str, Any]:
+        return {"types": self.types, "power_states": self.power_states, "rows": self.rows, "errors": self.errors,
+                "summarized": self.summarized, "slowest_seconds": self.slowest_seconds}
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        self._reset()
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @handler
+    async def __call__(self, worker_reports: List[ResourceGroupReports], ctx: WorkflowContext[Never, Dict[str, Any]]) -> None:
+        """ Merge the workers' reports on a batch into the running totals, yield the table after the last batch"""
+        page = worker_reports[0].page
+        if page == 1:
+            self._reset()
+        reports = [report for batch in worker_reports for report in batch.reports]
+        self.summarized += len(reports)
+        for report in reports:
+            self.slowest_seconds = max(self.slowest_seconds, report["seconds"])
+            if report["error"] is not None:
+                self.errors.append({"resource_group": report["name"], "error": report["error"]})
+                continue
+            for resource_type, count in report["types"].items():
+                self.types[resource_type] = self.types.get(resource_type, 0) + count
+            for power_state, count in report["power_states"].items():
+                self.power_states[power_state] = self.power_states.get(power_state, 0) + count
+            self.rows.append([report["name"], report["location"], report["resources"],
+                              report["power_states"].get("running", 0), sum(report["power_states"].values())])
+        if worker_reports[0].error is not None:
+            self.errors.append({"resource_group": None, "error": f"Listing stopped after page {page}: {worker_reports[0].error}"})
+
+        await ctx.add_event(CustomEvent(f"Page {page}: summarized {len(reports)} resource groups from {len(worker_reports)} workers, {self.summarized} so far"))
+        if not worker_reports[0].last:
+            return
+
+        self.rows.sort(key=lambda row: row[0].lower())
+        await ctx.yield_output({
+            "resource_groups": self.summarized,
+            "resources": sum(row[2] for row in self.rows),
+            "types": dict(sorted(self.types.items(), key=lambda item: -item[1])),
+            "power_states": self.power_states,
+            "columns": ["resource_group", "location", "resources", "vms_running", "vms"],
+            "rows": self.rows,
+            "errors": self.errors,
+            "slowest_seconds": self.slowest_seconds,
+        })
+
+
+def create_resource_group_flow(workers: int = WORKFLOW_FANOUT_WORKERS, checkpoint_storage: Optional[CheckpointStorage] = None) -> Workflow: 
+    # Fan-out and fan-in edge groups need at least two executors
+    workers = max(2, workers)
+    fetch_rgs = ResourceGroupFetcher(id="fetch_resource_groups", fail_on_error=checkpoint_storage is not None)
     fetch_locations = LocationExtractor(id="fetch_resource_group_locations")
+    pool = [ResourceGroupWorker(id=f"resource_group_worker_{i}", index=i, pool_size=workers) for i in range(workers)]
+    aggregate = ResourceGroupAggregator(id="aggregate_resource_group_reports")
 
-    workflow = (WorkflowBuilder(
+    builder = (WorkflowBuilder(
         name="Resource group fetching workflow",
-        description="This workflow fetches all of the resourcegroups in a subscription"
+        description="This workflow fetches all of the resourcegroups in a subscription, with their locations and a resource and VM power state summary per resource group"
     )
     .set_start_executor(fetch_rgs)
     .add_edge(fetch_rgs, fetch_locations)
-    .build()
+    .add_fan_out_edges(fetch_rgs, pool)
+    .add_fan_in_edges(pool, aggregate)
+    .add_edge(fetch_rgs, fetch_rgs)
+    .set_max_iterations(WORKFLOW_MAX_SUPERSTEPS)
     )
+    if checkpoint_storage is not None:
+        builder = builder.with_checkpointing(checkpoint_storage)
 
-    res = await workflow.run(message="0818ef22-4784-4365-8a35-1f03e8c5e27d")
+    return builder.build() 
 
-    print(res.get_outputs())
 
-if __name__ == '__main__':
-    asyncio.run(fetch_resource_groups_workflow())
+async def find_resume_checkpoint(
+    checkpoint_storage: SqliteCheckpointStorage, subscription_id: str, graph_signature: Optional[str] = None
+) -> Optional[str]:
+    """ The newest checkpoint of an unfinished run over this subscription, if there is one.
 
+    With a graph_signature (Workflow.graph_signature_hash), checkpoints saved by
+    a different graph, e.g. another pool size, are passed over: they can't be
+    restored into this workflow. Runs older than the storage's maximum resume
+    age are never returned.
+    """
+    for checkpoint in await checkpoint_storage.unfinished_checkpoints():
+        if checkpoint.shared_state.get(RESOURCE_GROUP_SCAN_KEY) != subscription_id:
+            continue
+        saved_signature = (checkpoint.metadata or {}).get("graph_signature")
+        if graph_signature and saved_signature and saved_signature != graph_signature:
+            print(f"not resuming checkpoint {checkpoint.checkpoint_id}, it was saved by a different workflow graph")
+            continue
+        return checkpoint.checkpoint_id
+    return None
+
+
+async def fetch_resource_groups_workflow(subscription_id: str = "0818ef22-4784-4365-8a35-1f03e8c5e27d", resume: bool = True):
+
+    checkpoint_storage = SqliteCheckpointStorage()
+    workflow = create_resource_group_flow(checkpoint_storage=checkpoint_storage)
+
+    try:
+        checkpoint_id = None
+        if resume:
+            checkpoint_id = await find_resume_checkpoint(checkpoint_storage, subscription_id, workflow.graph_signature_hash)
+        if checkpoint_id is not None:
+            print(f"resuming from checkpoint {checkpoint_id}")
+            res = await workflow.run(checkpoint_id=checkpoint_id)
+        else:
+            res = await workflow.run(message=subscription_id)
+        print(res.get_outputs())
+        return res
+    finally:
+        await close_clients()
+
+if __name__ == '__main__':
+    asyncio.run(fetch_resource_groups_workflow(*sys.argv[1:2]))
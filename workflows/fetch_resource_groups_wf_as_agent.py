@@ -1,35 +1,41 @@
 import asyncio
 import json 
+import sys
+from pathlib import Path
 
-from typing import Dict, List 
+from typing import Optional
 
 from agent_framework import (
-    Executor,
+    CheckpointStorage,
     Workflow, 
     WorkflowBuilder, 
     WorkflowContext, 
     handler,
-    WorkflowEvent,
     ChatMessage
 )
 
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-
+# Add project root to sys.path so 'tools' module can be imported
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.azure_clients import close_clients
+from workflows.fetch_resource_groups_wf import (
+    WORKFLOW_MAX_SUPERSTEPS,
+    CustomEvent,
+    LocationExtractor,
+    ResourceGroupBatch,
+    ResourceGroupPage,
+    ResourceGroupFetcher as PagedResourceGroupFetcher,
+)
 
-class CustomEvent(WorkflowEvent):
-    def __init__(self, message: str):
-        super().__init__(message)
 
-class ResourceGroupFetcher(Executor):
-    def __init__(self, id:str):
-        super().__init__(id=id)
+class ResourceGroupFetcher(PagedResourceGroupFetcher):
+    def __init__(self, id:str, fail_on_error: bool = False):
+        super().__init__(id=id, fail_on_error=fail_on_error)
 
     @handler 
-    async def __call__(self, input: list[ChatMessage], ctx: WorkflowContext[List[Dict[str,str]]]) -> None: 
-        """ List all resource groups based on subscription ID"""
+    async def __call__(self, input: list[ChatMessage], ctx: WorkflowContext[ResourceGroupBatch | ResourceGroupPage]) -> None: 
+        """ List all resource groups based on subscription ID, one page per superstep (see fetch_resource_groups_wf.py)"""
         print(input)
-        credential = DefaultAzureCredential()
 
         subscription_id = input[-1].text
 
@@ -40,66 +46,27 @@ class ResourceGroupFetcher(Executor):
         except Exception as e: 
             print(f"couldn't use json because: {e}")
 
-        try:
-            await ctx.add_event(CustomEvent(f"Starting to fetch resource groups for subscription: {subscription_id}"))
-            print("try block")
-            resource_group_list = []
-            resource_client = ResourceManagementClient(credential=credential, subscription_id=subscription_id)
-
-            for resource_group in resource_client.resource_groups.list():
-                resource_group_list.append({
-                    "id": resource_group.id, 
-                    "name": resource_group.name, 
-                    "location": resource_group.location
-                })
-
-            await ctx.send_message(ChatMessage(text=resource_group_list, role="assistant"))
-
-            await ctx.add_event(CustomEvent(f"Found {len(resource_group_list)} resource groups"))
-            await ctx.send_message(resource_group_list)
-
-        except Exception as e:
-            await ctx.add_event(CustomEvent(f"Error fetching resource groups: {e}"))
-            print(f"something went wrong: {e}")
-
-class LocationExtractor(Executor):
-    def __init__(self, id:str):
-        super().__init__(id=id)
-        
-    @handler
-    async def __call__(self, resource_groups: List[Dict[str, str]], ctx: WorkflowContext[list]) -> None: 
-        try:
-            await ctx.add_event(CustomEvent(f"Processing {len(resource_groups)} resource groups for location extraction"))
-            location_list = []
-            for rg in resource_groups:
-                location = rg.get("location")
-                if location:
-                    location_list.append(location)
-
-            await ctx.add_event(CustomEvent(f"Extracted {len(location_list)} unique locations"))
-            print(location_list)
-            await ctx.yield_output(location_list)
-            await ctx.send_message(location_list)
+        await ctx.add_event(CustomEvent(f"Starting to fetch resource groups for subscription: {subscription_id}"))
+        await self.next_page(ResourceGroupPage(subscription_id=subscription_id), ctx)
 
-        except Exception as e:
-            await ctx.add_event(CustomEvent(f"Error extracting locations: {e}"))
-            print(f"Something went wrong in location extract: {e}")
 
-
-def create_resource_group_flow() -> Workflow: 
-    fetch_rgs = ResourceGroupFetcher(id="fetch_resource_groups")
+def create_resource_group_flow(checkpoint_storage: Optional[CheckpointStorage] = None) -> Workflow: 
+    fetch_rgs = ResourceGroupFetcher(id="fetch_resource_groups", fail_on_error=checkpoint_storage is not None)
     fetch_locations = LocationExtractor(id="fetch_resource_group_locations")
 
-    workflow = (WorkflowBuilder(
+    builder = (WorkflowBuilder(
         name="Resource group fetching workflow",
         description="This workflow fetches all of the resourcegroups in a subscription"
     )
     .set_start_executor(fetch_rgs)
     .add_edge(fetch_rgs, fetch_locations)
-    .build()
+    .add_edge(fetch_rgs, fetch_rgs)
+    .set_max_iterations(WORKFLOW_MAX_SUPERSTEPS)
     )
+    if checkpoint_storage is not None:
+        builder = builder.with_checkpointing(checkpoint_storage)
 
-    return workflow 
+    return builder.build() 
 
 
 async def fetch_resource_groups_workflow():
@@ -113,12 +80,16 @@ async def fetch_resource_groups_workflow():
     )
     .set_start_executor(fetch_rgs)
     .add_edge(fetch_rgs, fetch_locations)
+    .add_edge(fetch_rgs, fetch_rgs)
+    .set_max_iterations(WORKFLOW_MAX_SUPERSTEPS)
     .build()
     )
 
-    res = await workflow.run(message="0818ef22-4784-4365-8a35-1f03e8c5e27d")
-
-    print(res.get_outputs())
+    try:
+        res = await workflow.run(message="0818ef22-4784-4365-8a35-1f03e8c5e27d")
+        print(res.get_outputs())
+    finally:
+        await close_clients()
 
 if __name__ == '__main__':
     asyncio.run(fetch_resource_groups_workflow())